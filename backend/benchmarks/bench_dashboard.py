@@ -0,0 +1,138 @@
+"""Benchmark: dashboard stats reads as a learner's history grows
+
+Seeds one learner per history size with that many progress rows spread
+over a year (and the matching daily rollups and user counters, recorded
+through server.record_learning_events), then times the previous dashboard
+stats aggregation over progress against the current
+GET /api/progress/{username}/dashboard, which reads the user document and
+at most ROLLUP_DASHBOARD_DAYS rollups.
+
+Usage (from backend/, needs a local mongod):
+    python benchmarks/bench_dashboard.py --histories 100,1000,10000 --repeat 50
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from load_test import install_fake_llm, percentile  # noqa: E402
+
+
+def legacy_pipeline(username):
+    """Daily series and summary the dashboard computed over progress before rollups"""
+    return [
+        {"$match": {"username": username, "quiz_total": {"$gt": 0}}},
+        {"$project": {
+            "_id": 0,
+            "attempts": 1,
+            "completed": 1,
+            "day": {"$substrCP": [{"$toString": "$timestamp"}, 0, 10]},
+            "percentage": {"$multiply": [{"$divide": ["$quiz_score", "$quiz_total"]}, 100]},
+        }},
+        {"$facet": {
+            "daily": [
+                {"$group": {
+                    "_id": "$day",
+                    "modules": {"$sum": 1},
+                    "passed": {"$sum": {"$cond": ["$completed", 1, 0]}},
+                    "average_percentage": {"$avg": "$percentage"},
+                }},
+                {"$sort": {"_id": 1}},
+            ],
+            "summary": [
+                {"$group": {
+                    "_id": None,
+                    "modules_attempted": {"$sum": 1},
+                    "modules_passed": {"$sum": {"$cond": ["$completed", 1, 0]}},
+                    "total_attempts": {"$sum": "$attempts"},
+                    "average_percentage": {"$avg": "$percentage"},
+                    "best_percentage": {"$max": "$percentage"},
+                }},
+            ],
+        }},
+    ]
+
+
+async def legacy_dashboard(db, username):
+    await db.progress.aggregate(legacy_pipeline(username)).to_list(1)
+    await db.users.find_one({"username": username}, {"_id": 0})
+
+
+async def seed(server, username, history, rng):
+    """history quiz results on distinct modules, each on a random day of the past year"""
+    await server.db.users.insert_one(server.User(username=username).model_dump())
+    now = datetime.now(timezone.utc)
+    rows, events = [], []
+    for _ in range(history):
+        timestamp = now - timedelta(days=rng.randrange(365), minutes=rng.randrange(1440))
+        score = rng.randint(0, 5)
+        passed = score >= 3
+        rows.append({
+            "id": str(uuid.uuid4()), "username": username, "course_id": "bench", "module_id": str(uuid.uuid4()),
+            "quiz_score": score, "quiz_total": 5, "attempts": 1, "completed": passed, "timestamp": timestamp,
+            **({"passed_at": timestamp} if passed else {}),
+        })
+        result = server.grade_quiz(username, [0] * score + [1] * (5 - score), [0] * 5)
+        events.append(server.learning_event(timestamp, rng.uniform(30, 300), result,
+                                            first_attempt=True, first_pass=passed))
+    await server.db.progress.insert_many(rows)
+    await server.record_learning_events(username, events)
+
+
+async def time_calls(call, repeat):
+    await call()
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await call()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+async def run(args):
+    os.environ["MONGO_URL"] = args.mongo_url
+    os.environ["DB_NAME"] = args.db_name
+    install_fake_llm()
+    import server
+
+    rng = random.Random(args.seed)
+    rows = []
+    try:
+        await server.ensure_indexes()
+        for history in args.histories:
+            username = f"learner_{history}"
+            await seed(server, username, history, rng)
+            legacy = await time_calls(lambda: legacy_dashboard(server.db, username), args.repeat)
+            current = await time_calls(lambda: server.get_progress_dashboard(username), args.repeat)
+            rows.append((history, legacy, current))
+    finally:
+        await server.client.drop_database(args.db_name)
+        server.client.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dashboard reads against history size")
+    parser.add_argument("--histories", type=lambda value: [int(part) for part in value.split(",")],
+                        default=[100, 1000, 10000], help="progress rows per learner, comma-separated")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--db-name", default=f"learneye_bench_dashboard_{int(time.time())}")
+    args = parser.parse_args()
+
+    rows = asyncio.run(run(args))
+    print(f"{'history':>8} {'legacy p50 ms':>14} {'legacy p95 ms':>14} {'current p50 ms':>15} {'current p95 ms':>15}")
+    for history, legacy, current in rows:
+        print(f"{history:8} {percentile(legacy, 50):14.2f} {percentile(legacy, 95):14.2f} "
+              f"{percentile(current, 50):15.2f} {percentile(current, 95):15.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Micro-benchmark: JSON extraction from LLM replies
+
+Compares the old fence-splitting parser against extract_json / JSONExtractor
+on a corpus shaped like real course, quiz, simplify and teaching replies,
+including the prose and fence variations that used to cause 500s.
+
+Usage (from backend/):
+    python benchmarks/bench_json_extract.py [--repeat 200]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from load_test import install_fake_llm  # noqa: E402
+
+# server needs these at import time; nothing here touches the database or the LLM
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "learneye_bench_json")
+install_fake_llm()
+
+from server import JSONExtractor, extract_json  # noqa: E402
+
+
+def legacy_parse(response):
+    """The parsing previously copy-pasted into every LLM endpoint"""
+    response_text = response.strip()
+    if "```json" in response_text:
+        response_text = response_text.split("```json")[1].split("```")[0].strip()
+    elif "```" in response_text:
+        response_text = response_text.split("```")[1].split("```")[0].strip()
+    return json.loads(response_text)
+
+
+def payloads():
+    paragraph = (
+        "Variables are like labelled boxes where your program keeps values. "
+        "When you write `x = 5`, Python puts 5 in a box called x; a dict such as "
+        "{\"name\": \"Ada\"} keeps several labelled values together. "
+    ) * 4
+    module = {
+        "title": "Getting Started with Variables",
+        "content": paragraph,
+        "examples": ["age = 30", "name = \"Ada\"", "scores = {\"math\": 90}"],
+        "key_points": ["Variables store values", "Names are case-sensitive", "Use = to assign"],
+    }
+    return {
+        "course": {"modules": [dict(module, title=f"Module {i + 1}") for i in range(5)]},
+        "quiz": {"questions": [
+            {
+                "question": f"What does line {i} of `x = {{}}` create?",
+                "options": ["A dict", "A set", "A list", "A tuple"],
+                "correct_answer": 0,
+            }
+            for i in range(5)
+        ]},
+        "simplify": module,
+        "teaching": {
+            "feedback": "Great effort! You explained \"variables\" clearly.",
+            "quality_score": 8,
+            "suggestions": ["Mention naming rules", "Add an example with {curly} braces"],
+            "can_proceed": True,
+        },
+    }
+
+
+def variants(payload):
+    body = json.dumps(payload, indent=2)
+    return {
+        "bare": body,
+        "fenced_json": f"```json\n{body}\n```",
+        "fenced_plain": f"```\n{body}\n```",
+        "prose_before": f"Here is the JSON you asked for:\n{body}",
+        "prose_after": f"{body}\n\nLet me know if you want changes!",
+        "prose_with_braces": f"Sure, replacing {{placeholders}} with real content:\n```json\n{body}\n```",
+        "unclosed_fence": f"```json\n{body}",
+        "trailing_fence_text": f"```json\n{body}\n``` Hope this helps ```",
+    }
+
+
+def corpus():
+    return [
+        (f"{kind}/{name}", text)
+        for kind, payload in payloads().items()
+        for name, text in variants(payload).items()
+    ]
+
+
+def streamed(text, chunk_size=16):
+    extractor = JSONExtractor()
+    for start in range(0, len(text), chunk_size):
+        if extractor.feed(text[start:start + chunk_size]) is not None:
+            break
+    return extractor.finish()
+
+
+def run(parser, samples, repeat):
+    failures = []
+    for name, text in samples:
+        try:
+            parser(text)
+        except Exception:
+            failures.append(name)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for _, text in samples:
+            try:
+                parser(text)
+            except Exception:
+                pass
+    elapsed = time.perf_counter() - started
+    return {
+        "ok": len(samples) - len(failures),
+        "total": len(samples),
+        "us_per_parse": round(elapsed / (repeat * len(samples)) * 1e6, 2),
+        "failures": failures,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    samples = corpus()
+    results = {
+        "legacy_split": run(legacy_parse, samples, args.repeat),
+        "extract_json": run(extract_json, samples, args.repeat),
+        "streamed_16b_chunks": run(streamed, samples, args.repeat),
+    }
+    for name, result in results.items():
+        print(f"{name:22} {result['ok']:3}/{result['total']} parsed  {result['us_per_parse']:9.2f} us/parse")
+        for failure in result["failures"]:
+            print(f"{'':22} failed: {failure}")
+
+
+if __name__ == "__main__":
+    main()
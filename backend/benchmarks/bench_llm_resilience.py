@@ -0,0 +1,93 @@
+"""Benchmark: LLM calls through the resilience layer against a faulty fake provider
+
+Sends distinct tutor-sized prompts straight through server.ask_llm (no
+database needed) while the fake LlmChat injects errors, hangs and slow
+replies, then reports how many calls succeeded, how many failed fast or
+timed out, their latency percentiles, and the retry/hedge/breaker counters.
+Run with --no-hedge to see what hedging buys on the tail.
+
+Usage (from backend/):
+    python benchmarks/bench_llm_resilience.py --calls 500 --error-rate 0.1 --slow-rate 0.05
+    python benchmarks/bench_llm_resilience.py --hang-rate 0.02 --deadline 5 --no-hedge
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from load_test import FakeLlmChat, FakeLlmConfig, install_fake_llm, percentile  # noqa: E402
+
+
+async def run(args):
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("DB_NAME", "learneye_bench_resilience")
+    os.environ["LLM_DEADLINES"] = f"{args.call_site}={args.deadline}"
+    os.environ["LLM_HEDGE_CALL_SITES"] = "" if args.no_hedge else args.call_site
+    install_fake_llm()
+
+    from fastapi import HTTPException
+    import server
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, outcomes = [], {}
+
+    async def one(index):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await server.ask_llm("You are a friendly tutor.", f"bench_{index}",
+                                     f"Question {index}: what is a variable?", args.call_site)
+                outcome = "ok"
+            except HTTPException as e:
+                outcome = str(e.status_code)
+            latencies.append((time.perf_counter() - started) * 1000)
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(args.calls)))
+    return {
+        "wall_seconds": round(time.perf_counter() - started, 2),
+        "outcomes": outcomes,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "faults": dict(FakeLlmChat.faults),
+        "resilience": server.llm_resilience.snapshot(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exercise LLM retries, hedging and the circuit breaker")
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--call-site", default="tutor")
+    parser.add_argument("--deadline", type=float, default=10.0, help="deadline for the call site, in seconds")
+    parser.add_argument("--no-hedge", action="store_true", help="disable hedged requests")
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-ms", type=float, default=3000.0)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    FakeLlmConfig.latency_ms = args.latency_ms
+    FakeLlmConfig.jitter_ms = args.jitter_ms
+    FakeLlmConfig.error_rate = args.error_rate
+    FakeLlmConfig.hang_rate = args.hang_rate
+    FakeLlmConfig.slow_rate = args.slow_rate
+    FakeLlmConfig.slow_ms = args.slow_ms
+    FakeLlmConfig.seed = args.seed
+    FakeLlmConfig.fault_rng = random.Random(args.seed)
+
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""Benchmark: quiz submission write path under concurrent submissions
+
+Compares the previous five-round-trip find-then-insert sequence with the
+current submit_quiz (single quiz read, a progress upsert, then concurrent
+daily rollup and user stats updates). Every learner submits several times at once, which is
+also what used to create duplicate progress rows, so the duplicate count is
+reported next to the latencies.
+
+Usage (from backend/, needs a local mongod):
+    python benchmarks/bench_quiz_submit.py --learners 200 --burst 4
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from load_test import install_fake_llm, percentile  # noqa: E402
+
+
+async def legacy_submit(db, submission, correct_answers):
+    """The submit_quiz write path before it was reworked around an upsert"""
+    course = await db.courses.find_one({"id": submission.course_id}, {"_id": 0, "id": 1})
+    assert course
+    await db.quizzes.find_one({"module_id": submission.module_id}, {"_id": 0, "questions": 1})
+    score = sum(1 for given, expected in zip(submission.answers, correct_answers) if given == expected)
+    passed = score / len(correct_answers) >= 0.6
+    await db.users.find_one({"username": submission.username}, {"_id": 0})
+
+    existing = await db.progress.find_one({"username": submission.username, "module_id": submission.module_id})
+    if existing:
+        await db.progress.update_one(
+            {"username": submission.username, "module_id": submission.module_id},
+            {"$set": {"quiz_score": score, "completed": passed}, "$inc": {"attempts": 1}}
+        )
+    else:
+        await db.progress.insert_one({
+            "id": str(uuid.uuid4()),
+            "username": submission.username,
+            "course_id": submission.course_id,
+            "module_id": submission.module_id,
+            "quiz_score": score,
+            "quiz_total": len(correct_answers),
+            "attempts": 1,
+            "completed": passed,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+        })
+    if passed:
+        await db.users.update_one({"username": submission.username}, {"$inc": {"total_modules_completed": 1}})
+
+
+async def seed(server, learners):
+    db = server.db
+    course_id, module_id = str(uuid.uuid4()), str(uuid.uuid4())
+    correct_answers = [0, 1, 2, 3, 0]
+    await db.courses.insert_one({"id": course_id, "username": "bench", "modules": [{"id": module_id}]})
+    await db.quizzes.insert_one({
+        "module_id": module_id,
+        "course_id": course_id,
+        "questions": [
+            {"id": str(uuid.uuid4()), "question": "?", "options": ["A", "B", "C", "D"], "correct_answer": answer}
+            for answer in correct_answers
+        ],
+    })
+    await db.users.insert_many([{"username": f"learner_{i}", "total_modules_completed": 0} for i in range(learners)])
+    return course_id, module_id, correct_answers
+
+
+async def timed_burst(submit, submissions, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(submission):
+        async with semaphore:
+            started = time.perf_counter()
+            await submit(submission)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(submission) for submission in submissions))
+    return latencies, time.perf_counter() - started
+
+
+async def duplicate_rows(db):
+    groups = await db.progress.aggregate([
+        {"$group": {"_id": {"u": "$username", "m": "$module_id"}, "rows": {"$sum": 1}}},
+        {"$match": {"rows": {"$gt": 1}}},
+    ]).to_list(None)
+    return sum(group["rows"] - 1 for group in groups)
+
+
+async def run(args):
+    os.environ["MONGO_URL"] = args.mongo_url
+    os.environ["DB_NAME"] = args.db_name
+    install_fake_llm()
+    import server
+
+    results = {}
+    try:
+        for variant in ("legacy", "current"):
+            await server.client.drop_database(args.db_name)
+            if variant == "current":
+                await server.ensure_indexes()
+            else:
+                await server.db.progress.create_index([("username", 1), ("module_id", 1)])
+            course_id, module_id, correct_answers = await seed(server, args.learners)
+
+            # Each learner submits `burst` times back to back, interleaved with everyone else
+            submissions = [
+                server.QuizSubmission(
+                    username=f"learner_{i}",
+                    course_id=course_id,
+                    module_id=module_id,
+                    answers=correct_answers,
+                )
+                for _ in range(args.burst)
+                for i in range(args.learners)
+            ]
+            if variant == "legacy":
+                async def submit(submission):
+                    await legacy_submit(server.db, submission, correct_answers)
+            else:
+                submit = server.submit_quiz
+
+            latencies, wall = await timed_burst(submit, submissions, args.concurrency)
+            results[variant] = {
+                "submissions": len(latencies),
+                "throughput_rps": len(latencies) / wall,
+                "p50_ms": percentile(latencies, 50),
+                "p95_ms": percentile(latencies, 95),
+                "p99_ms": percentile(latencies, 99),
+                "duplicate_rows": await duplicate_rows(server.db),
+            }
+    finally:
+        await server.client.drop_database(args.db_name)
+        server.client.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the quiz submission write path")
+    parser.add_argument("--learners", type=int, default=200)
+    parser.add_argument("--burst", type=int, default=4, help="simultaneous submissions per learner")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--db-name", default=f"learneye_bench_submit_{int(time.time())}")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print(f"{'variant':8} {'subs':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'dup rows':>9}")
+    for variant, stats in results.items():
+        print(f"{variant:8} {stats['submissions']:6} {stats['throughput_rps']:8.1f} {stats['p50_ms']:8.2f} "
+              f"{stats['p95_ms']:8.2f} {stats['p99_ms']:8.2f} {stats['duplicate_rows']:9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Micro-benchmark: per-request overhead of the rate-limit middleware
+
+Calls a do-nothing ASGI app directly and through RateLimitMiddleware with a
+JSON body carrying a username (the /api/tutor/ask shape), spread over many
+users and client IPs so requests are allowed, and reports the added latency
+per request. The in-process backend should stay well under a millisecond;
+--mongo adds the shared-state backend, which costs one round trip.
+
+Usage (from backend/):
+    python benchmarks/bench_rate_limit.py [--requests 20000] [--mongo --mongo-url mongodb://localhost:27017]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from load_test import install_fake_llm, percentile  # noqa: E402
+
+ROUTE = ("POST", "/api/tutor/ask")
+
+
+async def noop_app(scope, receive, send):
+    await receive()
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def measure(app, requests, users):
+    latencies, statuses = [], {}
+    for index in range(requests):
+        body = json.dumps({"username": f"user_{index % users}", "course_id": "c", "message": "Why?"}).encode()
+        scope = {
+            "type": "http", "method": ROUTE[0], "path": ROUTE[1], "query_string": b"",
+            "headers": [(b"content-type", b"application/json")],
+            "client": (f"10.0.{index % users // 250}.{index % 250}", 40000),
+        }
+
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                statuses[message["status"]] = statuses.get(message["status"], 0) + 1
+
+        started = time.perf_counter()
+        await app(scope, receive, send)
+        latencies.append((time.perf_counter() - started) * 1e6)
+    return latencies, statuses
+
+
+async def run(args):
+    os.environ["MONGO_URL"] = args.mongo_url
+    os.environ["DB_NAME"] = args.db_name
+    install_fake_llm()
+    import server
+
+    # Generous limits: this measures the cost of the check, not rejections
+    policies = {ROUTE: (1e6, 60.0)}
+    variants = {"no middleware": noop_app}
+    variants["memory"] = server.RateLimitMiddleware(
+        noop_app, server.RateLimiter("memory", server.RATE_LIMIT_MAX_KEYS), policies
+    )
+    if args.mongo:
+        await server.ensure_indexes()
+        variants["mongo"] = server.RateLimitMiddleware(
+            noop_app, server.RateLimiter("mongo", server.RATE_LIMIT_MAX_KEYS), policies
+        )
+
+    rows = []
+    try:
+        for name, app in variants.items():
+            requests = args.requests if name != "mongo" else min(args.requests, args.mongo_requests)
+            latencies, statuses = await measure(app, requests, args.users)
+            rows.append((name, requests, statuses, latencies))
+    finally:
+        if args.mongo:
+            await server.client.drop_database(args.db_name)
+        server.client.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark rate-limit middleware overhead")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--mongo", action="store_true", help="also measure the shared Mongo backend")
+    parser.add_argument("--mongo-requests", type=int, default=2000)
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--db-name", default=f"learneye_bench_ratelimit_{int(time.time())}")
+    args = parser.parse_args()
+
+    rows = asyncio.run(run(args))
+    baseline = percentile(rows[0][3], 50)
+    print(f"{'variant':14} {'reqs':>6} {'p50 us':>8} {'p99 us':>8} {'added p50 us':>13}  statuses")
+    for name, requests, statuses, latencies in rows:
+        p50 = percentile(latencies, 50)
+        print(f"{name:14} {requests:6} {p50:8.1f} {percentile(latencies, 99):8.1f} {p50 - baseline:13.1f}  {statuses}")
+
+
+if __name__ == "__main__":
+    main()
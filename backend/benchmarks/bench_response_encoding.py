@@ -0,0 +1,115 @@
+"""Micro-benchmark: response encoding time for large course and progress payloads
+
+Compares FastAPI's default path for a returned dict (jsonable_encoder, then
+JSONResponse) with returning a FastJSONResponse directly, on payloads shaped
+like GET /api/course/{id} and GET /api/progress/{username} with native
+datetimes. FastJSONResponse uses orjson when it's installed; run once with
+and once without it to see both.
+
+Usage (from backend/):
+    python benchmarks/bench_response_encoding.py [--modules 50] [--records 1000] [--repeat 50]
+"""
+import argparse
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from load_test import install_fake_llm  # noqa: E402
+
+install_fake_llm()
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+import server  # noqa: E402
+
+
+def large_course(modules, paragraph_repeat):
+    paragraph = (
+        "Variables are like labelled boxes where your program keeps values. "
+        "When you write x = 5, Python puts 5 in a box called x and you can reuse it later. "
+    ) * paragraph_repeat
+    return {
+        "id": str(uuid.uuid4()),
+        "username": "bench",
+        "topic": "Python programming",
+        "skill_level": "Beginner",
+        "learning_goal": "Build small scripts",
+        "created_at": datetime.now(timezone.utc),
+        "current_module_index": 0,
+        "completed": False,
+        "version": 3,
+        "modules": [
+            {
+                "id": str(uuid.uuid4()),
+                "title": f"Module {i + 1}",
+                "content": paragraph,
+                "examples": [f"Example {j + 1}: x = {j}" for j in range(3)],
+                "key_points": [f"Key point {j + 1}" for j in range(4)],
+            }
+            for i in range(modules)
+        ],
+    }
+
+
+def progress_payload(records, courses):
+    now = datetime.now(timezone.utc)
+    return {
+        "user": {"username": "bench", "created_at": now, "total_courses": courses, "version": 7},
+        "progress": [
+            {
+                "id": str(uuid.uuid4()),
+                "username": "bench",
+                "course_id": str(uuid.uuid4()),
+                "module_id": str(uuid.uuid4()),
+                "quiz_score": i % 6,
+                "quiz_total": 5,
+                "attempts": 1 + i % 3,
+                "completed": i % 6 >= 3,
+                "timestamp": now - timedelta(minutes=i),
+            }
+            for i in range(records)
+        ],
+        "courses": [
+            {**large_course(0, 0), "modules": [{"id": str(uuid.uuid4()), "title": f"Module {j + 1}"} for j in range(5)]}
+            for _ in range(courses)
+        ],
+    }
+
+
+def time_per_call(fn, repeat):
+    fn()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON response encoding")
+    parser.add_argument("--modules", type=int, default=50, help="modules in the large course")
+    parser.add_argument("--paragraph-repeat", type=int, default=20, help="size multiplier for module content")
+    parser.add_argument("--records", type=int, default=1000, help="progress records in the progress payload")
+    parser.add_argument("--courses", type=int, default=200, help="courses in the progress payload")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    payloads = {
+        "course": large_course(args.modules, args.paragraph_repeat),
+        "progress": progress_payload(args.records, args.courses),
+    }
+    encoder = "orjson" if server.orjson is not None else "stdlib json"
+    print(f"FastJSONResponse encoder: {encoder}\n")
+    print(f"{'payload':10} {'bytes':>10} {'default ms':>11} {'fast ms':>9} {'speedup':>8}")
+    for name, payload in payloads.items():
+        body = server.FastJSONResponse(payload).body
+        default_ms = time_per_call(lambda: JSONResponse(jsonable_encoder(payload)), args.repeat)
+        fast_ms = time_per_call(lambda: server.FastJSONResponse(payload), args.repeat)
+        print(f"{name:10} {len(body):10} {default_ms:11.2f} {fast_ms:9.2f} {default_ms / fast_ms:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Benchmark: offline sync batches vs one /api/quiz/submit call per result
+
+Pushes the same number of quiz results through the API in-process, first
+one request per result and then through /api/sync at several batch sizes,
+and reports items per second for each.
+
+Usage (from backend/, needs a local mongod):
+    python benchmarks/bench_sync.py --items 2000 --batch-sizes 10,100,500
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from load_test import install_fake_llm  # noqa: E402
+from bench_quiz_submit import seed  # noqa: E402
+
+
+def quiz_items(count, learners, course_id, module_id, correct_answers):
+    return [
+        {
+            "type": "quiz",
+            "client_id": str(i),
+            "username": f"learner_{i % learners}",
+            "course_id": course_id,
+            "module_id": module_id,
+            "answers": correct_answers if i % 3 else [0] * len(correct_answers),
+        }
+        for i in range(count)
+    ]
+
+
+async def per_call(client, items, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(item):
+        async with semaphore:
+            body = {key: value for key, value in item.items() if key not in ("type", "client_id")}
+            response = await client.post("/api/quiz/submit", json=body)
+            response.raise_for_status()
+
+    await asyncio.gather(*(one(item) for item in items))
+
+
+async def batched(client, items, batch_size, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(batch):
+        async with semaphore:
+            body = "\n".join(json.dumps(item) for item in batch)
+            response = await client.post("/api/sync", content=body,
+                                         headers={"Content-Type": "application/x-ndjson"})
+            response.raise_for_status()
+            assert response.json()["rejected"] == 0, response.json()
+
+    await asyncio.gather(*(one(items[i:i + batch_size]) for i in range(0, len(items), batch_size)))
+
+
+async def run(args):
+    os.environ["MONGO_URL"] = args.mongo_url
+    os.environ["DB_NAME"] = args.db_name
+    install_fake_llm()
+
+    import httpx
+    import server
+
+    await server.app.router.startup()
+    rows = []
+    try:
+        course_id, module_id, correct_answers = await seed(server, args.learners)
+        items = quiz_items(args.items, args.learners, course_id, module_id, correct_answers)
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            started = time.perf_counter()
+            await per_call(client, items, args.concurrency)
+            rows.append(("per-call", 1, time.perf_counter() - started))
+
+            for batch_size in args.batch_sizes:
+                started = time.perf_counter()
+                await batched(client, items, batch_size, args.concurrency)
+                rows.append(("sync", batch_size, time.perf_counter() - started))
+    finally:
+        await server.client.drop_database(args.db_name)
+        await server.app.router.shutdown()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare batched sync against per-result submissions")
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--learners", type=int, default=100)
+    parser.add_argument("--batch-sizes", default="10,100,500")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--db-name", default=f"learneye_bench_sync_{int(time.time())}")
+    args = parser.parse_args()
+    args.batch_sizes = [int(size) for size in args.batch_sizes.split(",")]
+
+    rows = asyncio.run(run(args))
+    print(f"{'mode':9} {'batch':>6} {'seconds':>8} {'items/s':>9}")
+    for mode, batch_size, seconds in rows:
+        print(f"{mode:9} {batch_size:6} {seconds:8.2f} {args.items / seconds:9.1f}")
+
+
+if __name__ == "__main__":
+    main()
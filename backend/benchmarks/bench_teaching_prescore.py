@@ -0,0 +1,79 @@
+"""Micro-benchmark: local pre-scoring of teaching explanations
+
+Scores a synthetic mix of explanations (too short, copied from the lesson,
+off topic, thorough, and borderline ones) against a generated module and
+reports how many would be settled locally versus sent to the LLM, plus the
+local scoring cost per explanation.
+
+Usage (from backend/):
+    python benchmarks/bench_teaching_prescore.py [--explanations 2000] [--response-scale 3]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from load_test import FakeLlmChat, FakeLlmConfig, install_fake_llm  # noqa: E402
+
+
+def explanation_mix(module, rng):
+    """(kind, explanation) generators, weighted roughly like real submissions"""
+    content_words = module["content"].split()
+    thorough = " ".join(
+        f"In my words, {point.lower()} matters because it connects to the rest of the lesson."
+        for point in module["key_points"]
+    ) + f" For example, {module['examples'][0].lower()}."
+
+    def copied():
+        start = rng.randrange(len(content_words) // 2)
+        return " ".join(content_words[start:start + 40])
+
+    return [
+        (0.15, "too_short", lambda: rng.choice(["idk", "it is about stuff", "variables hold things"])),
+        (0.15, "copied", copied),
+        (0.10, "off_topic", lambda: "Yesterday we went to the beach, swam in the ocean and ate ice cream at sunset."),
+        (0.30, "thorough", lambda: thorough),
+        (0.30, "borderline", lambda: f"{module['title']} is like organising a kitchen, every tool has its place."),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark local teaching pre-scoring")
+    parser.add_argument("--explanations", type=int, default=2000)
+    parser.add_argument("--response-scale", type=int, default=1, help="multiplier for module content size")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("DB_NAME", "learneye_bench_teaching")
+    install_fake_llm()
+    import server
+
+    FakeLlmConfig.response_scale = args.response_scale
+    module = FakeLlmChat()._module("Python Variables")
+    rng = random.Random(args.seed)
+    mix = explanation_mix(module, rng)
+    weights = [weight for weight, _, _ in mix]
+
+    verdicts = Counter()
+    started = time.perf_counter()
+    for _ in range(args.explanations):
+        _, kind, make = rng.choices(mix, weights)[0]
+        verdict = server.teaching_verdict(server.teaching_signals(module, make()))
+        verdicts[(kind, verdict)] += 1
+    elapsed = time.perf_counter() - started
+
+    local = sum(count for (_, verdict), count in verdicts.items() if verdict != "ambiguous")
+    print(f"{'submitted as':12} {'verdict':10} {'count':>6}")
+    for (kind, verdict), count in sorted(verdicts.items()):
+        print(f"{kind:12} {verdict:10} {count:6}")
+    print(f"\nsettled locally: {local}/{args.explanations} ({local / args.explanations:.0%}), "
+          f"{elapsed / args.explanations * 1e6:.0f} µs per explanation")
+
+
+if __name__ == "__main__":
+    main()
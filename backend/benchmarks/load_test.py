@@ -0,0 +1,394 @@
+"""Load test and latency benchmark for the LearnEye API
+
+Runs the FastAPI app in-process against a local Mongo (or an in-memory
+stand-in) and a deterministic fake LlmChat, replays full learner journeys
+(register -> generate course -> quiz -> submit -> teaching -> tutor ->
+progress) and reports throughput plus p50/p95/p99 latency per endpoint.
+Results are written as JSON so runs can be compared across versions.
+
+Usage (from backend/):
+    python benchmarks/load_test.py --users 50 --concurrency 10
+    python benchmarks/load_test.py --in-memory --llm-latency-ms 50
+    python benchmarks/load_test.py --compare results/previous.json
+    python benchmarks/load_test.py --llm-error-rate 0.1 --llm-hang-rate 0.02
+
+--in-memory needs the optional `mongomock-motor` package; otherwise point
+--mongo-url at a local mongod (a throwaway database is created and dropped).
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import time
+import types
+from datetime import datetime, timezone
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+# ===== FAKE LLM =====
+
+class FakeLlmConfig:
+    latency_ms = 200.0
+    jitter_ms = 50.0
+    response_scale = 1
+    seed = 42
+    # Injected faults, as fractions of calls: raise, never answer, or answer slow_ms late
+    error_rate = 0.0
+    hang_rate = 0.0
+    slow_rate = 0.0
+    slow_ms = 5000.0
+    # Separate from the per-prompt reply RNG so a retried prompt doesn't hit the same fault again
+    fault_rng = random.Random(42)
+
+
+class UserMessage:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeLlmChat:
+    """Stand-in for emergentintegrations' LlmChat with canned, well-formed replies"""
+
+    calls = 0
+    faults = {"error": 0, "hang": 0, "slow": 0}
+
+    def __init__(self, api_key=None, session_id=None, system_message=""):
+        self.session_id = session_id
+        self.system_message = system_message
+
+    def with_model(self, provider, model):
+        return self
+
+    async def _upstream_delay(self, text):
+        """Apply injected faults, then return how long this reply takes, in seconds"""
+        FakeLlmChat.calls += 1
+        rng = random.Random(f"{FakeLlmConfig.seed}:{self.system_message}:{text}")
+        delay = max(0.0, FakeLlmConfig.latency_ms + rng.uniform(-1, 1) * FakeLlmConfig.jitter_ms)
+        fault = FakeLlmConfig.fault_rng.random()
+        if fault < FakeLlmConfig.error_rate:
+            FakeLlmChat.faults["error"] += 1
+            await asyncio.sleep(delay / 2000)
+            raise RuntimeError("Injected upstream failure")
+        fault -= FakeLlmConfig.error_rate
+        if fault < FakeLlmConfig.hang_rate:
+            FakeLlmChat.faults["hang"] += 1
+            await asyncio.Event().wait()
+        fault -= FakeLlmConfig.hang_rate
+        if fault < FakeLlmConfig.slow_rate:
+            FakeLlmChat.faults["slow"] += 1
+            delay += FakeLlmConfig.slow_ms
+        return delay / 1000
+
+    async def send_message(self, message):
+        await asyncio.sleep(await self._upstream_delay(message.text))
+        return self._reply(message.text)
+
+    async def stream_message(self, text):
+        """The reply word by word: the first after a fifth of the latency, the rest spread over the remainder"""
+        delay = await self._upstream_delay(text)
+        words = self._reply(text).split(" ")
+        await asyncio.sleep(delay / 5)
+        for index, word in enumerate(words):
+            if index:
+                await asyncio.sleep(delay * 0.8 / len(words))
+            yield word if index == 0 else f" {word}"
+
+    def _module(self, title):
+        paragraph = (
+            f"{title} builds on what you already know. Think of it like organising a kitchen: "
+            "every tool has a place, and once you learn the layout you can cook anything. "
+        ) * (3 * FakeLlmConfig.response_scale)
+        return {
+            "title": title,
+            "content": paragraph,
+            "examples": [f"Example {i + 1} for {title}" for i in range(3)],
+            "key_points": [f"Key point {i + 1} about {title}" for i in range(4)],
+        }
+
+    def _reply(self, text):
+        system = self.system_message
+        if "quiz generator" in system:
+            payload = {"questions": [
+                {
+                    "question": f"Question {i + 1}?",
+                    "options": ["Option A", "Option B", "Option C", "Option D"],
+                    "correct_answer": i % 4,
+                }
+                for i in range(5)
+            ]}
+        elif "planning a personalized learning course" in system:
+            payload = {"titles": [f"Module {i + 1}" for i in range(5)]}
+        elif text.startswith("Write module"):
+            payload = self._module(text.split(".")[0].replace("Write module", "Module").strip())
+        elif "Generate a personalized learning course" in system:
+            payload = {"modules": [self._module(f"Module {i + 1}") for i in range(5)]}
+        elif "simplifying complex topics" in system:
+            payload = self._module("Simplified module")
+        elif "evaluating" in system:
+            payload = {
+                "feedback": "Great effort! You covered the main ideas.",
+                "quality_score": 8,
+                "suggestions": ["Add an example", "Mention the key terms"],
+                "can_proceed": True,
+            }
+        else:
+            return "Think of it step by step: start with what you know, then connect the new idea to it. You've got this!"
+        return f"```json\n{json.dumps(payload)}\n```"
+
+
+async def fake_acompletion(model, messages, stream=False, **kwargs):
+    """Stand-in for litellm.acompletion(stream=True), streaming FakeLlmChat's reply"""
+    chat = FakeLlmChat(system_message=messages[0]["content"])
+
+    async def chunks():
+        async for text in chat.stream_message(messages[-1]["content"]):
+            delta = types.SimpleNamespace(content=text)
+            yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=delta)])
+    return chunks()
+
+
+def install_fake_llm():
+    """Make `from emergentintegrations.llm.chat import LlmChat, UserMessage` and litellm load the fakes"""
+    package = types.ModuleType("emergentintegrations")
+    llm = types.ModuleType("emergentintegrations.llm")
+    chat = types.ModuleType("emergentintegrations.llm.chat")
+    chat.LlmChat = FakeLlmChat
+    chat.UserMessage = UserMessage
+    package.llm = llm
+    llm.chat = chat
+    sys.modules.update({
+        "emergentintegrations": package,
+        "emergentintegrations.llm": llm,
+        "emergentintegrations.llm.chat": chat,
+        "litellm": types.SimpleNamespace(acompletion=fake_acompletion),
+    })
+
+
+# ===== JOURNEYS =====
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+
+    async def call(self, client, label, method, url, **kwargs):
+        started = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.samples.setdefault(label, []).append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            self.errors[label] = self.errors.get(label, 0) + 1
+            return None
+        return response.json()
+
+
+async def learner_journey(client, recorder, index):
+    username = f"bench_user_{index}"
+    await recorder.call(client, "POST /user/register", "POST", "/api/user/register", params={"username": username})
+
+    course = await recorder.call(client, "POST /course/generate", "POST", "/api/course/generate", json={
+        "username": username,
+        "topic": f"Topic {index % 10}",
+        "skill_level": "Beginner",
+    })
+    if not course:
+        return
+    await recorder.call(client, "GET /course/{course_id}", "GET", f"/api/course/{course['id']}")
+
+    module = course["modules"][0]
+    params = {"course_id": course["id"], "module_id": module["id"]}
+    quiz = await recorder.call(client, "POST /quiz/generate", "POST", "/api/quiz/generate", params=params)
+    # Re-opening the quiz should be served from the quiz cache
+    await recorder.call(client, "POST /quiz/generate (repeat)", "POST", "/api/quiz/generate", params=params)
+    if quiz:
+        # The answer key isn't sent to clients; the fake LLM's is i % 4 (see FakeLlmChat._reply)
+        answers = [i % 4 if i % 3 else 0 for i in range(len(quiz["questions"]))]
+        await recorder.call(client, "POST /quiz/submit", "POST", "/api/quiz/submit", json={
+            "username": username,
+            "course_id": course["id"],
+            "module_id": module["id"],
+            "answers": answers,
+        })
+
+    await recorder.call(client, "POST /teaching/submit", "POST", "/api/teaching/submit", json={
+        "username": username,
+        "course_id": course["id"],
+        "module_id": module["id"],
+        # Alternate between one that's settled locally (off topic) and one that needs the LLM
+        "explanation": (
+            "Variables are named boxes that hold values so the program can reuse them later."
+            if index % 2 else
+            f"{module['title']} builds on what I know, like organising a kitchen so every tool has a place."
+        ),
+    })
+    await recorder.call(client, "POST /tutor/ask", "POST", "/api/tutor/ask", json={
+        "username": username,
+        "course_id": course["id"],
+        "module_id": module["id"],
+        "message": "Can you explain this with another example?",
+        "context": "learning",
+    })
+    await recorder.call(client, "GET /progress/{username}", "GET", f"/api/progress/{username}")
+    await recorder.call(client, "GET /progress/{username}/dashboard", "GET", f"/api/progress/{username}/dashboard")
+
+
+# ===== REPORTING =====
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    # Nearest-rank percentile
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize(recorder, wall_seconds):
+    endpoints = {}
+    for label, values in recorder.samples.items():
+        endpoints[label] = {
+            "requests": len(values),
+            "errors": recorder.errors.get(label, 0),
+            "throughput_rps": round(len(values) / wall_seconds, 2),
+            "mean_ms": round(sum(values) / len(values), 2),
+            "p50_ms": round(percentile(values, 50), 2),
+            "p95_ms": round(percentile(values, 95), 2),
+            "p99_ms": round(percentile(values, 99), 2),
+            "max_ms": round(max(values), 2),
+        }
+    total = sum(len(values) for values in recorder.samples.values())
+    return {
+        "wall_seconds": round(wall_seconds, 3),
+        "total_requests": total,
+        "throughput_rps": round(total / wall_seconds, 2),
+        "llm_calls": FakeLlmChat.calls,
+        "llm_faults": dict(FakeLlmChat.faults),
+        "endpoints": endpoints,
+    }
+
+
+def print_report(summary, previous=None):
+    print(f"\n{summary['total_requests']} requests in {summary['wall_seconds']}s "
+          f"({summary['throughput_rps']} req/s), {summary['llm_calls']} LLM calls\n")
+    if any(summary["llm_faults"].values()):
+        faults = ", ".join(f"{count} {kind}" for kind, count in summary["llm_faults"].items())
+        breaker = summary["llm_resilience"]["breaker"]
+        print(f"Injected faults: {faults}; circuit breaker opened {breaker['opened']} times, "
+              f"rejected {breaker['rejected']} calls\n")
+    header = f"{'endpoint':38} {'reqs':>5} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    if previous:
+        header += f" {'p95 vs prev':>12}"
+    print(header)
+    for label, stats in sorted(summary["endpoints"].items()):
+        line = (f"{label:38} {stats['requests']:5} {stats['errors']:4} "
+                f"{stats['p50_ms']:9.2f} {stats['p95_ms']:9.2f} {stats['p99_ms']:9.2f}")
+        before = previous["endpoints"].get(label) if previous else None
+        if before:
+            change = (stats["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100 if before["p95_ms"] else 0
+            line += f" {change:+11.1f}%"
+        print(line)
+
+
+# ===== MAIN =====
+
+async def run(args):
+    os.environ["MONGO_URL"] = args.mongo_url
+    os.environ["DB_NAME"] = args.db_name
+    install_fake_llm()
+
+    import httpx
+    import server
+
+    mongo_client = server.client
+    if args.in_memory:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            sys.exit("--in-memory needs the optional mongomock-motor package (pip install mongomock-motor)")
+        mongo_client = AsyncMongoMockClient()
+        server.db = mongo_client[args.db_name]
+
+    await server.app.router.startup()
+    recorder = Recorder()
+    try:
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def bounded(index):
+                async with semaphore:
+                    await learner_journey(client, recorder, index)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(bounded(index) for index in range(args.users)))
+            wall_seconds = time.perf_counter() - started
+        resilience = server.llm_resilience.snapshot()
+    finally:
+        if not args.keep_db:
+            await mongo_client.drop_database(args.db_name)
+        await server.app.router.shutdown()
+
+    return {**summarize(recorder, wall_seconds), "llm_resilience": resilience}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay learner journeys against the API and report latency")
+    parser.add_argument("--users", type=int, default=20, help="number of learner journeys to replay")
+    parser.add_argument("--concurrency", type=int, default=5, help="journeys running at once")
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--db-name", default=f"learneye_bench_{int(time.time())}")
+    parser.add_argument("--in-memory", action="store_true", help="use mongomock-motor instead of a real mongod")
+    parser.add_argument("--keep-db", action="store_true", help="don't drop the benchmark database afterwards")
+    parser.add_argument("--llm-latency-ms", type=float, default=FakeLlmConfig.latency_ms)
+    parser.add_argument("--llm-jitter-ms", type=float, default=FakeLlmConfig.jitter_ms)
+    parser.add_argument("--response-scale", type=int, default=FakeLlmConfig.response_scale,
+                        help="multiplier for the size of generated module content")
+    parser.add_argument("--seed", type=int, default=FakeLlmConfig.seed)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="fraction of LLM calls that raise")
+    parser.add_argument("--llm-hang-rate", type=float, default=0.0, help="fraction of LLM calls that never return")
+    parser.add_argument("--llm-slow-rate", type=float, default=0.0, help="fraction of LLM calls delayed by --llm-slow-ms")
+    parser.add_argument("--llm-slow-ms", type=float, default=FakeLlmConfig.slow_ms)
+    parser.add_argument("--output", default=str(BACKEND_DIR / "benchmarks" / "results" / "load_test.json"))
+    parser.add_argument("--compare", help="previous results file to compare p95 latency against")
+    args = parser.parse_args()
+
+    FakeLlmConfig.latency_ms = args.llm_latency_ms
+    FakeLlmConfig.jitter_ms = args.llm_jitter_ms
+    FakeLlmConfig.response_scale = args.response_scale
+    FakeLlmConfig.seed = args.seed
+    FakeLlmConfig.error_rate = args.llm_error_rate
+    FakeLlmConfig.hang_rate = args.llm_hang_rate
+    FakeLlmConfig.slow_rate = args.llm_slow_rate
+    FakeLlmConfig.slow_ms = args.llm_slow_ms
+    FakeLlmConfig.fault_rng = random.Random(args.seed)
+
+    summary = asyncio.run(run(args))
+    previous = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print_report(summary, previous)
+
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "users": args.users,
+            "concurrency": args.concurrency,
+            "in_memory": args.in_memory,
+            "llm_latency_ms": args.llm_latency_ms,
+            "llm_jitter_ms": args.llm_jitter_ms,
+            "response_scale": args.response_scale,
+            "seed": args.seed,
+            "llm_error_rate": args.llm_error_rate,
+            "llm_hang_rate": args.llm_hang_rate,
+            "llm_slow_rate": args.llm_slow_rate,
+        },
+        **summary,
+    }, indent=2))
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
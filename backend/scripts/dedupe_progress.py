@@ -0,0 +1,69 @@
+"""Merge duplicate progress rows so (username, module_id) can be made unique
+
+The old find-then-insert quiz submission path could insert two rows for the
+same learner and module when submissions raced. For each duplicated pair this
+keeps the most recent row, sums the attempts of all rows into it and deletes
+the rest. Then it creates the unique index.
+
+Usage (from backend/):
+    python scripts/dedupe_progress.py [--dry-run]
+"""
+import argparse
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+load_dotenv(ROOT_DIR / '.env')
+
+
+async def dedupe(dry_run: bool):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    duplicates = db.progress.aggregate([
+        {"$sort": {"timestamp": -1}},
+        {"$group": {
+            "_id": {"username": "$username", "module_id": "$module_id"},
+            "ids": {"$push": "$_id"},
+            "attempts": {"$sum": "$attempts"},
+            "rows": {"$sum": 1}
+        }},
+        {"$match": {"rows": {"$gt": 1}}}
+    ], allowDiskUse=True)
+
+    groups = removed = 0
+    async for group in duplicates:
+        groups += 1
+        keep, *extra = group['ids']
+        removed += len(extra)
+        if dry_run:
+            continue
+        await db.progress.update_one({"_id": keep}, {"$set": {"attempts": group['attempts']}})
+        await db.progress.delete_many({"_id": {"$in": extra}})
+
+    print(f"{groups} duplicated (username, module_id) pairs, {removed} rows {'to remove' if dry_run else 'removed'}")
+
+    if not dry_run:
+        existing = (await db.progress.index_information()).get("username_1_module_id_1")
+        if existing and not existing.get("unique"):
+            await db.progress.drop_index("username_1_module_id_1")
+        await db.progress.create_index([("username", 1), ("module_id", 1)], unique=True)
+        print("Unique index on progress (username, module_id) is in place")
+
+    client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge duplicate progress rows")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would change")
+    args = parser.parse_args()
+    asyncio.run(dedupe(args.dry_run))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
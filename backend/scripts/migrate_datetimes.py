@@ -0,0 +1,119 @@
+"""Convert ISO-8601 timestamp strings to native BSON datetimes
+
+Older versions stored every datetime as an `.isoformat()` string. The API now
+writes native datetimes and compares them in queries (job leases, dashboard
+page cursors), so existing strings must be converted. Each document is only
+updated if the field still holds the string that was read, so this is safe
+to run against a live database and to re-run.
+
+Usage (from backend/):
+    python scripts/migrate_datetimes.py [--dry-run]
+"""
+import argparse
+import asyncio
+import os
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Top-level datetime fields per collection
+FIELDS = {
+    "users": ["created_at"],
+    "courses": ["created_at"],
+    "progress": ["timestamp", "teaching_submitted_at"],
+    "course_jobs": ["created_at", "updated_at", "lease_expires_at"],
+    "quizzes": ["created_at"],
+    "simplified_modules": ["created_at"],
+    "course_indexes": ["built_at"],
+    "tutor_sessions": ["updated_at"],
+}
+# Datetime fields inside arrays of subdocuments: (array, field)
+ARRAY_FIELDS = {
+    "tutor_sessions": [("messages", "at")],
+}
+BATCH_SIZE = 500
+
+
+def parse_timestamp(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    # Naive values were written from datetime.now(timezone.utc) before the offset was kept
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+async def flush(collection, ops, dry_run):
+    if ops and not dry_run:
+        await collection.bulk_write(ops, ordered=False)
+    ops.clear()
+
+
+async def convert_field(collection, field, dry_run):
+    converted = failed = 0
+    ops = []
+    async for doc in collection.find({field: {"$type": "string"}}, {field: 1}):
+        try:
+            value = parse_timestamp(doc[field])
+        except ValueError:
+            failed += 1
+            continue
+        ops.append(UpdateOne({"_id": doc["_id"], field: doc[field]}, {"$set": {field: value}}))
+        converted += 1
+        if len(ops) >= BATCH_SIZE:
+            await flush(collection, ops, dry_run)
+    await flush(collection, ops, dry_run)
+    return converted, failed
+
+
+async def convert_array_field(collection, array, field, dry_run):
+    converted = failed = 0
+    ops = []
+    async for doc in collection.find({f"{array}.{field}": {"$type": "string"}}, {array: 1}):
+        items = []
+        for item in doc[array]:
+            if isinstance(item.get(field), str):
+                try:
+                    item = {**item, field: parse_timestamp(item[field])}
+                    converted += 1
+                except ValueError:
+                    failed += 1
+            items.append(item)
+        ops.append(UpdateOne({"_id": doc["_id"], array: doc[array]}, {"$set": {array: items}}))
+        if len(ops) >= BATCH_SIZE:
+            await flush(collection, ops, dry_run)
+    await flush(collection, ops, dry_run)
+    return converted, failed
+
+
+async def migrate(dry_run: bool):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    for name, fields in FIELDS.items():
+        for field in fields:
+            converted, failed = await convert_field(db[name], field, dry_run)
+            if converted or failed:
+                print(f"{name}.{field}: {converted} {'to convert' if dry_run else 'converted'}, {failed} unparseable")
+    for name, pairs in ARRAY_FIELDS.items():
+        for array, field in pairs:
+            converted, failed = await convert_array_field(db[name], array, field, dry_run)
+            if converted or failed:
+                print(f"{name}.{array}.{field}: {converted} {'to convert' if dry_run else 'converted'}, {failed} unparseable")
+
+    client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert ISO timestamp strings to native datetimes")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would change")
+    args = parser.parse_args()
+    asyncio.run(migrate(args.dry_run))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
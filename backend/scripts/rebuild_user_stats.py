@@ -0,0 +1,164 @@
+"""Rebuild daily rollups and learner stats from progress history
+
+The API keeps learner stats on user documents (distinct modules attempted
+and passed, quiz counters, streaks, level) and per-day daily_rollups up to
+date on every quiz and teaching write. This recomputes both from the
+progress collection: for learners whose history predates them, or to
+repair drift such as an offline sync for an old day landing after newer
+activity. It also sets passed_at on completed rows that don't have it.
+
+Progress keeps one row per learner and module, so a row's attempts are
+counted on the day of its latest attempt, at its latest score. Time on task
+isn't recorded in progress and is carried over from the existing rollups.
+Events recorded for a learner while their batch is being rebuilt can be
+overwritten, so run it while quiz and teaching traffic is quiet, and after
+scripts/migrate_datetimes.py.
+
+Usage (from backend/):
+    python scripts/rebuild_user_stats.py [--dry-run] [--username NAME] [--batch-size 200]
+"""
+import argparse
+import asyncio
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from pymongo import DeleteMany, ReplaceOne, UpdateMany, UpdateOne
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import server  # noqa: E402
+
+PROGRESS_FIELDS = ("username", "quiz_score", "quiz_total", "attempts", "completed",
+                   "timestamp", "passed_at", "teaching_submitted_at")
+ROLLUP_FIELDS = ("quiz_attempts", "quiz_passes", "percentage_sum", "modules_first_passed",
+                 "teaching_submissions", "time_on_task_seconds")
+
+
+def streaks(days: List[str]) -> Tuple[int, int]:
+    """(run of consecutive days ending on the last one, longest run) for sorted distinct days"""
+    current = longest = 0
+    previous = None
+    for day in map(date.fromisoformat, days):
+        current = current + 1 if previous and day - previous == timedelta(days=1) else 1
+        longest = max(longest, current)
+        previous = day
+    return current, longest
+
+
+def rebuild_learner(rows: List[Dict[str, Any]], time_on_task: Dict[str, float]) -> Tuple[Dict[str, Dict], Dict]:
+    """Daily rollups and user stats for one learner's progress rows"""
+    rollups: Dict[str, Dict[str, float]] = {}
+
+    def rollup(timestamp):
+        return rollups.setdefault(server.activity_day(timestamp), dict.fromkeys(ROLLUP_FIELDS, 0))
+
+    stats = {
+        "modules_attempted": 0, "total_modules_completed": 0, "quiz_attempts": 0,
+        "quiz_percentage_sum": 0.0, "best_percentage": 0.0, "teaching_submissions": 0
+    }
+    for row in rows:
+        if row.get('quiz_total'):
+            attempts = max(row.get('attempts', 0), 1)
+            percentage = row['quiz_score'] / row['quiz_total'] * 100
+            day = rollup(row['timestamp'])
+            day['quiz_attempts'] += attempts
+            day['quiz_passes'] += 1 if row.get('completed') else 0
+            day['percentage_sum'] += percentage * attempts
+            stats['modules_attempted'] += 1
+            stats['quiz_attempts'] += attempts
+            stats['quiz_percentage_sum'] += percentage * attempts
+            stats['best_percentage'] = max(stats['best_percentage'], percentage)
+        passed_at = row.get('passed_at') or (row['timestamp'] if row.get('completed') else None)
+        if passed_at:
+            rollup(passed_at)['modules_first_passed'] += 1
+            stats['total_modules_completed'] += 1
+        if row.get('teaching_submitted_at'):
+            rollup(row['teaching_submitted_at'])['teaching_submissions'] += 1
+            stats['teaching_submissions'] += 1
+
+    for day, seconds in time_on_task.items():
+        rollups.setdefault(day, dict.fromkeys(ROLLUP_FIELDS, 0))['time_on_task_seconds'] = seconds
+    days = sorted(rollups)
+    current_streak, longest_streak = streaks(days)
+    stats.update(
+        time_on_task_seconds=sum(time_on_task.values()),
+        current_streak=current_streak,
+        longest_streak=longest_streak,
+        last_active_day=days[-1] if days else None,
+        level=server.user_level(stats['total_modules_completed'])
+    )
+    return rollups, stats
+
+
+async def learner_batches(cursor, batch_size: int):
+    """Progress rows grouped by learner, batch_size learners at a time (the cursor is sorted by username)"""
+    batch: Dict[str, List[Dict[str, Any]]] = {}
+    async for row in cursor:
+        if row['username'] not in batch and len(batch) >= batch_size:
+            yield batch
+            batch = {}
+        batch.setdefault(row['username'], []).append(row)
+    if batch:
+        yield batch
+
+
+async def rebuild(dry_run: bool, username: str, batch_size: int):
+    db = server.db
+    await db.daily_rollups.create_index([("username", 1), ("day", 1)], unique=True)
+
+    learners = rows = days = 0
+    cursor = db.progress.find(
+        {"username": username} if username else {},
+        {"_id": 0, **dict.fromkeys(PROGRESS_FIELDS, 1)}
+    ).sort("username", 1)
+    async for batch in learner_batches(cursor, batch_size):
+        # Time on task only lives in the rollups, so keep what's there
+        kept = await db.daily_rollups.find(
+            {"username": {"$in": list(batch)}, "time_on_task_seconds": {"$gt": 0}},
+            {"_id": 0, "username": 1, "day": 1, "time_on_task_seconds": 1}
+        ).to_list(None)
+        time_on_task: Dict[str, Dict[str, float]] = {}
+        for doc in kept:
+            time_on_task.setdefault(doc['username'], {})[doc['day']] = doc['time_on_task_seconds']
+
+        progress_ops, rollup_ops, user_ops = [], [], []
+        for name, learner_rows in batch.items():
+            rollups, stats = rebuild_learner(learner_rows, time_on_task.get(name, {}))
+            learners += 1
+            rows += len(learner_rows)
+            days += len(rollups)
+            progress_ops.append(UpdateMany(
+                {"username": name, "completed": True, "passed_at": {"$exists": False}},
+                [{"$set": {"passed_at": "$timestamp"}}]
+            ))
+            rollup_ops.append(DeleteMany({"username": name, "day": {"$nin": list(rollups)}}))
+            rollup_ops.extend(
+                ReplaceOne({"username": name, "day": day}, {"username": name, "day": day, **counts}, upsert=True)
+                for day, counts in rollups.items()
+            )
+            user_ops.append(UpdateOne({"username": name}, {"$set": stats, "$inc": {"version": 1}}))
+        if not dry_run:
+            await asyncio.gather(
+                db.progress.bulk_write(progress_ops, ordered=False),
+                db.daily_rollups.bulk_write(rollup_ops, ordered=True),
+                db.users.bulk_write(user_ops, ordered=False)
+            )
+
+    verb = "would rebuild" if dry_run else "rebuilt"
+    print(f"{learners} learners, {rows} progress rows: {verb} {days} daily rollups and the learners' stats")
+
+    server.client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild daily rollups and learner stats from progress")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would change")
+    parser.add_argument("--username", help="rebuild one learner only")
+    parser.add_argument("--batch-size", type=int, default=200, help="learners per round of bulk writes")
+    args = parser.parse_args()
+    asyncio.run(rebuild(args.dry_run, args.username, args.batch_size))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""Move module bodies out of course documents into module_bodies
+
+Courses created before module bodies were stored separately embed every
+module's content, examples and key points. For each such course this writes
+the bodies to module_bodies (compressed like new ones) and then replaces
+the embedded modules with {id, title} stubs. The course is only rewritten if
+it hasn't changed in the meantime, so it is safe to run against a live
+database and to re-run.
+
+Usage (from backend/):
+    python scripts/split_module_bodies.py [--dry-run] [--batch-size 100]
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+import bson
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import server  # noqa: E402
+
+
+async def migrate(dry_run: bool, batch_size: int):
+    db = server.db
+    await db.module_bodies.create_index("module_id", unique=True)
+    await db.module_bodies.create_index("course_id")
+
+    courses = migrated = skipped = 0
+    bytes_before = bytes_after = 0
+    cursor = db.courses.find({"modules.content": {"$exists": True}}, {"_id": 0}, batch_size=batch_size)
+    async for course in cursor:
+        courses += 1
+        modules = course.get('modules', [])
+        stubs = [server.module_stub(module) if 'content' in module else module for module in modules]
+        bytes_before += len(bson.encode(course))
+        bytes_after += len(bson.encode({**course, "modules": stubs}))
+        if dry_run:
+            continue
+
+        await server.save_module_bodies(course['id'], [module for module in modules if 'content' in module])
+        # Only swap in the stubs if nobody rewrote the course while we were copying its bodies
+        unchanged = {"version": course['version']} if 'version' in course else {"version": {"$exists": False}}
+        result = await db.courses.update_one({"id": course['id'], **unchanged}, {"$set": {"modules": stubs}})
+        if result.modified_count:
+            migrated += 1
+        else:
+            skipped += 1
+
+    verb = "would shrink" if dry_run else "shrank"
+    print(f"{courses} courses with embedded modules, {migrated} migrated, {skipped} changed mid-run (re-run to retry)")
+    if courses:
+        print(f"Course documents {verb} from {bytes_before} to {bytes_after} bytes "
+              f"({100 * (1 - bytes_after / bytes_before):.1f}% smaller)")
+
+    server.client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Split embedded module bodies out of course documents")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would change")
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(migrate(args.dry_run, args.batch_size))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,22 +1,233 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne, ReplaceOne, monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure, PyMongoError
 import os
+import json
+import asyncio
+import re
+import random
+import string
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field, ConfigDict, TypeAdapter, ValidationError
+from typing import List, Optional, Dict, Any, AsyncIterator, Deque, Type, TypeVar, Tuple, Union, Literal, Annotated
 import uuid
-from datetime import datetime, timezone
+import hashlib
+import zlib
+import base64
+import math
+import time
+import threading
+from collections import deque, OrderedDict, Counter
+from urllib.parse import parse_qs
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone, timedelta
 from emergentintegrations.llm.chat import LlmChat, UserMessage
 
+try:
+    import tiktoken
+except ImportError:  # optional; token counts fall back to an estimate
+    tiktoken = None
+
+try:
+    import orjson
+except ImportError:  # optional; large responses fall back to the stdlib encoder
+    orjson = None
+
+try:
+    import litellm
+except ImportError:  # optional; streamed LLM replies fall back to one delta from LlmChat
+    litellm = None
+
+try:
+    import zstandard
+except ImportError:  # optional; module bodies fall back to zlib
+    zstandard = None
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# ===== METRICS =====
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+# Requests slower than this are logged (sampled); 0 disables the slow-request log
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', '2000'))
+SLOW_REQUEST_SAMPLE_RATE = float(os.environ.get('SLOW_REQUEST_SAMPLE_RATE', '1.0'))
+
+class MetricsRegistry:
+    """Counters and histograms rendered in the Prometheus text format
+
+    Updates can come from Motor's worker threads, hence the lock.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._histograms: Dict[Tuple[str, Tuple], List] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+    
+    def counter(self, name: str, help_text: str):
+        self._help[name] = ("counter", help_text)
+    
+    def histogram(self, name: str, help_text: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self._help[name] = ("histogram", help_text)
+        self._buckets[name] = buckets
+    
+    def inc(self, name: str, labels: Dict[str, str], amount: float = 1.0):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + amount
+    
+    def observe(self, name: str, labels: Dict[str, str], value: float):
+        key = (name, tuple(sorted(labels.items())))
+        buckets = self._buckets[name]
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                # Per-bucket counts, then sum and count
+                series = self._histograms[key] = [[0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+    
+    @staticmethod
+    def _labels(pairs) -> str:
+        if not pairs:
+            return ""
+        escaped = (
+            k + '="' + str(v).replace('\\', '\\\\').replace('"', '\\"') + '"'
+            for k, v in pairs
+        )
+        return "{" + ",".join(escaped) + "}"
+    
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, (kind, help_text) in sorted(self._help.items()):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == "counter":
+                    for (metric, pairs), value in sorted(self._counters.items()):
+                        if metric == name:
+                            lines.append(f"{name}{self._labels(pairs)} {value}")
+                    continue
+                buckets = self._buckets[name]
+                for (metric, pairs), (counts, total, count) in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, bucket_count in zip(buckets, counts):
+                        cumulative += bucket_count
+                        lines.append(f"{name}_bucket{self._labels(pairs + (('le', repr(float(bound))),))} {cumulative}")
+                    lines.append(f"{name}_bucket{self._labels(pairs + (('le', '+Inf'),))} {count}")
+                    lines.append(f"{name}_sum{self._labels(pairs)} {total}")
+                    lines.append(f"{name}_count{self._labels(pairs)} {count}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+metrics.histogram("http_request_duration_seconds", "HTTP request latency by route")
+metrics.histogram("llm_call_duration_seconds", "LLM upstream call latency by call site")
+metrics.histogram("llm_time_to_first_token_seconds", "Time from a streamed LLM call starting to its first text chunk by call site")
+metrics.histogram("llm_prompt_chars", "LLM prompt size (system message + user text) by call site", SIZE_BUCKETS)
+metrics.histogram("llm_response_chars", "LLM response size by call site", SIZE_BUCKETS)
+metrics.histogram("llm_prompt_tokens", "LLM prompt tokens (system message + user text) by call site", TOKEN_BUCKETS)
+metrics.histogram("llm_response_tokens", "LLM response tokens by call site", TOKEN_BUCKETS)
+metrics.counter("llm_output_over_budget_total", "LLM responses longer than their call site's output budget")
+metrics.counter("llm_prompt_trimmed_total", "Prompt fields trimmed to their token budget by prompt and field")
+metrics.counter("llm_call_failures_total", "Failed LLM upstream calls by call site")
+metrics.counter("llm_call_retries_total", "LLM attempts retried after a failure by call site")
+metrics.counter("llm_call_timeouts_total", "LLM calls that ran past their call site's deadline")
+metrics.counter("llm_hedged_requests_total", "Hedged second LLM requests by call site and winner")
+metrics.counter("llm_breaker_rejections_total", "LLM calls failed fast by the open circuit breaker by call site")
+metrics.counter("llm_fallbacks_total", "Requests served cached or fallback content while the LLM was unavailable")
+metrics.histogram("llm_queue_wait_seconds", "Time spent waiting for an LLM scheduler slot by priority class")
+metrics.histogram("llm_parse_duration_seconds", "Time to extract and validate JSON from LLM replies by model")
+metrics.counter("llm_parse_failures_total", "LLM replies that failed JSON extraction or validation by model")
+metrics.histogram("mongo_command_duration_seconds", "MongoDB command latency by command and collection")
+metrics.counter("mongo_command_failures_total", "Failed MongoDB commands by command and collection")
+metrics.counter("rate_limit_rejections_total", "Requests rejected with 429 by route and the bucket that ran out")
+metrics.counter("read_cache_requests_total", "Course/user read cache lookups by cache and result")
+metrics.counter("teaching_evaluations_total", "Teaching explanations evaluated locally, by the LLM or by the local fallback, by verdict")
+metrics.counter("course_blueprint_requests_total", "Course generations served from a shared blueprint (hit) or the LLM (miss)")
+metrics.counter("learning_events_total", "Quiz attempts and teaching submissions folded into daily rollups and user stats")
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Time every MongoDB command the driver sends"""
+    
+    def __init__(self):
+        self._collections: Dict[Tuple[Any, int], str] = {}
+    
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        self._collections[(event.connection_id, event.request_id)] = (
+            collection if isinstance(collection, str) else ""
+        )
+    
+    def _labels(self, event) -> Dict[str, str]:
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        return {"command": event.command_name, "collection": collection}
+    
+    def succeeded(self, event):
+        metrics.observe("mongo_command_duration_seconds", self._labels(event), event.duration_micros / 1e6)
+    
+    def failed(self, event):
+        labels = self._labels(event)
+        metrics.observe("mongo_command_duration_seconds", labels, event.duration_micros / 1e6)
+        metrics.inc("mongo_command_failures_total", labels)
+
+class MetricsMiddleware:
+    """Record per-route latency (through the last body chunk) and log sampled slow requests"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        started = time.perf_counter()
+        status = {"code": 500}
+        
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - started
+            route = scope.get("route")
+            labels = {
+                "method": scope["method"],
+                "route": route.path if route is not None else "unmatched",
+                "status": str(status["code"])
+            }
+            metrics.observe("http_request_duration_seconds", labels, duration)
+            if (SLOW_REQUEST_MS and duration * 1000 >= SLOW_REQUEST_MS
+                    and random.random() < SLOW_REQUEST_SAMPLE_RATE):
+                logging.warning(
+                    f"Slow request: {scope['method']} {scope['path']} -> {status['code']} in {duration * 1000:.0f}ms"
+                )
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# tz_aware: stored datetimes come back as UTC-aware datetimes, like the ones we write
+client = AsyncIOMotorClient(mongo_url, tz_aware=True, event_listeners=[MongoCommandMetrics()])
 db = client[os.environ['DB_NAME']]
 
 # Create the main app without a prefix
@@ -28,6 +239,188 @@ api_router = APIRouter(prefix="/api")
 # LLM API Key
 EMERGENT_LLM_KEY = os.environ.get('EMERGENT_LLM_KEY')
 
+# LLM scheduling: classes in priority order, a global concurrency cap and per-class queue limits
+LLM_PRIORITY_CLASSES = ["tutor", "quiz", "teaching", "simplify", "course"]
+# Priority class of each LLM call site
+LLM_CALL_SITES = {
+    "tutor": "tutor",
+    "quiz_gen": "quiz",
+    "teaching": "teaching",
+    "simplify": "simplify",
+    "course_gen": "course",
+    "course_outline": "course",
+    "course_module": "course",
+    # Speculative calls share their class with the request they stand in for,
+    # so a learner who catches up with one can join it without waiting longer
+    "quiz_prewarm": "quiz",
+    "simplify_prewarm": "simplify"
+}
+LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', '8'))
+LLM_QUEUE_LIMIT = int(os.environ.get('LLM_QUEUE_LIMIT', '32'))
+# e.g. LLM_QUEUE_LIMITS="tutor=64,course=8"
+LLM_QUEUE_LIMITS = {
+    name.strip(): int(limit)
+    for name, limit in (
+        item.split('=') for item in os.environ.get('LLM_QUEUE_LIMITS', '').split(',') if '=' in item
+    )
+}
+
+# LLM resilience. Deadlines bound a whole call per call site: queueing, attempts and retry backoff.
+# e.g. LLM_DEADLINES="tutor=20,course_gen=240"
+LLM_DEADLINES = {
+    "tutor": 30.0,
+    "quiz_gen": 60.0,
+    "teaching": 45.0,
+    "simplify": 60.0,
+    "course_gen": 180.0,
+    "course_outline": 30.0,
+    "course_module": 90.0,
+    "quiz_prewarm": 60.0,
+    "simplify_prewarm": 60.0,
+    **{
+        name.strip(): float(seconds)
+        for name, seconds in (
+            item.split('=') for item in os.environ.get('LLM_DEADLINES', '').split(',') if '=' in item
+        )
+    }
+}
+# Failed attempts are retried after a full-jitter exponential backoff, while the deadline allows
+LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', '2'))
+LLM_RETRY_BASE_SECONDS = float(os.environ.get('LLM_RETRY_BASE_SECONDS', '0.5'))
+LLM_RETRY_MAX_SECONDS = float(os.environ.get('LLM_RETRY_MAX_SECONDS', '4'))
+# Call sites that send a second, hedged request once the first is slower than this percentile of recent calls
+LLM_HEDGE_CALL_SITES = {name.strip() for name in os.environ.get('LLM_HEDGE_CALL_SITES', 'tutor').split(',') if name.strip()}
+LLM_HEDGE_PERCENTILE = float(os.environ.get('LLM_HEDGE_PERCENTILE', '95'))
+LLM_HEDGE_MIN_SECONDS = float(os.environ.get('LLM_HEDGE_MIN_SECONDS', '1'))
+# Circuit breaker: consecutive failed attempts that open it, and how long it stays open before a probe
+LLM_BREAKER_FAILURES = int(os.environ.get('LLM_BREAKER_FAILURES', '5'))
+LLM_BREAKER_RESET_SECONDS = float(os.environ.get('LLM_BREAKER_RESET_SECONDS', '30'))
+
+# Token streaming (tutor streams) calls the provider through litellm, which LlmChat uses underneath;
+# Emergent keys are served from the same proxy LlmChat sends them to
+LLM_STREAMING_ENABLED = os.environ.get('LLM_STREAMING_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+LLM_STREAM_MODEL = os.environ.get('LLM_STREAM_MODEL', 'openai/gpt-5.1')
+LLM_STREAM_API_BASE = os.environ.get('LLM_STREAM_API_BASE') or (
+    'https://integrations.emergentagent.com/llm' if (EMERGENT_LLM_KEY or '').startswith('sk-emergent-') else None
+)
+
+# In-process read cache for course and user documents
+READ_CACHE_MAX_ENTRIES = int(os.environ.get('READ_CACHE_MAX_ENTRIES', '2048'))
+READ_CACHE_TTL_SECONDS = float(os.environ.get('READ_CACHE_TTL_SECONDS', '30'))
+
+# Prompt token budgets; counts use tiktoken's TOKEN_ENCODING when available
+TOKEN_ENCODING = os.environ.get('TOKEN_ENCODING', 'o200k_base')
+TOKEN_ENCODING_LOAD_TIMEOUT_SECONDS = float(os.environ.get('TOKEN_ENCODING_LOAD_TIMEOUT_SECONDS', '15'))
+PROMPT_MODULE_CONTENT_TOKENS = int(os.environ.get('PROMPT_MODULE_CONTENT_TOKENS', '1500'))
+PROMPT_EXPLANATION_TOKENS = int(os.environ.get('PROMPT_EXPLANATION_TOKENS', '600'))
+PROMPT_TUTOR_MESSAGE_TOKENS = int(os.environ.get('PROMPT_TUTOR_MESSAGE_TOKENS', '300'))
+PROMPT_TOPIC_TOKENS = int(os.environ.get('PROMPT_TOPIC_TOKENS', '40'))
+PROMPT_GOAL_TOKENS = int(os.environ.get('PROMPT_GOAL_TOKENS', '150'))
+
+# Module bodies live in their own collection; ones at least this large are compressed
+MODULE_BODY_COMPRESSION = os.environ.get('MODULE_BODY_COMPRESSION', 'zstd')  # "zstd", "zlib" or "none"
+MODULE_BODY_COMPRESS_MIN_BYTES = int(os.environ.get('MODULE_BODY_COMPRESS_MIN_BYTES', '1024'))
+
+# Tutor context retrieval: passages per prompt, their token budget and the chunk size they're cut to
+TUTOR_CONTEXT_PASSAGES = int(os.environ.get('TUTOR_CONTEXT_PASSAGES', '3'))
+TUTOR_CONTEXT_TOKENS = int(os.environ.get('TUTOR_CONTEXT_TOKENS', '150'))
+TUTOR_CHUNK_CHARS = int(os.environ.get('TUTOR_CHUNK_CHARS', '320'))
+
+# Tutor conversation memory: exchanges kept verbatim per (user, course), and token budgets
+# for the history block in the prompt and the summary of older exchanges
+TUTOR_HISTORY_TURNS = int(os.environ.get('TUTOR_HISTORY_TURNS', '6'))
+TUTOR_HISTORY_TOKENS = int(os.environ.get('TUTOR_HISTORY_TOKENS', '600'))
+TUTOR_SUMMARY_TOKENS = int(os.environ.get('TUTOR_SUMMARY_TOKENS', '200'))
+
+# Speculative pre-generation of quizzes and simplified modules
+PREWARM_ENABLED = os.environ.get('PREWARM_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+PREWARM_CONCURRENCY = int(os.environ.get('PREWARM_CONCURRENCY', '2'))
+# Cost budget: speculative LLM calls per process per rolling hour
+PREWARM_MAX_CALLS_PER_HOUR = int(os.environ.get('PREWARM_MAX_CALLS_PER_HOUR', '200'))
+# Pre-generate a simpler version of the next module when the course average is below this
+PREWARM_SIMPLIFY_BELOW_PERCENT = float(os.environ.get('PREWARM_SIMPLIFY_BELOW_PERCENT', '70'))
+
+# Shared course blueprints for repeated (topic, skill level, goal) requests: how long one is
+# served before it's regenerated, how many learners it's handed to, and how many are kept (LRU)
+COURSE_BLUEPRINT_CACHE_ENABLED = os.environ.get('COURSE_BLUEPRINT_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+COURSE_BLUEPRINT_TTL_SECONDS = int(os.environ.get('COURSE_BLUEPRINT_TTL_SECONDS', str(7 * 24 * 3600)))
+COURSE_BLUEPRINT_MAX_USES = int(os.environ.get('COURSE_BLUEPRINT_MAX_USES', '200'))
+COURSE_BLUEPRINT_MAX_ENTRIES = int(os.environ.get('COURSE_BLUEPRINT_MAX_ENTRIES', '5000'))
+
+# Local pre-scoring of teaching explanations; only the ambiguous ones are sent to the LLM
+TEACHING_PRESCORE_ENABLED = os.environ.get('TEACHING_PRESCORE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# Explanations shorter than this many words are rejected locally
+TEACHING_MIN_WORDS = int(os.environ.get('TEACHING_MIN_WORDS', '8'))
+# Share of the explanation's word shingles (runs of TEACHING_SHINGLE_SIZE words) found in the module content
+# at which it counts as copied
+TEACHING_COPY_THRESHOLD = float(os.environ.get('TEACHING_COPY_THRESHOLD', '0.6'))
+TEACHING_SHINGLE_SIZE = int(os.environ.get('TEACHING_SHINGLE_SIZE', '5'))
+# Share of the explanation's terms that must come from the module for it to be on topic
+TEACHING_MIN_RELEVANCE = float(os.environ.get('TEACHING_MIN_RELEVANCE', '0.1'))
+# A key point (or example) is covered when this share of its terms appears in the explanation
+TEACHING_KEY_POINT_OVERLAP = float(os.environ.get('TEACHING_KEY_POINT_OVERLAP', '0.5'))
+# Passed locally: at least this share of key points covered in at least this many words
+TEACHING_PASS_COVERAGE = float(os.environ.get('TEACHING_PASS_COVERAGE', '0.75'))
+TEACHING_PASS_MIN_WORDS = int(os.environ.get('TEACHING_PASS_MIN_WORDS', '40'))
+
+# Learner stats: modules passed per level, days of rollups on the dashboard, and the cap on
+# client-reported time spent on one quiz or explanation
+USER_LEVEL_MODULES = int(os.environ.get('USER_LEVEL_MODULES', '5'))
+ROLLUP_DASHBOARD_DAYS = int(os.environ.get('ROLLUP_DASHBOARD_DAYS', '90'))
+ROLLUP_MAX_TIME_ON_TASK_SECONDS = float(os.environ.get('ROLLUP_MAX_TIME_ON_TASK_SECONDS', '3600'))
+
+# Largest batch accepted by the offline sync endpoint, and how many of its learner/module rows
+# take quiz results at once; bodies past SYNC_MAX_ITEMS items of SYNC_MAX_ITEM_BYTES are refused unread
+SYNC_MAX_ITEMS = int(os.environ.get('SYNC_MAX_ITEMS', '500'))
+SYNC_MAX_ITEM_BYTES = int(os.environ.get('SYNC_MAX_ITEM_BYTES', '32768'))
+SYNC_MAX_BODY_BYTES = SYNC_MAX_ITEMS * SYNC_MAX_ITEM_BYTES
+SYNC_QUIZ_WRITE_CONCURRENCY = int(os.environ.get('SYNC_QUIZ_WRITE_CONCURRENCY', '16'))
+
+def parse_rate(value: str) -> Tuple[float, float]:
+    """"capacity/period_seconds" -> (capacity, period_seconds)"""
+    capacity, period = value.split('/')
+    return float(capacity), float(period)
+
+# Rate limits: token buckets per route, refilled at capacity/period, checked per username,
+# per client IP (RATE_LIMIT_IP_MULTIPLIER times the user limit, for shared networks) and
+# globally across all limited routes. "memory" keeps buckets per process; "mongo" shares them.
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')  # "memory" or "mongo"
+# e.g. RATE_LIMITS="POST /api/tutor/ask=60/60,POST /api/course/generate=3/600"
+RATE_LIMITS = {
+    ("POST", "/api/course/generate"): (5.0, 600.0),
+    ("POST", "/api/course/generate/stream"): (5.0, 600.0),
+    ("POST", "/api/course/jobs"): (5.0, 600.0),
+    ("POST", "/api/quiz/generate"): (30.0, 60.0),
+    ("POST", "/api/module/simplify"): (10.0, 60.0),
+    ("POST", "/api/teaching/submit"): (20.0, 60.0),
+    ("POST", "/api/tutor/ask"): (20.0, 60.0),
+    ("POST", "/api/tutor/stream"): (20.0, 60.0),
+    **{
+        tuple(route.strip().split(' ', 1)): parse_rate(rate)
+        for route, rate in (
+            item.rsplit('=', 1) for item in os.environ.get('RATE_LIMITS', '').split(',') if '=' in item
+        )
+    }
+}
+RATE_LIMIT_IP_MULTIPLIER = float(os.environ.get('RATE_LIMIT_IP_MULTIPLIER', '5'))
+# Empty disables the global bucket
+RATE_LIMIT_GLOBAL = os.environ.get('RATE_LIMIT_GLOBAL', '600/60')
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', '100000'))
+# Take the client IP from the first X-Forwarded-For entry (only behind a proxy that sets it)
+RATE_LIMIT_TRUST_FORWARDED_FOR = os.environ.get('RATE_LIMIT_TRUST_FORWARDED_FOR', 'false').lower() in ('1', 'true', 'yes')
+
+# Background course generation workers
+COURSE_JOB_WORKERS = int(os.environ.get('COURSE_JOB_WORKERS', '2'))
+COURSE_JOB_MAX_ATTEMPTS = int(os.environ.get('COURSE_JOB_MAX_ATTEMPTS', '3'))
+COURSE_JOB_LEASE_SECONDS = float(os.environ.get('COURSE_JOB_LEASE_SECONDS', '60'))
+COURSE_JOB_POLL_SECONDS = float(os.environ.get('COURSE_JOB_POLL_SECONDS', '5'))
+# A failed attempt is retried after an exponential backoff from this base, capped at the max
+COURSE_JOB_RETRY_BASE_SECONDS = float(os.environ.get('COURSE_JOB_RETRY_BASE_SECONDS', '10'))
+COURSE_JOB_RETRY_MAX_SECONDS = float(os.environ.get('COURSE_JOB_RETRY_MAX_SECONDS', '300'))
+course_job_wakeup = asyncio.Event()
+course_job_workers: List[asyncio.Task] = []
+
 # ===== MODELS =====
 
 class User(BaseModel):
@@ -35,11 +428,20 @@ class User(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     username: str
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    total_modules_completed: int = 0
-    current_streak: int = 0
+    total_modules_completed: int = 0  # distinct modules passed
+    current_streak: int = 0  # consecutive UTC days with a quiz or explanation
+    longest_streak: int = 0
+    last_active_day: Optional[str] = None  # "YYYY-MM-DD", UTC
+    modules_attempted: int = 0
+    quiz_attempts: int = 0
+    quiz_percentage_sum: float = 0.0
+    best_percentage: float = 0.0
+    teaching_submissions: int = 0
+    time_on_task_seconds: float = 0.0
     total_courses: int = 0
     level: int = 1
     badges: List[str] = []
+    version: int = 1
 
 class CourseRequest(BaseModel):
     username: str
@@ -54,16 +456,39 @@ class Module(BaseModel):
     examples: List[str]
     key_points: List[str]
 
-class QuizQuestion(BaseModel):
+class PublicQuizQuestion(BaseModel):
+    """A question as sent to learners: the answer key stays on the server"""
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     question: str
     options: List[str]
+
+class QuizQuestion(PublicQuizQuestion):
     correct_answer: int  # index of correct option
 
 class Quiz(BaseModel):
     module_id: str
     questions: List[QuizQuestion]
 
+class PublicQuiz(BaseModel):
+    module_id: str
+    questions: List[PublicQuizQuestion]
+
+    @classmethod
+    def from_quiz(cls, quiz: Quiz) -> "PublicQuiz":
+        return cls(
+            module_id=quiz.module_id,
+            questions=[PublicQuizQuestion(id=q.id, question=q.question, options=q.options) for q in quiz.questions]
+        )
+
+class CourseOutline(BaseModel):
+    titles: List[str]
+
+class GeneratedCourse(BaseModel):
+    modules: List[Module]
+
+class GeneratedQuiz(BaseModel):
+    questions: List[QuizQuestion]
+
 class Course(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -75,12 +500,28 @@ class Course(BaseModel):
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     current_module_index: int = 0
     completed: bool = False
+    # Streaming stopped after the learner had started: only the modules saved before that are kept
+    incomplete: bool = False
+    version: int = 1
+
+class CourseJob(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    request: CourseRequest
+    status: str = "queued"  # "queued", "running", "done" or "failed"
+    course_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    attempts: int = 0
+    error: Optional[str] = None
+    not_before: Optional[datetime] = None  # set while a failed attempt is waiting to be retried
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class QuizSubmission(BaseModel):
     username: str
     course_id: str
     module_id: str
     answers: List[int]  # indices of selected options
+    time_spent_seconds: Optional[float] = None  # client-measured, for time-on-task stats
 
 class QuizResult(BaseModel):
     score: int
@@ -124,6 +565,7 @@ class TeachingSubmission(BaseModel):
     course_id: str
     module_id: str
     explanation: str
+    time_spent_seconds: Optional[float] = None
 
 class TeachingFeedback(BaseModel):
     feedback: str
@@ -131,6 +573,31 @@ class TeachingFeedback(BaseModel):
     suggestions: List[str]
     can_proceed: bool
 
+class QuizSyncItem(QuizSubmission):
+    type: Literal["quiz"]
+    client_id: Optional[str] = None  # echoed back so clients can match results
+    submitted_at: Optional[datetime] = None  # when the learner answered, offline
+
+class TeachingSyncItem(TeachingSubmission):
+    type: Literal["teaching"]
+    client_id: Optional[str] = None
+    submitted_at: Optional[datetime] = None
+
+SyncItem = Annotated[Union[QuizSyncItem, TeachingSyncItem], Field(discriminator="type")]
+sync_item_adapter = TypeAdapter(SyncItem)
+
+class SyncItemResult(BaseModel):
+    index: int
+    client_id: Optional[str] = None
+    status: str  # "applied", "invalid", "not_found" or "failed"
+    error: Optional[str] = None
+    quiz_result: Optional[QuizResult] = None
+
+class SyncResult(BaseModel):
+    applied: int
+    rejected: int
+    results: List[SyncItemResult]
+
 
 # ===== HELPER FUNCTIONS =====
 
@@ -144,401 +611,2974 @@ def get_llm_chat(system_message: str, session_id: str) -> LlmChat:
     chat.with_model("openai", "gpt-5.1")
     return chat
 
-# ===== API ENDPOINTS =====
-
-@api_router.post("/user/register", response_model=User)
-async def register_user(username: str):
-    """Register a new user or return existing"""
-    existing_user = await db.users.find_one({"username": username}, {"_id": 0})
-    if existing_user:
-        if isinstance(existing_user.get('created_at'), str):
-            existing_user['created_at'] = datetime.fromisoformat(existing_user['created_at'])
-        return User(**existing_user)
+class SingleFlight:
+    """Coalesce concurrent identical calls onto one shared in-flight task"""
     
-    user = User(username=username)
-    doc = user.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    await db.users.insert_one(doc)
-    return user
-
-@api_router.get("/user/{username}", response_model=User)
-async def get_user(username: str):
-    """Get user profile"""
-    user = await db.users.find_one({"username": username}, {"_id": 0})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, int] = {}
+        self.stats = {"upstream_calls": 0, "coalesced_calls": 0}
     
-    if isinstance(user.get('created_at'), str):
-        user['created_at'] = datetime.fromisoformat(user['created_at'])
-    return User(**user)
-
-@api_router.post("/course/generate", response_model=Course)
-async def generate_course(request: CourseRequest):
-    """Generate a complete course with modules using AI"""
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+            del self._waiters[key]
     
-    system_message = f"""You are an expert educational content creator. Generate a personalized learning course for {request.username}.
+    async def do(self, key: str, call):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(call())
+            self._calls[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.stats["upstream_calls"] += 1
+        else:
+            self.stats["coalesced_calls"] += 1
+        
+        self._waiters[key] += 1
+        try:
+            # Shielded so one caller going away doesn't cancel the call for the others
+            return await asyncio.shield(task)
+        finally:
+            if self._calls.get(key) is task:
+                self._waiters[key] -= 1
+                if self._waiters[key] == 0 and not task.done():
+                    task.cancel()
     
-Topic: {request.topic}
-Skill Level: {request.skill_level}
-Learning Goal: {request.learning_goal or 'General understanding'}
+    def snapshot(self) -> Dict[str, int]:
+        return {**self.stats, "in_flight": len(self._calls)}
 
-Create a course with 5 progressive modules. Each module should:
-1. Have a clear, engaging title
-2. Contain simple explanations (2-3 paragraphs, beginner-friendly language)
-3. Include 2-3 practical examples
-4. List 3-4 key takeaway points
+llm_single_flight = SingleFlight()
 
-Make content adaptive to the skill level and use encouraging, friendly language.
-Format your response as JSON with this structure:
-{{
-    "modules": [
-        {{
-            "title": "Module title",
-            "content": "Detailed explanation...",
-            "examples": ["Example 1", "Example 2"],
-            "key_points": ["Point 1", "Point 2", "Point 3"]
-        }}
-    ]
-}}
-"""
+class LLMScheduler:
+    """Bounded LLM concurrency with strict-priority per-class queues"""
     
-    try:
-        chat = get_llm_chat(system_message, f"course_gen_{request.username}_{uuid.uuid4()}")
-        prompt = f"Generate a complete {request.skill_level} level course on '{request.topic}' with 5 modules. Return only valid JSON."
-        
-        response = await chat.send_message(UserMessage(text=prompt))
-        
-        # Parse the AI response
-        import json
-        # Extract JSON from response (handling markdown code blocks)
-        response_text = response.strip()
-        if "```json" in response_text:
-            response_text = response_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in response_text:
-            response_text = response_text.split("```")[1].split("```")[0].strip()
-        
-        course_data = json.loads(response_text)
-        
-        # Create course object
-        modules = [Module(**mod) for mod in course_data['modules']]
-        course = Course(
-            username=request.username,
-            topic=request.topic,
-            skill_level=request.skill_level,
-            learning_goal=request.learning_goal,
-            modules=modules
-        )
-        
-        # Save to database
-        doc = course.model_dump()
-        doc['created_at'] = doc['created_at'].isoformat()
-        await db.courses.insert_one(doc)
+    def __init__(self, max_concurrency: int, classes: List[str], queue_limits: Dict[str, int]):
+        self.max_concurrency = max_concurrency
+        self.classes = classes
+        self.queue_limits = queue_limits
+        self.active = 0
+        self.queues: Dict[str, Deque[asyncio.Future]] = {name: deque() for name in classes}
+        self.stats = {
+            name: {"admitted": 0, "rejected": 0, "total_wait": 0.0, "max_wait": 0.0}
+            for name in classes
+        }
+        # Smoothed call duration, used to estimate Retry-After
+        self.avg_call_seconds = 5.0
+    
+    def retry_after(self, priority: str) -> int:
+        ahead = sum(len(self.queues[name]) for name in self.classes[:self.classes.index(priority) + 1])
+        return max(1, math.ceil(self.avg_call_seconds * (ahead + 1) / self.max_concurrency))
+    
+    async def _acquire(self, priority: str):
+        # Queues only hold waiters while every slot is taken, so a free slot can be used directly
+        if self.active < self.max_concurrency:
+            self.active += 1
+            return
         
-        # Update user stats
-        await db.users.update_one(
-            {"username": request.username},
-            {"$inc": {"total_courses": 1}}
-        )
+        queue = self.queues[priority]
+        if len(queue) >= self.queue_limits[priority]:
+            self.stats[priority]["rejected"] += 1
+            raise HTTPException(
+                status_code=429,
+                detail="AI service is busy, please retry shortly",
+                headers={"Retry-After": str(self.retry_after(priority))}
+            )
         
-        return course
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter in queue:
+                queue.remove(waiter)
+            elif waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we were cancelled
+                self._release()
+            raise
+    
+    def _release(self):
+        # Hand the slot straight to the highest-priority waiter
+        for name in self.classes:
+            queue = self.queues[name]
+            while queue:
+                waiter = queue.popleft()
+                if not waiter.done():
+                    waiter.set_result(None)
+                    return
+        self.active -= 1
+    
+    @asynccontextmanager
+    async def slot(self, priority: str):
+        queued_at = time.monotonic()
+        await self._acquire(priority)
+        started_at = time.monotonic()
         
-    except Exception as e:
-        logging.error(f"Course generation error: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Failed to generate course: {str(e)}")
+        stats = self.stats[priority]
+        wait = started_at - queued_at
+        stats["admitted"] += 1
+        stats["total_wait"] += wait
+        stats["max_wait"] = max(stats["max_wait"], wait)
+        metrics.observe("llm_queue_wait_seconds", {"priority": priority}, wait)
+        try:
+            yield
+        finally:
+            self.avg_call_seconds = 0.9 * self.avg_call_seconds + 0.1 * (time.monotonic() - started_at)
+            self._release()
+    
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "active": self.active,
+            "avg_call_ms": round(self.avg_call_seconds * 1000, 1),
+            "classes": {
+                name: {
+                    "queued": len(self.queues[name]),
+                    "queue_limit": self.queue_limits[name],
+                    "admitted": stats["admitted"],
+                    "rejected": stats["rejected"],
+                    "avg_wait_ms": round(stats["total_wait"] / stats["admitted"] * 1000, 1) if stats["admitted"] else 0.0,
+                    "max_wait_ms": round(stats["max_wait"] * 1000, 1)
+                }
+                for name, stats in self.stats.items()
+            }
+        }
 
-@api_router.post("/quiz/generate", response_model=Quiz)
-async def generate_quiz(course_id: str, module_id: str):
-    """Generate quiz questions for a module"""
+llm_scheduler = LLMScheduler(
+    LLM_MAX_CONCURRENCY,
+    LLM_PRIORITY_CLASSES,
+    {name: LLM_QUEUE_LIMITS.get(name, LLM_QUEUE_LIMIT) for name in LLM_PRIORITY_CLASSES}
+)
+
+class LLMUnavailableError(HTTPException):
+    """The LLM provider failed, timed out or is cut off by the circuit breaker
+
+    An HTTPException, so endpoints without a fallback pass it through as a
+    503/504; callers with cached or local content catch it and serve that.
+    """
+
+class CircuitBreaker:
+    """Fail fast after repeated upstream failures, then let a single probe through once the reset time passes"""
     
-    # Get course and module
-    course = await db.courses.find_one({"id": course_id}, {"_id": 0})
-    if not course:
-        raise HTTPException(status_code=404, detail="Course not found")
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"  # "closed", "open" or "half_open"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.stats = {"opened": 0, "rejected": 0}
     
-    module = next((m for m in course['modules'] if m['id'] == module_id), None)
-    if not module:
-        raise HTTPException(status_code=404, detail="Module not found")
+    def allow(self) -> bool:
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_seconds:
+                self.stats["rejected"] += 1
+                return False
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self.probing:
+                self.stats["rejected"] += 1
+                return False
+            self.probing = True
+        return True
     
-    system_message = f"""You are a quiz generator. Create 5 multiple-choice questions based on the module content.
+    def abandon(self):
+        """The allowed call ended without telling us anything about the upstream (cancelled, load-shed)"""
+        self.probing = False
     
-Module: {module['title']}
-Content: {module['content']}
-
-Generate questions that test understanding, not just memorization. Each question should have 4 options with only one correct answer.
-
-Return ONLY valid JSON with this exact structure:
-{{
-    "questions": [
-        {{
-            "question": "Question text?",
-            "options": ["Option A", "Option B", "Option C", "Option D"],
-            "correct_answer": 0
-        }}
-    ]
-}}
-"""
+    def record_success(self):
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.probing = False
     
-    try:
-        chat = get_llm_chat(system_message, f"quiz_gen_{module_id}")
-        response = await chat.send_message(UserMessage(text="Generate 5 quiz questions. Return only valid JSON."))
-        
-        import json
-        response_text = response.strip()
-        if "```json" in response_text:
-            response_text = response_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in response_text:
-            response_text = response_text.split("```")[1].split("```")[0].strip()
-        
-        quiz_data = json.loads(response_text)
-        questions = [QuizQuestion(**q) for q in quiz_data['questions']]
-        
-        return Quiz(module_id=module_id, questions=questions)
-        
-    except Exception as e:
-        logging.error(f"Quiz generation error: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Failed to generate quiz: {str(e)}")
-
-@api_router.post("/quiz/submit", response_model=QuizResult)
-async def submit_quiz(submission: QuizSubmission):
-    """Evaluate quiz submission"""
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self.probing = False
+        if self.state == "half_open" or (self.state == "closed" and self.consecutive_failures >= self.failure_threshold):
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.stats["opened"] += 1
     
-    # Get the quiz questions (regenerate for checking)
-    course = await db.courses.find_one({"id": submission.course_id}, {"_id": 0})
-    if not course:
-        raise HTTPException(status_code=404, detail="Course not found")
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.opened_at + self.reset_seconds - time.monotonic()))
     
-    # For now, we'll store correct answers in a separate collection
-    # In production, you'd want to cache the generated quiz
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_after": self.retry_after() if self.state == "open" else 0
+        }
+
+class LLMResilience:
+    """Deadlines, jittered retries, hedged requests and a circuit breaker around upstream LLM calls"""
     
-    # Calculate score (this is simplified - in production, retrieve actual quiz)
-    total = len(submission.answers)
-    score = 0  # This should be calculated against actual correct answers
+    # Recent successful call durations kept per call site, and how many a hedge delay needs
+    LATENCY_WINDOW = 200
+    HEDGE_MIN_SAMPLES = 20
     
-    # For demo purposes, let's use a mock scoring
-    # In production, you'd compare against stored quiz
-    score = sum(1 for _ in submission.answers if _ >= 0)  # Placeholder
-    percentage = (score / total) * 100 if total > 0 else 0
-    passed = percentage >= 60
+    def __init__(self, deadlines: Dict[str, float], max_retries: int, backoff_base: float, backoff_max: float,
+                 hedge_call_sites: set, hedge_percentile: float, hedge_min_seconds: float, breaker: CircuitBreaker):
+        self.deadlines = deadlines
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_call_sites = hedge_call_sites
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_seconds = hedge_min_seconds
+        self.breaker = breaker
+        self.latencies: Dict[str, Deque[float]] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}
     
-    # Generate personalized feedback
-    user = await db.users.find_one({"username": submission.username}, {"_id": 0})
-    username = user.get('username', 'Learner') if user else 'Learner'
+    def _stats(self, call_site: str) -> Dict[str, int]:
+        return self.stats.setdefault(call_site, {
+            "calls": 0, "succeeded": 0, "retries": 0, "failures": 0, "timeouts": 0, "queue_timeouts": 0,
+            "rejected": 0, "hedged": 0, "hedge_wins": 0, "fallbacks": 0
+        })
     
-    if passed:
-        feedback = f"Excellent work, {username}! You scored {percentage:.0f}%. You've shown great understanding. Ready to move forward! 🎉"
-    else:
-        feedback = f"It's okay, {username}. You scored {percentage:.0f}%. Learning takes time. Let's simplify this concept and try again. You've got this! 💪"
+    def hedge_delay(self, call_site: str) -> Optional[float]:
+        """How long to wait on the first request before hedging, or None if this call site isn't hedged"""
+        samples = self.latencies.get(call_site)
+        if call_site not in self.hedge_call_sites or not samples or len(samples) < self.HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        rank = max(0, min(len(ordered) - 1, math.ceil(self.hedge_percentile / 100 * len(ordered)) - 1))
+        return max(self.hedge_min_seconds, ordered[rank])
     
-    # Save progress
-    progress = Progress(
-        username=submission.username,
-        course_id=submission.course_id,
-        module_id=submission.module_id,
-        quiz_score=score,
-        quiz_total=total,
-        attempts=1,
-        completed=passed
-    )
-    
-    # Update or insert progress
-    existing = await db.progress.find_one({
-        "username": submission.username,
-        "module_id": submission.module_id
-    })
+    async def _send(self, call_site: str, send, sent: asyncio.Event) -> str:
+        """One upstream request in a scheduler slot; sets `sent` once it has a slot and goes upstream"""
+        labels = {"call_site": call_site}
+        async with llm_scheduler.slot(LLM_CALL_SITES[call_site]):
+            sent.set()
+            started = time.perf_counter()
+            try:
+                response = await send()
+            except Exception:
+                metrics.inc("llm_call_failures_total", labels)
+                raise
+            finally:
+                metrics.observe("llm_call_duration_seconds", labels, time.perf_counter() - started)
+        self.latencies.setdefault(call_site, deque(maxlen=self.LATENCY_WINDOW)).append(time.perf_counter() - started)
+        return response
     
-    if existing:
-        await db.progress.update_one(
-            {"username": submission.username, "module_id": submission.module_id},
-            {
-                "$set": {
-                    "quiz_score": score,
-                    "quiz_total": total,
-                    "completed": passed,
-                    "timestamp": datetime.now(timezone.utc).isoformat()
-                },
-                "$inc": {"attempts": 1}
-            }
-        )
-    else:
-        doc = progress.model_dump()
-        doc['timestamp'] = doc['timestamp'].isoformat()
-        await db.progress.insert_one(doc)
+    async def _attempt(self, call_site: str, send, sent: asyncio.Event) -> str:
+        """One attempt; on hedged call sites a duplicate request races the first once it's slower than usual"""
+        delay = self.hedge_delay(call_site)
+        if delay is None:
+            return await self._send(call_site, send, sent)
+        
+        primary = asyncio.ensure_future(self._send(call_site, send, sent))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            # Only hedge into spare capacity, and not while the breaker is testing a degraded provider
+            hedged = (not done and self.breaker.state == "closed"
+                      and llm_scheduler.active < llm_scheduler.max_concurrency)
+            if hedged:
+                self._stats(call_site)["hedged"] += 1
+                tasks.add(asyncio.ensure_future(self._send(call_site, send, sent)))
+            error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if hedged:
+                            winner = "primary" if task is primary else "hedge"
+                            if winner == "hedge":
+                                self._stats(call_site)["hedge_wins"] += 1
+                            metrics.inc("llm_hedged_requests_total", {"call_site": call_site, "winner": winner})
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
     
-    # Update user stats if passed
-    if passed:
-        await db.users.update_one(
-            {"username": submission.username},
-            {"$inc": {"total_modules_completed": 1}}
+    def _admit(self, call_site: str):
+        """Fail fast with a 503 while the circuit breaker is open"""
+        if not self.breaker.allow():
+            self._stats(call_site)["rejected"] += 1
+            metrics.inc("llm_breaker_rejections_total", {"call_site": call_site})
+            raise self._unavailable()
+    
+    def _unavailable(self) -> "LLMUnavailableError":
+        return LLMUnavailableError(
+            status_code=503,
+            detail="AI service is temporarily unavailable, please retry shortly",
+            headers={"Retry-After": str(self.breaker.retry_after())}
         )
     
-    return QuizResult(
-        score=score,
-        total=total,
-        percentage=percentage,
-        passed=passed,
-        feedback=feedback,
-        correct_answers=[0] * total  # Placeholder
-    )
-
-@api_router.post("/tutor/ask", response_model=TutorResponse)
-async def ask_tutor(message: TutorMessage):
-    """Get help from AI tutor"""
+    def _timed_out(self, call_site: str, sent: asyncio.Event) -> "LLMUnavailableError":
+        """Record a call that ran past its deadline and return the 504 to raise"""
+        stats = self._stats(call_site)
+        # Only a request that reached the provider counts against it; running out of
+        # time in our own scheduler queue is local overload
+        if sent.is_set():
+            self.breaker.record_failure()
+        else:
+            self.breaker.abandon()
+            stats["queue_timeouts"] += 1
+        stats["timeouts"] += 1
+        metrics.inc("llm_call_timeouts_total", {"call_site": call_site})
+        return LLMUnavailableError(status_code=504, detail="AI service took too long to respond")
     
-    context_info = ""
-    if message.module_id:
-        course = await db.courses.find_one({"id": message.course_id}, {"_id": 0})
-        if course:
-            module = next((m for m in course['modules'] if m['id'] == message.module_id), None)
-            if module:
-                context_info = f"\nCurrent Module: {module['title']}\nContent: {module['content'][:500]}..."
+    def _failed(self, call_site: str):
+        self.breaker.record_failure()
+        self._stats(call_site)["failures"] += 1
     
-    system_message = f"""You are a friendly, encouraging AI tutor helping {message.username} learn.
+    def _succeeded(self, call_site: str):
+        self.breaker.record_success()
+        self._stats(call_site)["succeeded"] += 1
     
-Your role:
-- Answer questions clearly and simply
-- Provide hints, not direct answers to quiz questions
-- Use encouraging, motivating language
-- Keep responses concise (2-3 sentences)
-- Adapt to the learner's level
-
-Context: {message.context or 'general learning'}
-{context_info}
-
-Always address {message.username} by name and be supportive!
-"""
+    async def _retry_pause(self, call_site: str, attempt: int, deadline: float, error: Exception) -> bool:
+        """Sleep before the next attempt; False if there's no attempt or time left for one"""
+        # Full jitter keeps retries from many requests from arriving in lockstep
+        backoff = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if attempt == self.max_retries or time.monotonic() + backoff >= deadline:
+            logging.error(f"LLM {call_site} failed after {attempt + 1} attempts: {str(error)}")
+            return False
+        self._stats(call_site)["retries"] += 1
+        metrics.inc("llm_call_retries_total", {"call_site": call_site})
+        logging.warning(f"LLM {call_site} attempt {attempt + 1} failed, retrying in {backoff:.2f}s: {str(error)}")
+        await asyncio.sleep(backoff)
+        return True
     
-    try:
-        chat = get_llm_chat(system_message, f"tutor_{message.username}_{message.course_id}")
-        response = await chat.send_message(UserMessage(text=message.message))
-        
-        # Generate encouragement
-        encouragements = [
-            f"You're doing great, {message.username}! Keep asking questions! 🌟",
-            f"Great question, {message.username}! Curiosity leads to learning! 🚀",
-            f"I'm here to help, {message.username}! You're making progress! 💪",
-            f"Excellent thinking, {message.username}! Keep it up! ✨"
-        ]
-        
-        import random
-        encouragement = random.choice(encouragements)
+    async def call(self, call_site: str, send) -> str:
+        """Run send() (one upstream request) within the call site's deadline, retrying transient failures"""
+        self._stats(call_site)["calls"] += 1
+        deadline = time.monotonic() + self.deadlines.get(call_site, 60.0)
         
-        return TutorResponse(response=response, encouragement=encouragement)
+        for attempt in range(self.max_retries + 1):
+            self._admit(call_site)
+            sent = asyncio.Event()
+            try:
+                response = await asyncio.wait_for(self._attempt(call_site, send, sent), deadline - time.monotonic())
+            except (HTTPException, asyncio.CancelledError):
+                # Load shedding by the scheduler, or the caller going away: not the provider's fault
+                self.breaker.abandon()
+                raise
+            except asyncio.TimeoutError:
+                raise self._timed_out(call_site, sent) from None
+            except Exception as e:
+                self._failed(call_site)
+                if not await self._retry_pause(call_site, attempt, deadline, e):
+                    raise self._unavailable() from e
+            else:
+                self._succeeded(call_site)
+                return response
+    
+    async def _pump(self, call_site: str, open_stream, sent: asyncio.Event, chunks: asyncio.Queue):
+        """Read one upstream stream into `chunks` in a scheduler slot; None marks the end"""
+        labels = {"call_site": call_site}
+        try:
+            async with llm_scheduler.slot(LLM_CALL_SITES[call_site]):
+                sent.set()
+                started = time.perf_counter()
+                try:
+                    async for chunk in open_stream():
+                        chunks.put_nowait(chunk)
+                except Exception:
+                    metrics.inc("llm_call_failures_total", labels)
+                    raise
+                finally:
+                    metrics.observe("llm_call_duration_seconds", labels, time.perf_counter() - started)
+        finally:
+            chunks.put_nowait(None)
+    
+    async def stream(self, call_site: str, open_stream) -> AsyncIterator[str]:
+        """Yield the chunks of open_stream() (one streamed upstream request) within the call site's deadline
+
+        Failures before the first chunk are retried like call(); once text has
+        been forwarded a failure ends the stream with LLMUnavailableError.
+        Streams are not hedged.
+        """
+        labels = {"call_site": call_site}
+        self._stats(call_site)["calls"] += 1
+        started = time.monotonic()
+        deadline = started + self.deadlines.get(call_site, 60.0)
         
-    except Exception as e:
-        logging.error(f"Tutor error: {str(e)}")
-        raise HTTPException(status_code=500, detail="Failed to get tutor response")
+        for attempt in range(self.max_retries + 1):
+            self._admit(call_site)
+            sent = asyncio.Event()
+            chunks: asyncio.Queue = asyncio.Queue()
+            producer = asyncio.ensure_future(self._pump(call_site, open_stream, sent, chunks))
+            forwarded = False
+            try:
+                while True:
+                    chunk = await asyncio.wait_for(chunks.get(), deadline - time.monotonic())
+                    if chunk is None:
+                        break
+                    if not forwarded:
+                        forwarded = True
+                        metrics.observe("llm_time_to_first_token_seconds", labels, time.monotonic() - started)
+                    yield chunk
+                # Raises whatever ended the upstream stream early
+                await producer
+            except (HTTPException, asyncio.CancelledError, GeneratorExit):
+                self.breaker.abandon()
+                raise
+            except asyncio.TimeoutError:
+                raise self._timed_out(call_site, sent) from None
+            except Exception as e:
+                self._failed(call_site)
+                if forwarded:
+                    logging.error(f"LLM {call_site} stream broke off: {str(e)}")
+                    raise self._unavailable() from e
+                if not await self._retry_pause(call_site, attempt, deadline, e):
+                    raise self._unavailable() from e
+            else:
+                self._succeeded(call_site)
+                return
+            finally:
+                producer.cancel()
+    
+    def record_fallback(self, call_site: str):
+        self._stats(call_site)["fallbacks"] += 1
+        metrics.inc("llm_fallbacks_total", {"call_site": call_site})
+    
+    def snapshot(self) -> Dict[str, Any]:
+        call_sites = {}
+        for call_site, stats in self.stats.items():
+            delay = self.hedge_delay(call_site)
+            call_sites[call_site] = {
+                **stats,
+                "deadline_seconds": self.deadlines.get(call_site, 60.0),
+                "hedge_after_ms": round(delay * 1000, 1) if delay is not None else None
+            }
+        return {"breaker": self.breaker.snapshot(), "call_sites": call_sites}
 
-@api_router.post("/module/simplify", response_model=Module)
-async def simplify_module(request: SimplifyRequest):
-    """Regenerate module with simpler explanations"""
+llm_resilience = LLMResilience(
+    LLM_DEADLINES,
+    LLM_MAX_RETRIES,
+    LLM_RETRY_BASE_SECONDS,
+    LLM_RETRY_MAX_SECONDS,
+    LLM_HEDGE_CALL_SITES,
+    LLM_HEDGE_PERCENTILE,
+    LLM_HEDGE_MIN_SECONDS,
+    CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_SECONDS)
+)
+
+class Prewarmer:
+    """Background speculative generation, bounded by concurrency and an hourly call budget"""
     
-    course = await db.courses.find_one({"id": request.course_id}, {"_id": 0})
-    if not course:
-        raise HTTPException(status_code=404, detail="Course not found")
+    def __init__(self, enabled: bool, concurrency: int, max_calls_per_hour: int):
+        self.enabled = enabled
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.max_calls_per_hour = max_calls_per_hour
+        self.calls: Deque[float] = deque()
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.stats = {"scheduled": 0, "llm_calls": 0, "cache_hits": 0, "skipped_budget": 0, "skipped_busy": 0,
+                      "skipped_degraded": 0, "failed": 0}
     
-    module = next((m for m in course['modules'] if m['id'] == request.module_id), None)
-    if not module:
-        raise HTTPException(status_code=404, detail="Module not found")
+    def schedule(self, key: str, job):
+        """Run job() in the background unless the same key is already pending"""
+        if not self.enabled or key in self.tasks:
+            return
+        self.stats["scheduled"] += 1
+        task = asyncio.create_task(self._run(key, job))
+        self.tasks[key] = task
+        task.add_done_callback(lambda done: self.tasks.pop(key, None))
+    
+    async def _run(self, key: str, job):
+        async with self.semaphore:
+            try:
+                await job()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["failed"] += 1
+                logging.warning(f"Prewarm {key} failed: {str(e)}")
+    
+    def try_spend(self) -> bool:
+        """Claim one speculative LLM call, unless over budget or learners are already queueing"""
+        if llm_scheduler.active >= llm_scheduler.max_concurrency:
+            self.stats["skipped_busy"] += 1
+            return False
+        if llm_resilience.breaker.state != "closed":
+            self.stats["skipped_degraded"] += 1
+            return False
+        now = time.monotonic()
+        while self.calls and now - self.calls[0] > 3600:
+            self.calls.popleft()
+        if len(self.calls) >= self.max_calls_per_hour:
+            self.stats["skipped_budget"] += 1
+            return False
+        self.calls.append(now)
+        self.stats["llm_calls"] += 1
+        return True
+    
+    async def close(self):
+        for task in list(self.tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
     
-    system_message = f"""You are an expert at simplifying complex topics. Rewrite this module to be even simpler for {request.username}.
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "pending": len(self.tasks),
+            "calls_last_hour": len(self.calls),
+            "max_calls_per_hour": self.max_calls_per_hour
+        }
 
-Original Module: {module['title']}
-Original Content: {module['content']}
+prewarmer = Prewarmer(PREWARM_ENABLED, PREWARM_CONCURRENCY, PREWARM_MAX_CALLS_PER_HOUR)
 
-Make it:
-- Use simpler words
-- Add more examples
-- Break down concepts step-by-step
-- Use analogies and real-world connections
+def observe_llm_prompt(call_site: str, system_message: str, text: str):
+    labels = {"call_site": call_site}
+    metrics.observe("llm_prompt_chars", labels, len(system_message) + len(text))
+    metrics.observe("llm_prompt_tokens", labels, token_counter.count(system_message) + token_counter.count(text))
 
-Return ONLY valid JSON:
-{{
-    "title": "Same title",
-    "content": "Simplified explanation...",
-    "examples": ["Example 1", "Example 2", "Example 3"],
-    "key_points": ["Point 1", "Point 2", "Point 3"]
-}}
-"""
-    
-    try:
-        chat = get_llm_chat(system_message, f"simplify_{request.module_id}")
-        response = await chat.send_message(UserMessage(text="Simplify this module. Return only valid JSON."))
-        
-        import json
-        response_text = response.strip()
-        if "```json" in response_text:
-            response_text = response_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in response_text:
-            response_text = response_text.split("```")[1].split("```")[0].strip()
-        
-        module_data = json.loads(response_text)
-        simplified_module = Module(id=request.module_id, **module_data)
-        
-        # Update in database
-        await db.courses.update_one(
-            {"id": request.course_id, "modules.id": request.module_id},
-            {"$set": {
-                "modules.$": simplified_module.model_dump()
-            }}
-        )
-        
-        return simplified_module
-        
-    except Exception as e:
-        logging.error(f"Simplify error: {str(e)}")
-        raise HTTPException(status_code=500, detail="Failed to simplify module")
+def observe_llm_response(call_site: str, response: str):
+    labels = {"call_site": call_site}
+    metrics.observe("llm_response_chars", labels, len(response))
+    response_tokens = token_counter.count(response)
+    metrics.observe("llm_response_tokens", labels, response_tokens)
+    if response_tokens > LLM_OUTPUT_BUDGETS.get(call_site, response_tokens):
+        metrics.inc("llm_output_over_budget_total", labels)
 
-@api_router.post("/teaching/submit", response_model=TeachingFeedback)
-async def submit_teaching(submission: TeachingSubmission):
-    """Evaluate learner's explanation (teaching phase)"""
+async def ask_llm(system_message: str, session_id: str, text: str, call_site: str) -> str:
+    """Send one message to the LLM through the scheduler and resilience layer, sharing the reply with identical in-flight requests"""
+    key = hashlib.sha256(f"{system_message}\x00{text}".encode('utf-8')).hexdigest()
     
-    course = await db.courses.find_one({"id": submission.course_id}, {"_id": 0})
-    if not course:
-        raise HTTPException(status_code=404, detail="Course not found")
+    async def send() -> str:
+        chat = get_llm_chat(system_message, session_id)
+        return await chat.send_message(UserMessage(text=text))
     
-    module = next((m for m in course['modules'] if m['id'] == submission.module_id), None)
-    if not module:
-        raise HTTPException(status_code=404, detail="Module not found")
+    async def call() -> str:
+        observe_llm_prompt(call_site, system_message, text)
+        response = await llm_resilience.call(call_site, send)
+        observe_llm_response(call_site, response)
+        return response
     
-    system_message = f"""You are evaluating {submission.username}'s understanding of: {module['title']}
+    return await llm_single_flight.do(key, call)
 
-Original content: {module['content']}
-Their explanation: {submission.explanation}
+async def provider_stream(system_message: str, text: str) -> AsyncIterator[str]:
+    """Ask the provider for a streamed completion and yield its text chunks"""
+    response = await litellm.acompletion(
+        model=LLM_STREAM_MODEL,
+        api_key=EMERGENT_LLM_KEY,
+        api_base=LLM_STREAM_API_BASE,
+        messages=[{"role": "system", "content": system_message}, {"role": "user", "content": text}],
+        stream=True
+    )
+    async for chunk in response:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            yield delta
+
+async def stream_llm(system_message: str, session_id: str, text: str, call_site: str) -> AsyncIterator[str]:
+    """Yield an LLM reply as text deltas as the provider produces them
+
+    Goes through the scheduler and resilience layer like ask_llm, but isn't
+    shared with identical requests. Without litellm (or with
+    LLM_STREAMING_ENABLED off) the whole reply comes from ask_llm as one delta.
+    """
+    if litellm is None or not LLM_STREAMING_ENABLED:
+        yield await ask_llm(system_message, session_id, text, call_site)
+        return
+    
+    observe_llm_prompt(call_site, system_message, text)
+    reply = []
+    async for delta in llm_resilience.stream(call_site, lambda: provider_stream(system_message, text)):
+        reply.append(delta)
+        yield delta
+    observe_llm_response(call_site, "".join(reply))
+
+class JSONExtractor:
+    """Find the first balanced JSON object in LLM output, fenced or not
+
+    Text can be fed in pieces as it streams in; feed() returns the decoded
+    object as soon as its closing brace arrives. Braces inside strings are
+    ignored, and an opening brace that doesn't start valid JSON (e.g. in
+    leading prose) is skipped in favour of the next one.
+    """
+    
+    _TOKENS = re.compile(r'[{}"\\]')
+    _decoder = json.JSONDecoder()
+    
+    def __init__(self):
+        self.buffer = ""
+        self.result: Any = None
+        self._pos = 0
+        self._start = -1
+        self._depth = 0
+        self._in_string = False
+    
+    def feed(self, chunk: str) -> Any:
+        """Add text; return the first complete JSON object once available, else None"""
+        if self.result is not None:
+            return self.result
+        self.buffer += chunk
+        
+        while True:
+            match = self._TOKENS.search(self.buffer, self._pos)
+            if match is None:
+                self._pos = len(self.buffer)
+                return None
+            char = match.group()
+            if char == '\\':
+                # Skip the escaped character; wait for it if it hasn't arrived yet
+                if match.end() >= len(self.buffer):
+                    self._pos = match.start()
+                    return None
+                self._pos = match.end() + 1
+                continue
+            self._pos = match.end()
+            
+            if self._start < 0:
+                # Outside any object only an opening brace matters
+                if char == '{':
+                    self._start, self._depth, self._in_string = match.start(), 1, False
+            elif char == '"':
+                self._in_string = not self._in_string
+            elif self._in_string:
+                continue
+            elif char == '{':
+                self._depth += 1
+            elif char == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        self.result, _ = self._decoder.raw_decode(self.buffer, self._start)
+                        return self.result
+                    except ValueError:
+                        # Balanced but not JSON; rescan from just after that opening brace
+                        self._pos, self._start = self._start + 1, -1
+    
+    def finish(self) -> Any:
+        """Return the extracted object, raising ValueError if the input held none"""
+        if self.result is None:
+            raise ValueError("No complete JSON object found in LLM response")
+        return self.result
+
+def extract_json(text: str) -> Any:
+    """Extract the first balanced JSON object from a complete LLM reply"""
+    # Fast path: most replies are a bare or fenced object that decodes in one go
+    start = text.find('{')
+    if start >= 0:
+        try:
+            return JSONExtractor._decoder.raw_decode(text, start)[0]
+        except ValueError:
+            pass
+    extractor = JSONExtractor()
+    extractor.feed(text)
+    return extractor.finish()
+
+def parse_llm_model(response: str, model: Type[ModelT]) -> ModelT:
+    """Extract the JSON object from an LLM reply and validate it into a pydantic model"""
+    labels = {"model": model.__name__}
+    started = time.perf_counter()
+    try:
+        return model.model_validate(extract_json(response))
+    except Exception:
+        metrics.inc("llm_parse_failures_total", labels)
+        raise
+    finally:
+        metrics.observe("llm_parse_duration_seconds", labels, time.perf_counter() - started)
+
+def json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class FastJSONResponse(JSONResponse):
+    """JSON response for large documents returned as-is from Mongo
+
+    Handlers return it directly, which skips FastAPI's jsonable_encoder pass
+    over every nested value. Rendered with orjson when it's installed
+    (datetimes natively), otherwise with the stdlib encoder.
+    """
+    
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(
+            content, default=json_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+        ).encode("utf-8")
+
+def sse_event(event: str, data: Any) -> str:
+    """Format a single Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+class TTLCache:
+    """Bounded LRU cache whose entries also expire after a fixed TTL"""
+    
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._invalidations = 0
+    
+    def get(self, key: str) -> Any:
+        entry = self._data.get(key)
+        if entry is not None and entry[0] < time.monotonic():
+            del self._data[key]
+            entry = None
+        metrics.inc("read_cache_requests_total", {"cache": self.name, "result": "hit" if entry else "miss"})
+        if entry is None:
+            return None
+        self._data.move_to_end(key)
+        return entry[1]
+    
+    def token(self) -> int:
+        """Take before reading from the database; pass to set() afterwards"""
+        return self._invalidations
+    
+    def set(self, key: str, value: Any, token: int):
+        # Skip if anything was invalidated during the read, it may have been this key
+        if token != self._invalidations:
+            return
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+    
+    def invalidate(self, key: str):
+        self._invalidations += 1
+        self._data.pop(key, None)
+
+course_cache = TTLCache("course", READ_CACHE_MAX_ENTRIES, READ_CACHE_TTL_SECONDS)
+user_cache = TTLCache("user", READ_CACHE_MAX_ENTRIES, READ_CACHE_TTL_SECONDS)
+course_index_cache = TTLCache("course_index", READ_CACHE_MAX_ENTRIES, READ_CACHE_TTL_SECONDS)
+
+def document_etag(kind: str, key: str, version: int) -> str:
+    """Strong ETag for a versioned document"""
+    digest = hashlib.sha1(f"{kind}:{key}".encode('utf-8')).hexdigest()[:16]
+    return f'"{digest}-{version}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+
+def grade_quiz(username: str, answers: List[int], correct_answers: List[int]) -> QuizResult:
+    """Score answers against a stored answer key and word the feedback"""
+    total = len(correct_answers)
+    score = sum(
+        1 for given, expected in zip(answers, correct_answers)
+        if given == expected
+    )
+    percentage = (score / total) * 100 if total > 0 else 0
+    passed = percentage >= 60
+    
+    # Generate personalized feedback
+    if passed:
+        feedback = f"Excellent work, {username}! You scored {percentage:.0f}%. You've shown great understanding. Ready to move forward! 🎉"
+    else:
+        feedback = f"It's okay, {username}. You scored {percentage:.0f}%. Learning takes time. Let's simplify this concept and try again. You've got this! 💪"
+    
+    return QuizResult(
+        score=score,
+        total=total,
+        percentage=percentage,
+        passed=passed,
+        feedback=feedback,
+        correct_answers=correct_answers
+    )
+
+def quiz_progress_update(course_id: str, score: int, total: int, passed: bool,
+                         timestamp: Optional[datetime] = None) -> Dict[str, Any]:
+    """Upsert document recording one quiz attempt on a (username, module_id) progress row
+
+    passed_at keeps the first pass, so a later re-pass (or a fail, which
+    clears `completed`) doesn't count the module twice in the user's stats.
+    """
+    timestamp = timestamp or datetime.now(timezone.utc)
+    update = {
+        "$set": {
+            "course_id": course_id,
+            "quiz_score": score,
+            "quiz_total": total,
+            "completed": passed,
+            "timestamp": timestamp
+        },
+        "$inc": {"attempts": 1},
+        "$setOnInsert": {"id": str(uuid.uuid4())}
+    }
+    if passed:
+        update["$min"] = {"passed_at": timestamp}
+    return update
+
+def teaching_progress_update(course_id: str, explanation: str, timestamp: datetime) -> Dict[str, Any]:
+    """Upsert document storing a teaching-phase explanation on a progress row"""
+    return {
+        "$set": {
+            "teaching_explanation": explanation,
+            "teaching_submitted_at": timestamp
+        },
+        "$setOnInsert": {
+            "id": str(uuid.uuid4()),
+            "course_id": course_id,
+            "attempts": 0,
+            "completed": False
+        }
+    }
+
+async def upsert_progress(key: Dict[str, str], update: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Apply a progress upsert, retrying once if a concurrent upsert won the insert
+
+    Returns the quiz fields of the row as it was before this write (None if
+    it was inserted), which is what tells a first attempt or pass apart.
+    """
+    for attempt in range(2):
+        try:
+            return await db.progress.find_one_and_update(
+                key, update,
+                projection={"_id": 0, "quiz_total": 1, "passed_at": 1},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE
+            )
+        except DuplicateKeyError:
+            if attempt:
+                raise
+
+MODULE_BODY_FIELDS = ("content", "examples", "key_points")
+
+def module_stub(module: Dict[str, Any]) -> Dict[str, Any]:
+    """What a course document keeps of a module: its id and title, in course order"""
+    return {"id": module['id'], "title": module['title']}
+
+def encode_module_body(course_id: str, module: Dict[str, Any]) -> Dict[str, Any]:
+    """module_bodies document for one module, compressed once it's large enough to be worth it"""
+    body = {field: module[field] for field in MODULE_BODY_FIELDS}
+    raw = json.dumps(body, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    doc = {"module_id": module['id'], "course_id": course_id, "size": len(raw), "encoding": "plain", "body": body}
+    if MODULE_BODY_COMPRESSION != "none" and len(raw) >= MODULE_BODY_COMPRESS_MIN_BYTES:
+        if MODULE_BODY_COMPRESSION == "zstd" and zstandard is not None:
+            doc.update(encoding="zstd", body=zstandard.ZstdCompressor(level=3).compress(raw))
+        else:
+            doc.update(encoding="zlib", body=zlib.compress(raw, 6))
+    return doc
+
+def decode_module_body(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Inverse of encode_module_body: the module's content, examples and key points"""
+    encoding = doc.get('encoding', 'plain')
+    if encoding == "plain":
+        return doc['body']
+    if encoding == "zlib":
+        return json.loads(zlib.decompress(doc['body']))
+    if encoding == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Module body is zstd-compressed but the zstandard package is not installed")
+        return json.loads(zstandard.ZstdDecompressor().decompress(doc['body']))
+    raise ValueError(f"Unknown module body encoding: {encoding}")
+
+def missing_module_body(module_id: str) -> Dict[str, Any]:
+    logging.warning(f"Module {module_id} has no stored body")
+    return {"content": "", "examples": [], "key_points": []}
+
+async def save_module_bodies(course_id: str, modules: List[Dict[str, Any]]):
+    """Write (or replace) the bodies of the given modules"""
+    if modules:
+        await db.module_bodies.bulk_write([
+            ReplaceOne({"module_id": module['id']}, encode_module_body(course_id, module), upsert=True)
+            for module in modules
+        ], ordered=False)
+
+async def with_module_bodies(modules: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Full modules for a course's module stubs; modules still embedded in unmigrated courses pass through"""
+    missing = [module['id'] for module in modules if 'content' not in module]
+    bodies = {}
+    if missing:
+        docs = await db.module_bodies.find(
+            {"module_id": {"$in": missing}},
+            {"_id": 0, "module_id": 1, "encoding": 1, "body": 1}
+        ).to_list(None)
+        bodies = {doc['module_id']: decode_module_body(doc) for doc in docs}
+    return [
+        module if 'content' in module else {**module, **(bodies.get(module['id']) or missing_module_body(module['id']))}
+        for module in modules
+    ]
+
+async def find_course_module(course_id: str, module_id: str) -> Optional[Dict[str, Any]]:
+    """Fetch a course with only the requested module, body included, projected into `modules`"""
+    course, body = await asyncio.gather(
+        db.courses.find_one(
+            {"id": course_id},
+            {"_id": 0, "id": 1, "modules": {"$elemMatch": {"id": module_id}}}
+        ),
+        db.module_bodies.find_one(
+            {"module_id": module_id, "course_id": course_id},
+            {"_id": 0, "encoding": 1, "body": 1}
+        )
+    )
+    if course and course.get('modules') and 'content' not in course['modules'][0]:
+        course['modules'][0].update(decode_module_body(body) if body else missing_module_body(module_id))
+    return course
+
+async def get_module_or_404(course_id: str, module_id: str) -> Dict[str, Any]:
+    """Fetch a single module without loading the rest of the course"""
+    course = await find_course_module(course_id, module_id)
+    if course is None:
+        raise HTTPException(status_code=404, detail="Course not found")
+    if not course.get('modules'):
+        raise HTTPException(status_code=404, detail="Module not found")
+    return course['modules'][0]
+
+async def ensure_unique_progress_index():
+    """Make (username, module_id) unique on progress, replacing the older non-unique index"""
+    keys = [("username", 1), ("module_id", 1)]
+    existing = (await db.progress.index_information()).get("username_1_module_id_1")
+    if existing and existing.get("unique"):
+        return
+    if existing:
+        await db.progress.drop_index("username_1_module_id_1")
+    try:
+        await db.progress.create_index(keys, unique=True)
+    except (DuplicateKeyError, OperationFailure) as e:
+        # Duplicate rows from the old find-then-insert path; keep lookups indexed until they're merged
+        logging.error(f"Cannot make progress (username, module_id) unique, run scripts/dedupe_progress.py: {str(e)}")
+        await db.progress.create_index(keys)
+
+async def ensure_indexes():
+    """Create the indexes the API's lookups rely on"""
+    await db.courses.create_index("id", unique=True)
+    await db.courses.create_index([("username", 1), ("created_at", -1), ("id", -1)])
+    await db.users.create_index("username")
+    await db.daily_rollups.create_index([("username", 1), ("day", 1)], unique=True)
+    await ensure_unique_progress_index()
+    await db.quizzes.create_index("module_id", unique=True)
+    await db.simplified_modules.create_index("module_id", unique=True)
+    await db.module_bodies.create_index("module_id", unique=True)
+    await db.module_bodies.create_index("course_id")
+    await db.course_indexes.create_index("course_id", unique=True)
+    await db.tutor_sessions.create_index([("username", 1), ("course_id", 1)], unique=True)
+    await db.course_blueprints.create_index("key", unique=True)
+    await db.course_blueprints.create_index("last_used_at")
+    await ensure_course_blueprint_ttl()
+    await db.course_jobs.create_index("id", unique=True)
+    await db.rate_limits.create_index("expires_at", expireAfterSeconds=0)
+    await db.course_jobs.create_index([("status", 1), ("created_at", 1)])
+
+async def ensure_course_blueprint_ttl():
+    """Expire course blueprints COURSE_BLUEPRINT_TTL_SECONDS after they were generated"""
+    try:
+        await db.course_blueprints.create_index("created_at", expireAfterSeconds=COURSE_BLUEPRINT_TTL_SECONDS)
+    except OperationFailure:
+        # The index exists with a different TTL; change it in place
+        await db.command(
+            "collMod", "course_blueprints",
+            index={"keyPattern": {"created_at": 1}, "expireAfterSeconds": COURSE_BLUEPRINT_TTL_SECONDS}
+        )
+
+def module_content_hash(module: Dict[str, Any]) -> str:
+    """Stable hash of the module fields a quiz is generated from"""
+    digest = hashlib.sha256()
+    digest.update(module['title'].encode('utf-8'))
+    digest.update(b'\x00')
+    digest.update(module['content'].encode('utf-8'))
+    return digest.hexdigest()
+
+# ===== RATE LIMITING =====
+
+class TokenBuckets:
+    """In-process token buckets, LRU-bounded by key count"""
+    
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+    
+    def take(self, key: str, capacity: float, period: float) -> Tuple[bool, float]:
+        """Take one token if there is one; returns (allowed, tokens left)"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * capacity / period)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return allowed, tokens
+    
+    def refund(self, key: str, capacity: float):
+        entry = self._buckets.get(key)
+        if entry is not None:
+            self._buckets[key] = (min(capacity, entry[0] + 1), entry[1])
+
+def mongo_bucket_update(capacity: float, period: float) -> List[Dict[str, Any]]:
+    """Update pipeline that refills a bucket document by the time since its last use and takes a token
+
+    Runs as one atomic document update, so workers sharing the document can't
+    both spend its last token. The document expires once the bucket would be full again.
+    """
+    elapsed_seconds = {"$divide": [{"$subtract": ["$$NOW", {"$ifNull": ["$updated_at", "$$NOW"]}]}, 1000]}
+    has_token = {"$gte": ["$tokens", 1]}
+    return [
+        {"$set": {
+            "tokens": {"$min": [capacity, {"$add": [
+                {"$ifNull": ["$tokens", capacity]},
+                {"$multiply": [elapsed_seconds, capacity / period]}
+            ]}]},
+            "updated_at": "$$NOW"
+        }},
+        {"$set": {
+            "allowed": has_token,
+            "tokens": {"$cond": [has_token, {"$subtract": ["$tokens", 1]}, "$tokens"]},
+            "expires_at": {"$add": ["$$NOW", int(period * 1000)]}
+        }}
+    ]
+
+class RateLimiter:
+    """Token-bucket checks for a request's buckets, in process or shared through Mongo
+
+    In mongo mode the local buckets are a fast path: this process's share of
+    a key can't exceed the shared total, so an empty local bucket rejects
+    without a round trip. Mongo errors fail open.
+    """
+    
+    def __init__(self, backend: str, max_keys: int):
+        self.backend = backend
+        self.local = TokenBuckets(max_keys)
+        self.stats = Counter()
+    
+    async def _take_shared(self, key: str, capacity: float, period: float) -> Tuple[bool, float]:
+        update = mongo_bucket_update(capacity, period)
+        try:
+            doc = await db.rate_limits.find_one_and_update(
+                {"_id": key}, update, upsert=True,
+                projection={"tokens": 1, "allowed": 1}, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Another worker created the bucket at the same moment
+            doc = await db.rate_limits.find_one_and_update(
+                {"_id": key}, update,
+                projection={"tokens": 1, "allowed": 1}, return_document=ReturnDocument.AFTER
+            )
+        return doc['allowed'], doc['tokens']
+    
+    async def _refund_shared(self, key: str, capacity: float):
+        await db.rate_limits.update_one(
+            {"_id": key},
+            [{"$set": {"tokens": {"$min": [capacity, {"$add": ["$tokens", 1]}]}}}]
+        )
+    
+    async def take(self, buckets: List[Tuple[str, str, float, float]]) -> List[Tuple[str, float, float, bool, float]]:
+        """Take a token from each (scope, key, capacity, period) bucket
+
+        Returns (scope, capacity, period, allowed, tokens left) per bucket.
+        A rejected request gives back what it took from the other buckets, so
+        one client hammering a route doesn't drain the global bucket.
+        """
+        results = []
+        for scope, key, capacity, period in buckets:
+            allowed, tokens = self.local.take(key, capacity, period)
+            results.append((scope, capacity, period, allowed, tokens))
+        if not all(result[3] for result in results):
+            for (_, key, capacity, _), result in zip(buckets, results):
+                if result[3]:
+                    self.local.refund(key, capacity)
+            return results
+        if self.backend != "mongo":
+            return results
+        
+        try:
+            shared = await asyncio.gather(*(
+                self._take_shared(key, capacity, period) for _, key, capacity, period in buckets
+            ))
+        except Exception as e:
+            self.stats["shared_errors"] += 1
+            logging.warning(f"Shared rate limit check failed, allowing request: {str(e)}")
+            return results
+        if not all(allowed for allowed, _ in shared):
+            # Undo everywhere: locally (keeping local buckets a lower bound of what was
+            # really spent) and in the shared buckets that did hand out a token
+            refunds = []
+            for (_, key, capacity, _), (allowed, _) in zip(buckets, shared):
+                self.local.refund(key, capacity)
+                if allowed:
+                    refunds.append(self._refund_shared(key, capacity))
+            await asyncio.gather(*refunds, return_exceptions=True)
+        return [
+            (scope, capacity, period, allowed, tokens)
+            for (scope, _, capacity, period), (allowed, tokens) in zip(buckets, shared)
+        ]
+    
+    def snapshot(self) -> Dict[str, Any]:
+        return {"backend": self.backend, "local_keys": len(self.local._buckets), **self.stats}
+
+rate_limiter = RateLimiter(RATE_LIMIT_BACKEND, RATE_LIMIT_MAX_KEYS)
+
+def client_ip(scope) -> str:
+    if RATE_LIMIT_TRUST_FORWARDED_FOR:
+        for name, value in scope.get("headers", []):
+            if name == b"x-forwarded-for":
+                return value.decode('latin-1').split(',')[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+async def request_username(scope, receive) -> Tuple[Optional[str], Any]:
+    """The `username` from the query string or JSON body, and a receive() that replays the body"""
+    query = scope.get("query_string", b"")
+    if b"username=" in query:
+        values = parse_qs(query.decode('latin-1')).get("username")
+        if values:
+            return values[0], receive
+    
+    messages = []
+    body = b""
+    while True:
+        message = await receive()
+        messages.append(message)
+        if message["type"] != "http.request":
+            break
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    
+    async def replay():
+        return messages.pop(0) if messages else await receive()
+    
+    try:
+        payload = json.loads(body) if body else None
+    except ValueError:
+        payload = None
+    username = payload.get("username") if isinstance(payload, dict) else None
+    return (username if isinstance(username, str) else None), replay
+
+def rate_limit_headers(capacity: float, period: float, tokens: float) -> List[Tuple[bytes, bytes]]:
+    """RateLimit-* headers (IETF draft) describing one bucket"""
+    remaining = max(0, math.floor(tokens))
+    rate = capacity / period
+    reset = (1 - tokens) / rate if tokens < 1 else (capacity - tokens) / rate
+    return [
+        (b"ratelimit-limit", str(int(capacity)).encode()),
+        (b"ratelimit-remaining", str(remaining).encode()),
+        (b"ratelimit-reset", str(math.ceil(reset)).encode()),
+        (b"ratelimit-policy", f"{int(capacity)};w={int(period)}".encode())
+    ]
+
+class RateLimitMiddleware:
+    """Reject over-limit calls to the rate-limited (LLM-backed) routes with 429 before they reach the app"""
+    
+    def __init__(self, app, limiter: Optional[RateLimiter] = None, policies: Optional[Dict[Tuple[str, str], Tuple[float, float]]] = None):
+        self.app = app
+        self.limiter = limiter or rate_limiter
+        self.policies = RATE_LIMITS if policies is None else policies
+        self.global_rate = parse_rate(RATE_LIMIT_GLOBAL) if RATE_LIMIT_GLOBAL else None
+    
+    async def __call__(self, scope, receive, send):
+        policy = self.policies.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+        if policy is None or not RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        
+        route = scope["path"]
+        capacity, period = policy
+        username, receive = await request_username(scope, receive)
+        buckets = []
+        if username:
+            buckets.append(("user", f"user:{route}:{username}", capacity, period))
+        buckets.append(("ip", f"ip:{route}:{client_ip(scope)}", capacity * RATE_LIMIT_IP_MULTIPLIER, period))
+        if self.global_rate:
+            buckets.append(("global", "global", *self.global_rate))
+        results = await self.limiter.take(buckets)
+        
+        # Report the bucket closest to running out (the one that did, if any)
+        scope_name, capacity, period, allowed, tokens = min(results, key=lambda result: (result[3], result[4] / result[1]))
+        headers = rate_limit_headers(capacity, period, tokens)
+        self.limiter.stats["allowed" if allowed else "rejected"] += 1
+        if not allowed:
+            metrics.inc("rate_limit_rejections_total", {"route": route, "bucket": scope_name})
+            retry_after = math.ceil((1 - tokens) * period / capacity)
+            body = json.dumps({"detail": "Too many requests, please slow down"}).encode('utf-8')
+            await send({
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(max(1, retry_after)).encode()),
+                    *headers
+                ]
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+        
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + headers
+            await send(message)
+        
+        await self.app(scope, receive, send_with_headers)
+
+# ===== PROMPTS =====
+
+class TokenCounter:
+    """Local token counts: tiktoken when it's installed, otherwise about four characters per token"""
+    
+    def __init__(self, encoding_name: str):
+        self.encoding_name = encoding_name
+        # Set by load(); until then counts are estimated
+        self.encoding = None
+    
+    def load(self):
+        """Load the tiktoken encoding. Blocking: tiktoken downloads the encoding file on first use, which can hang offline"""
+        if tiktoken is None:
+            return
+        try:
+            self.encoding = tiktoken.get_encoding(self.encoding_name)
+        except Exception as e:
+            logging.warning(f"tiktoken encoding {self.encoding_name} unavailable, estimating tokens: {str(e)}")
+    
+    def count(self, text: str) -> int:
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return math.ceil(len(text) / 4)
+    
+    def head(self, text: str, max_tokens: int) -> str:
+        """Longest prefix within max_tokens, cut back to a word boundary"""
+        if self.encoding is not None:
+            prefix = self.encoding.decode(self.encoding.encode(text, disallowed_special=())[:max_tokens])
+        else:
+            prefix = text[:max_tokens * 4]
+        # A cut through a multi-byte character decodes to a replacement character
+        prefix = prefix.rstrip('\ufffd')
+        if len(prefix) < len(text) and not text[len(prefix)].isspace() and ' ' in prefix:
+            prefix = prefix.rsplit(' ', 1)[0]
+        return prefix.rstrip()
+    
+    def tail(self, text: str, max_tokens: int) -> str:
+        """Longest suffix within max_tokens, cut forward to a word boundary"""
+        if max_tokens <= 0:
+            return ""
+        if self.encoding is not None:
+            suffix = self.encoding.decode(self.encoding.encode(text, disallowed_special=())[-max_tokens:])
+        else:
+            suffix = text[-max_tokens * 4:]
+        suffix = suffix.lstrip('\ufffd')
+        if len(suffix) < len(text) and not text[-len(suffix) - 1].isspace() and ' ' in suffix:
+            suffix = suffix.split(' ', 1)[1]
+        return suffix.lstrip()
+    
+    def fit(self, text: str, max_tokens: int, strategy: str = "head") -> str:
+        """Deterministically shorten text to max_tokens, keeping its start, its end, or both"""
+        if self.count(text) <= max_tokens:
+            return text
+        if strategy == "tail":
+            return f"[...] {self.tail(text, max_tokens)}"
+        if strategy == "head_tail":
+            head_tokens = max_tokens * 2 // 3
+            return f"{self.head(text, head_tokens)} [...] {self.tail(text, max_tokens - head_tokens)}"
+        return f"{self.head(text, max_tokens)} [...]"
+
+token_counter = TokenCounter(TOKEN_ENCODING)
+
+class PromptTemplate:
+    """System message and user text templates, parsed once, with per-field token budgets
+
+    Fields use str.format syntax ({{ and }} for literal braces). Budgeted
+    fields are trimmed with TokenCounter.fit before substitution, so the
+    same inputs always produce the same prompt (and share single-flight keys).
+    """
+    
+    def __init__(self, name: str, system: str, user: str, budgets: Optional[Dict[str, Tuple[int, str]]] = None,
+                 max_output_tokens: int = 1000):
+        self.name = name
+        self.system_parts = self._compile(system)
+        self.user_parts = self._compile(user)
+        self.budgets = budgets or {}
+        self.max_output_tokens = max_output_tokens
+        self.fields = {field for _, field in self.system_parts + self.user_parts if field}
+        unknown = set(self.budgets) - self.fields
+        if unknown:
+            raise ValueError(f"Prompt {name} budgets unknown fields: {sorted(unknown)}")
+    
+    @staticmethod
+    def _compile(template: str) -> List[Tuple[str, Optional[str]]]:
+        return [(literal, field) for literal, field, _, _ in string.Formatter().parse(template)]
+    
+    @staticmethod
+    def _join(parts: List[Tuple[str, Optional[str]]], values: Dict[str, str]) -> str:
+        return "".join(literal + (values[field] if field else "") for literal, field in parts)
+    
+    def render(self, **fields: Any) -> Tuple[str, str]:
+        """Fill both templates, trimming fields that exceed their budget; returns (system_message, text)"""
+        values = {name: str(value) for name, value in fields.items()}
+        for name, (max_tokens, strategy) in self.budgets.items():
+            fitted = token_counter.fit(values[name], max_tokens, strategy)
+            if fitted != values[name]:
+                metrics.inc("llm_prompt_trimmed_total", {"prompt": self.name, "field": name})
+                values[name] = fitted
+        return self._join(self.system_parts, values), self._join(self.user_parts, values)
+
+COURSE_FIELD_BUDGETS = {
+    "topic": (PROMPT_TOPIC_TOKENS, "head"),
+    "learning_goal": (PROMPT_GOAL_TOKENS, "head")
+}
+
+COURSE_PROMPT = PromptTemplate(
+    "course_gen",
+    system="""You are an expert educational content creator. Generate a personalized learning course for {username}.
+    
+Topic: {topic}
+Skill Level: {skill_level}
+Learning Goal: {learning_goal}
+
+Create a course with 5 progressive modules. Each module should:
+1. Have a clear, engaging title
+2. Contain simple explanations (2-3 paragraphs, beginner-friendly language)
+3. Include 2-3 practical examples
+4. List 3-4 key takeaway points
+
+Make content adaptive to the skill level and use encouraging, friendly language.
+Format your response as JSON with this structure:
+{{
+    "modules": [
+        {{
+            "title": "Module title",
+            "content": "Detailed explanation...",
+            "examples": ["Example 1", "Example 2"],
+            "key_points": ["Point 1", "Point 2", "Point 3"]
+        }}
+    ]
+}}
+""",
+    user="Generate a complete {skill_level} level course on '{topic}' with 5 modules. Return only valid JSON.",
+    budgets=COURSE_FIELD_BUDGETS,
+    max_output_tokens=4000
+)
+
+COURSE_OUTLINE_PROMPT = PromptTemplate(
+    "course_outline",
+    system="""You are an expert educational content creator planning a personalized learning course for {username}.
+
+Topic: {topic}
+Skill Level: {skill_level}
+Learning Goal: {learning_goal}
+
+Plan 5 progressive modules, each with a clear, engaging title.
+Return ONLY valid JSON with this structure:
+{{
+    "titles": ["Module 1 title", "Module 2 title", "Module 3 title", "Module 4 title", "Module 5 title"]
+}}
+""",
+    user="Plan a {skill_level} level course on '{topic}' with 5 modules. Return only valid JSON.",
+    budgets=COURSE_FIELD_BUDGETS,
+    max_output_tokens=200
+)
+
+COURSE_MODULE_PROMPT = PromptTemplate(
+    "course_module",
+    system="""You are an expert educational content creator writing a personalized learning course for {username}.
+
+Topic: {topic}
+Skill Level: {skill_level}
+Learning Goal: {learning_goal}
+
+Course outline:
+{outline}
+
+Write module {number}: "{title}". The module should:
+1. Contain simple explanations (2-3 paragraphs, beginner-friendly language)
+2. Include 2-3 practical examples
+3. List 3-4 key takeaway points
+
+Make content adaptive to the skill level and use encouraging, friendly language.
+Return ONLY valid JSON with this structure:
+{{
+    "title": "{title}",
+    "content": "Detailed explanation...",
+    "examples": ["Example 1", "Example 2"],
+    "key_points": ["Point 1", "Point 2", "Point 3"]
+}}
+""",
+    user="Write module {number}. Return only valid JSON.",
+    budgets=COURSE_FIELD_BUDGETS,
+    max_output_tokens=1000
+)
+
+QUIZ_PROMPT = PromptTemplate(
+    "quiz_gen",
+    system="""You are a quiz generator. Create 5 multiple-choice questions based on the module content.
+    
+Module: {title}
+Content: {content}
+
+Generate questions that test understanding, not just memorization. Each question should have 4 options with only one correct answer.
+
+Return ONLY valid JSON with this exact structure:
+{{
+    "questions": [
+        {{
+            "question": "Question text?",
+            "options": ["Option A", "Option B", "Option C", "Option D"],
+            "correct_answer": 0
+        }}
+    ]
+}}
+""",
+    user="Generate 5 quiz questions. Return only valid JSON.",
+    budgets={"content": (PROMPT_MODULE_CONTENT_TOKENS, "head")},
+    max_output_tokens=800
+)
+
+SIMPLIFY_PROMPT = PromptTemplate(
+    "simplify",
+    system="""You are an expert at simplifying complex topics. Rewrite this module to be even simpler for {username}.
+
+Original Module: {title}
+Original Content: {content}
+
+Make it:
+- Use simpler words
+- Add more examples
+- Break down concepts step-by-step
+- Use analogies and real-world connections
+
+Return ONLY valid JSON:
+{{
+    "title": "Same title",
+    "content": "Simplified explanation...",
+    "examples": ["Example 1", "Example 2", "Example 3"],
+    "key_points": ["Point 1", "Point 2", "Point 3"]
+}}
+""",
+    user="Simplify this module. Return only valid JSON.",
+    budgets={"content": (PROMPT_MODULE_CONTENT_TOKENS, "head")},
+    max_output_tokens=1000
+)
+
+TEACHING_PROMPT = PromptTemplate(
+    "teaching",
+    system="""You are evaluating {username}'s understanding of: {title}
+
+Original content: {content}
+Their explanation: {explanation}
+
+Provide:
+1. Encouraging feedback (2-3 sentences)
+2. Quality score (1-10)
+3. 2-3 specific suggestions for improvement
+4. Whether they can proceed (true/false)
+
+Return ONLY valid JSON:
+{{
+    "feedback": "Great effort, {username}!...",
+    "quality_score": 8,
+    "suggestions": ["Suggestion 1", "Suggestion 2"],
+    "can_proceed": true
+}}
+""",
+    user="Evaluate this explanation. Return only valid JSON.",
+    budgets={
+        "content": (PROMPT_MODULE_CONTENT_TOKENS, "head"),
+        # Learners often put their conclusion last, so keep both ends
+        "explanation": (PROMPT_EXPLANATION_TOKENS, "head_tail")
+    },
+    max_output_tokens=300
+)
+
+TUTOR_PROMPT = PromptTemplate(
+    "tutor",
+    system="""You are a friendly, encouraging AI tutor helping {username} learn.
+    
+Your role:
+- Answer questions clearly and simply
+- Provide hints, not direct answers to quiz questions
+- Use encouraging, motivating language
+- Keep responses concise (2-3 sentences)
+- Adapt to the learner's level
+
+Context: {context}
+{context_info}
+{history}
+Always address {username} by name and be supportive!
+""",
+    user="{message}",
+    budgets={
+        "context": (20, "head"),
+        # The newest turns matter most, so an oversized history loses its oldest lines
+        "history": (TUTOR_HISTORY_TOKENS, "tail"),
+        "message": (PROMPT_TUTOR_MESSAGE_TOKENS, "head_tail")
+    },
+    max_output_tokens=200
+)
+
+# Output budgets by call site; LlmChat takes no max-tokens setting, so these are monitored, not enforced
+LLM_OUTPUT_BUDGETS = {
+    "course_gen": COURSE_PROMPT.max_output_tokens,
+    "course_outline": COURSE_OUTLINE_PROMPT.max_output_tokens,
+    "course_module": COURSE_MODULE_PROMPT.max_output_tokens,
+    "quiz_gen": QUIZ_PROMPT.max_output_tokens,
+    "quiz_prewarm": QUIZ_PROMPT.max_output_tokens,
+    "simplify": SIMPLIFY_PROMPT.max_output_tokens,
+    "simplify_prewarm": SIMPLIFY_PROMPT.max_output_tokens,
+    "teaching": TEACHING_PROMPT.max_output_tokens,
+    "tutor": TUTOR_PROMPT.max_output_tokens
+}
+
+# ===== COURSE BLUEPRINTS =====
+
+# Stands in for the learner's name in prompts whose output is shared; replaced locally per learner
+BLUEPRINT_LEARNER_TOKEN = "LEARNER_NAME"
+
+def normalize_blueprint_field(value: str) -> str:
+    return " ".join(value.casefold().split()).strip(" .!?")
+
+def blueprint_key(request: CourseRequest) -> Optional[str]:
+    """Cache key for the course a request would generate, ignoring who asked; None when caching is off"""
+    if not COURSE_BLUEPRINT_CACHE_ENABLED:
+        return None
+    fields = (request.topic, request.skill_level, request.learning_goal or 'General understanding')
+    normalized = "\x00".join(normalize_blueprint_field(field) for field in fields)
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+def prompt_learner_name(request: CourseRequest) -> str:
+    """Name to put in course prompts: the placeholder when the result may be shared"""
+    return BLUEPRINT_LEARNER_TOKEN if COURSE_BLUEPRINT_CACHE_ENABLED else request.username
+
+def personalize_text(text: str, username: str) -> str:
+    return text.replace(BLUEPRINT_LEARNER_TOKEN, username)
+
+def personalize_module(module: Dict[str, Any], username: str) -> Module:
+    """A learner's copy of a blueprint module: a fresh id and their name filled in"""
+    return Module(
+        title=personalize_text(module['title'], username),
+        content=personalize_text(module['content'], username),
+        examples=[personalize_text(example, username) for example in module['examples']],
+        key_points=[personalize_text(point, username) for point in module['key_points']]
+    )
+
+async def claim_course_blueprint(key: str) -> Optional[Dict[str, Any]]:
+    """Take one use of a cached blueprint, unless it has been handed out COURSE_BLUEPRINT_MAX_USES times"""
+    blueprint = await db.course_blueprints.find_one_and_update(
+        {"key": key, "uses": {"$lt": COURSE_BLUEPRINT_MAX_USES}},
+        {"$inc": {"uses": 1}, "$set": {"last_used_at": datetime.now(timezone.utc)}},
+        projection={"_id": 0, "modules": 1}
+    )
+    metrics.inc("course_blueprint_requests_total", {"result": "hit" if blueprint else "miss"})
+    return blueprint
+
+async def save_course_blueprint(key: str, request: CourseRequest, modules: List[Module]):
+    """Store freshly generated modules as the blueprint for their key, replacing a stale or used-up one"""
+    now = datetime.now(timezone.utc)
+    await db.course_blueprints.replace_one({"key": key}, {
+        "key": key,
+        "topic": request.topic,
+        "skill_level": request.skill_level,
+        "learning_goal": request.learning_goal,
+        "modules": [module.model_dump(exclude={"id"}) for module in modules],
+        "uses": 1,  # the learner it was generated for
+        "created_at": now,
+        "last_used_at": now
+    }, upsert=True)
+    await evict_course_blueprints()
+
+async def evict_course_blueprints():
+    """Drop the least recently used blueprints beyond COURSE_BLUEPRINT_MAX_ENTRIES"""
+    excess = await db.course_blueprints.estimated_document_count() - COURSE_BLUEPRINT_MAX_ENTRIES
+    if excess <= 0:
+        return
+    stale = await db.course_blueprints.find({}, {"_id": 1}).sort("last_used_at", 1).limit(excess).to_list(None)
+    await db.course_blueprints.delete_many({"_id": {"$in": [doc['_id'] for doc in stale]}})
+
+async def generate_course_modules(request: CourseRequest) -> List[Module]:
+    """Modules for a new course: a copy of the shared blueprint when there is one, otherwise from the LLM"""
+    key = blueprint_key(request)
+    if key:
+        blueprint = await claim_course_blueprint(key)
+        if blueprint:
+            return [personalize_module(module, request.username) for module in blueprint['modules']]
+    
+    system_message, prompt = COURSE_PROMPT.render(
+        username=prompt_learner_name(request),
+        topic=request.topic,
+        skill_level=request.skill_level,
+        learning_goal=request.learning_goal or 'General understanding'
+    )
+    response = await ask_llm(system_message, f"course_gen_{request.username}_{uuid.uuid4()}", prompt, "course_gen")
+    modules = parse_llm_model(response, GeneratedCourse).modules
+    if not key:
+        return modules
+    await save_course_blueprint(key, request, modules)
+    return [personalize_module(module.model_dump(), request.username) for module in modules]
+
+# ===== LEARNER STATS =====
+
+def activity_day(timestamp: datetime) -> str:
+    """UTC calendar day of an event ("YYYY-MM-DD"); rollups and streaks are kept per UTC day"""
+    return timestamp.astimezone(timezone.utc).date().isoformat()
+
+def user_level(modules_passed: int) -> int:
+    return 1 + modules_passed // USER_LEVEL_MODULES
+
+def effective_streak(current_streak: int, last_active_day: Optional[str]) -> int:
+    """The stored streak as of today: it lapses once a whole UTC day goes by without activity"""
+    yesterday = activity_day(datetime.now(timezone.utc) - timedelta(days=1))
+    return current_streak if last_active_day and last_active_day >= yesterday else 0
+
+def learning_event(timestamp: datetime, time_spent: Optional[float], result: Optional[QuizResult] = None,
+                   first_attempt: bool = False, first_pass: bool = False) -> Dict[str, Any]:
+    """One quiz attempt (with its result) or teaching submission, as counted in rollups and user stats"""
+    event = {
+        "day": activity_day(timestamp),
+        "time_on_task_seconds": min(max(time_spent or 0.0, 0.0), ROLLUP_MAX_TIME_ON_TASK_SECONDS)
+    }
+    if result is not None:
+        event.update(percentage=result.percentage, passed=result.passed,
+                     first_attempt=first_attempt, first_pass=first_pass)
+    return event
+
+def rollup_increments(events: List[Dict[str, Any]]) -> Dict[str, float]:
+    """$inc for a daily_rollups document from one day's events"""
+    quizzes = [event for event in events if 'percentage' in event]
+    return {
+        "quiz_attempts": len(quizzes),
+        "quiz_passes": sum(1 for event in quizzes if event['passed']),
+        "percentage_sum": sum(event['percentage'] for event in quizzes),
+        "modules_first_passed": sum(1 for event in quizzes if event['first_pass']),
+        "teaching_submissions": len(events) - len(quizzes),
+        "time_on_task_seconds": sum(event['time_on_task_seconds'] for event in events)
+    }
+
+def user_stats_update(day: str, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Update pipeline folding one day's events into the user's counters, streak and level
+
+    An event on the day after last_active_day extends the streak, one on the
+    same day (or an older day, from a late offline sync) keeps it, and any
+    other day starts a new one.
+    """
+    increments = rollup_increments(events)
+    counters = {
+        "quiz_attempts": increments['quiz_attempts'],
+        "quiz_percentage_sum": increments['percentage_sum'],
+        "modules_attempted": sum(1 for event in events if event.get('first_attempt')),
+        "total_modules_completed": increments['modules_first_passed'],
+        "teaching_submissions": increments['teaching_submissions'],
+        "time_on_task_seconds": increments['time_on_task_seconds'],
+        "version": 1
+    }
+    previous_day = (datetime.fromisoformat(day) - timedelta(days=1)).date().isoformat()
+    last_day = {"$ifNull": ["$last_active_day", ""]}
+    streak = {"$ifNull": ["$current_streak", 0]}
+    fields = {
+        field: {"$add": [{"$ifNull": [f"${field}", 0]}, amount]}
+        for field, amount in counters.items()
+    }
+    fields.update({
+        "current_streak": {"$switch": {
+            "branches": [
+                {"case": {"$lte": [day, last_day]}, "then": streak},
+                {"case": {"$eq": [last_day, previous_day]}, "then": {"$add": [streak, 1]}}
+            ],
+            "default": 1
+        }},
+        "last_active_day": {"$max": [last_day, day]}
+    })
+    percentages = [event['percentage'] for event in events if 'percentage' in event]
+    if percentages:
+        fields["best_percentage"] = {"$max": [{"$ifNull": ["$best_percentage", 0]}, max(percentages)]}
+    return [
+        {"$set": fields},
+        {"$set": {
+            "longest_streak": {"$max": [{"$ifNull": ["$longest_streak", 0]}, "$current_streak"]},
+            "level": {"$add": [1, {"$floor": {"$divide": ["$total_modules_completed", USER_LEVEL_MODULES]}}]}
+        }}
+    ]
+
+async def upsert_rollups(ops: List[UpdateOne]):
+    """Apply daily rollup upserts, retrying the ones a concurrent upsert beat to the insert"""
+    try:
+        await db.daily_rollups.bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details['writeErrors']
+        if any(error.get('code') != 11000 for error in errors):
+            raise
+        await db.daily_rollups.bulk_write([ops[error['index']] for error in errors], ordered=False)
+
+async def record_learning_events(username: str, events: List[Dict[str, Any]]):
+    """Fold a learner's quiz and teaching events into their daily rollups and user stats
+
+    One rollup upsert and one user update per day touched, whatever the
+    length of the learner's history; user updates go in day order so the
+    streak advances correctly.
+    """
+    by_day: Dict[str, List[Dict[str, Any]]] = {}
+    for event in events:
+        by_day.setdefault(event['day'], []).append(event)
+    days = sorted(by_day)
+    if not days:
+        return
+    await asyncio.gather(
+        upsert_rollups([
+            UpdateOne({"username": username, "day": day}, {"$inc": rollup_increments(by_day[day])}, upsert=True)
+            for day in days
+        ]),
+        db.users.bulk_write([
+            UpdateOne({"username": username}, user_stats_update(day, by_day[day]))
+            for day in days
+        ], ordered=True)
+    )
+    user_cache.invalidate(username)
+    quizzes = sum(1 for event in events if 'percentage' in event)
+    if quizzes:
+        metrics.inc("learning_events_total", {"type": "quiz"}, quizzes)
+    if len(events) > quizzes:
+        metrics.inc("learning_events_total", {"type": "teaching"}, len(events) - quizzes)
+
+def learner_summary(user: Dict[str, Any]) -> Dict[str, Any]:
+    """Dashboard summary straight from the counters kept on the user document"""
+    attempts = user.get('quiz_attempts', 0)
+    return {
+        "modules_attempted": user.get('modules_attempted', 0),
+        "modules_passed": user.get('total_modules_completed', 0),
+        "total_attempts": attempts,
+        "average_percentage": round(user.get('quiz_percentage_sum', 0) / attempts, 1) if attempts else 0,
+        "best_percentage": round(user.get('best_percentage', 0), 1),
+        "teaching_submissions": user.get('teaching_submissions', 0),
+        "time_on_task_seconds": round(user.get('time_on_task_seconds', 0)),
+        "current_streak": user.get('current_streak', 0),
+        "longest_streak": user.get('longest_streak', 0)
+    }
+
+def daily_score(rollup: Dict[str, Any]) -> Dict[str, Any]:
+    """One day of the dashboard's score series from its rollup"""
+    attempts = rollup.get('quiz_attempts', 0)
+    return {
+        "date": rollup['day'],
+        "modules": attempts,
+        "passed": rollup.get('quiz_passes', 0),
+        # None on days with only teaching activity
+        "average_percentage": round(rollup.get('percentage_sum', 0) / attempts, 1) if attempts else None,
+        "teaching_submissions": rollup.get('teaching_submissions', 0),
+        "time_on_task_seconds": round(rollup.get('time_on_task_seconds', 0))
+    }
+
+# ===== API ENDPOINTS =====
+
+@api_router.post("/user/register", response_model=User)
+async def register_user(username: str):
+    """Register a new user or return existing"""
+    existing_user = await db.users.find_one({"username": username}, {"_id": 0})
+    if existing_user:
+        return User(**existing_user)
+    
+    user = User(username=username)
+    await db.users.insert_one(user.model_dump())
+    return user
+
+@api_router.get("/user/{username}", response_model=User)
+async def get_user(username: str, request: Request, response: Response):
+    """Get user profile"""
+    user = user_cache.get(username)
+    if user is None:
+        token = user_cache.token()
+        doc = await db.users.find_one({"username": username}, {"_id": 0})
+        if not doc:
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        user = User(**{"version": 0, **doc})
+        user_cache.set(username, user, token)
+    
+    # The streak lapses with the calendar, not with a write, so it's part of the ETag
+    streak = effective_streak(user.current_streak, user.last_active_day)
+    if streak != user.current_streak:
+        user = user.model_copy(update={"current_streak": streak})
+    etag = document_etag("user", f"{username}:{streak}", user.version)
+    # no-cache lets browsers keep the body but revalidate it with If-None-Match every time
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return user
+
+async def create_course(request: CourseRequest, course_id: Optional[str] = None,
+                        modules: Optional[List[Module]] = None) -> Course:
+    """Generate a complete course (or copy its shared blueprint) and save it
+
+    Passing a fixed course_id makes the save idempotent, so a retried job
+    never creates a second copy of the course.
+    """
+    
+    if modules is None:
+        modules = await generate_course_modules(request)
+    course = Course(
+        username=request.username,
+        topic=request.topic,
+        skill_level=request.skill_level,
+        learning_goal=request.learning_goal,
+        modules=modules
+    )
+    if course_id:
+        course.id = course_id
+    
+    # Save to database: bodies first, so the course never lists a module it can't load
+    doc = course.model_dump()
+    modules = doc['modules']
+    await save_module_bodies(course.id, modules)
+    doc['modules'] = [module_stub(module) for module in modules]
+    result = await db.courses.replace_one({"id": course.id}, doc, upsert=True)
+    course_cache.invalidate(course.id)
+    
+    # Update user stats (only the first time this course id is saved)
+    if result.upserted_id is not None:
+        await db.users.update_one(
+            {"username": request.username},
+            {"$inc": {"total_courses": 1, "version": 1}}
+        )
+        user_cache.invalidate(request.username)
+    
+    await save_course_index(course.id, modules)
+    
+    # The learner starts on module 1; have its quiz (and the next one) ready
+    schedule_quiz_prewarm(course.id, [module.id for module in course.modules[:2]])
+    
+    return course
+
+@api_router.post("/course/generate", response_model=Course)
+async def generate_course(request: CourseRequest):
+    """Generate a complete course with modules using AI"""
+    try:
+        return await create_course(request)
+        
+    except HTTPException:
+        raise
+        
+    except Exception as e:
+        logging.error(f"Course generation error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to generate course: {str(e)}")
+
+async def generate_course_outline(request: CourseRequest) -> List[str]:
+    """Ask the LLM for the module titles of a course (a short, fast call)"""
+    system_message, prompt = COURSE_OUTLINE_PROMPT.render(
+        username=prompt_learner_name(request),
+        topic=request.topic,
+        skill_level=request.skill_level,
+        learning_goal=request.learning_goal or 'General understanding'
+    )
+    response = await ask_llm(system_message, f"course_outline_{request.username}_{uuid.uuid4()}", prompt, "course_outline")
+    titles = parse_llm_model(response, CourseOutline).titles
+    if not titles:
+        raise ValueError("Course outline is empty")
+    return [str(title) for title in titles[:5]]
+
+async def generate_course_module(request: CourseRequest, titles: List[str], index: int) -> Module:
+    """Generate the body of one outlined module"""
+    outline = "\n".join(f"{i + 1}. {title}" for i, title in enumerate(titles))
+    system_message, prompt = COURSE_MODULE_PROMPT.render(
+        username=prompt_learner_name(request),
+        topic=request.topic,
+        skill_level=request.skill_level,
+        learning_goal=request.learning_goal or 'General understanding',
+        outline=outline,
+        number=index + 1,
+        title=titles[index]
+    )
+    response = await ask_llm(system_message, f"course_module_{request.username}_{uuid.uuid4()}", prompt, "course_module")
+    return parse_llm_model(response, Module)
+
+async def discard_course(course_id: str):
+    """Delete a partly generated course with its module bodies, prewarmed quizzes and retrieval index"""
+    await asyncio.gather(
+        db.courses.delete_one({"id": course_id}),
+        db.module_bodies.delete_many({"course_id": course_id}),
+        db.quizzes.delete_many({"course_id": course_id}),
+        db.course_indexes.delete_one({"course_id": course_id})
+    )
+    course_cache.invalidate(course_id)
+
+async def finish_streamed_course(request: CourseRequest, course_id: str, key: Optional[str],
+                                 generated: List[Module]):
+    """Bookkeeping once every module of a streamed course is saved"""
+    await db.users.update_one(
+        {"username": request.username},
+        {"$inc": {"total_courses": 1, "version": 1}}
+    )
+    user_cache.invalidate(request.username)
+    await rebuild_course_index(course_id)
+    if key:
+        await save_course_blueprint(key, request, generated)
 
-Provide:
-1. Encouraging feedback (2-3 sentences)
-2. Quality score (1-10)
-3. 2-3 specific suggestions for improvement
-4. Whether they can proceed (true/false)
+async def settle_streamed_course(request: CourseRequest, course_id: str, module_tasks: List[asyncio.Task],
+                                 keep: bool):
+    """Cleanup for a streamed course that stopped early: kept and marked incomplete once the learner has modules of it, deleted otherwise"""
+    # Also retrieves the cancelled tasks' exceptions
+    await asyncio.gather(*module_tasks, return_exceptions=True)
+    if not keep:
+        await discard_course(course_id)
+        return
+    await db.courses.update_one({"id": course_id}, {"$set": {"incomplete": True}, "$inc": {"version": 1}})
+    course_cache.invalidate(course_id)
+    # A partial course isn't reused as a blueprint
+    await finish_streamed_course(request, course_id, None, [])
 
-Return ONLY valid JSON:
-{{
-    "feedback": "Great effort, {submission.username}!...",
-    "quality_score": 8,
-    "suggestions": ["Suggestion 1", "Suggestion 2"],
-    "can_proceed": true
-}}
-"""
+# Fire-and-forget cleanups, referenced until they finish
+background_tasks: set = set()
+
+async def stream_course_events(request: CourseRequest) -> AsyncIterator[str]:
+    """Generate a course module-by-module, saving and emitting each one as it validates"""
+    course = Course(
+        username=request.username,
+        topic=request.topic,
+        skill_level=request.skill_level,
+        learning_goal=request.learning_goal
+    )
+    module_tasks: List[asyncio.Task] = []
+    saved = completed = sent_module = False
+    key = blueprint_key(request)
+    
+    try:
+        blueprint = await claim_course_blueprint(key) if key else None
+        if blueprint:
+            # Nothing to wait for: save the learner's copy, then emit it in the usual event order
+            modules = [personalize_module(module, request.username) for module in blueprint['modules']]
+            course = await create_course(request, modules=modules)
+            course_info = course.model_dump(mode="json", exclude={"modules"})
+            course_info['modules'] = []
+            course_info['module_titles'] = [module.title for module in modules]
+            yield sse_event("course", course_info)
+            for index, module in enumerate(modules):
+                yield sse_event("module", {"index": index, "module": module.model_dump()})
+            yield sse_event("done", {"course_id": course.id, "module_count": len(modules)})
+            return
+        
+        titles = await generate_course_outline(request)
+        
+        # Module bodies are generated concurrently but emitted in course order
+        module_tasks = [
+            asyncio.create_task(generate_course_module(request, titles, index))
+            for index in range(len(titles))
+        ]
+        
+        await db.courses.insert_one(course.model_dump())
+        saved = True
+        
+        course_info = course.model_dump(mode="json")
+        course_info['module_titles'] = [personalize_text(title, request.username) for title in titles]
+        yield sse_event("course", course_info)
+        
+        generated: List[Module] = []
+        for index, task in enumerate(module_tasks):
+            generated.append(await task)
+            module = personalize_module(generated[-1].model_dump(), request.username)
+            await save_module_bodies(course.id, [module.model_dump()])
+            await db.courses.update_one(
+                {"id": course.id},
+                {"$push": {"modules": module_stub(module.model_dump())}, "$inc": {"version": 1}}
+            )
+            course_cache.invalidate(course.id)
+            if index < 2:
+                schedule_quiz_prewarm(course.id, [module.id])
+            sent_module = True
+            yield sse_event("module", {"index": index, "module": module.model_dump()})
+        
+        # Every module is saved: the course stays, and its bookkeeping finishes even if the client leaves now
+        completed = True
+        await asyncio.shield(finish_streamed_course(request, course.id, key, generated))
+        yield sse_event("done", {"course_id": course.id, "module_count": len(titles)})
+        
+    except Exception as e:
+        logging.error(f"Course streaming error: {str(e)}")
+        if isinstance(e, HTTPException):
+            yield sse_event("error", {"detail": e.detail, "status": e.status_code, "headers": e.headers})
+        else:
+            yield sse_event("error", {"detail": f"Failed to generate course: {str(e)}"})
+        
+    finally:
+        # Also covers the client disconnecting mid-stream, which cancels this generator:
+        # a half-built course is settled from a task of its own so the cleanup isn't cancelled too.
+        # The client starts learning on the first module, so from then on the course is kept
+        for task in module_tasks:
+            task.cancel()
+        if saved and not completed:
+            cleanup = asyncio.create_task(settle_streamed_course(request, course.id, module_tasks, keep=sent_module))
+            background_tasks.add(cleanup)
+            cleanup.add_done_callback(background_tasks.discard)
+        elif not completed:
+            # Nothing saved to settle; the gathered future still retrieves the cancelled tasks' exceptions
+            asyncio.gather(*module_tasks, return_exceptions=True)
+
+@api_router.post("/course/generate/stream")
+async def generate_course_stream(request: CourseRequest):
+    """Generate a course, streaming each module as a Server-Sent Event"""
+    return StreamingResponse(
+        stream_course_events(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# ===== COURSE GENERATION JOBS =====
+
+async def claim_course_job() -> Optional[Dict[str, Any]]:
+    """Atomically claim the oldest ready queued job, or a running one whose worker stopped renewing its lease"""
+    now = datetime.now(timezone.utc)
+    return await db.course_jobs.find_one_and_update(
+        {"$or": [
+            # $not also matches jobs without not_before
+            {"status": "queued", "not_before": {"$not": {"$gt": now}}},
+            {"status": "running", "lease_expires_at": {"$lt": now}, "attempts": {"$lt": COURSE_JOB_MAX_ATTEMPTS}}
+        ]},
+        {
+            "$set": {
+                "status": "running",
+                "updated_at": now,
+                "lease_expires_at": now + timedelta(seconds=COURSE_JOB_LEASE_SECONDS)
+            },
+            "$inc": {"attempts": 1}
+        },
+        sort=[("created_at", 1)],
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+
+async def fail_abandoned_course_jobs():
+    """Fail jobs whose worker stopped renewing the lease on their last allowed attempt"""
+    now = datetime.now(timezone.utc)
+    await db.course_jobs.update_many(
+        {"status": "running", "lease_expires_at": {"$lt": now}, "attempts": {"$gte": COURSE_JOB_MAX_ATTEMPTS}},
+        {"$set": {"status": "failed", "error": "Generation stopped responding on every attempt", "updated_at": now}}
+    )
+
+def course_job_backoff(attempts: int) -> float:
+    """Seconds to wait before retrying a job that has failed `attempts` times"""
+    return min(COURSE_JOB_RETRY_MAX_SECONDS, COURSE_JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+
+async def renew_course_job_lease(job_id: str):
+    """Keep extending a running job's lease so other workers don't take it over"""
+    while True:
+        await asyncio.sleep(COURSE_JOB_LEASE_SECONDS / 3)
+        now = datetime.now(timezone.utc)
+        await db.course_jobs.update_one(
+            {"id": job_id, "status": "running"},
+            {"$set": {"lease_expires_at": now + timedelta(seconds=COURSE_JOB_LEASE_SECONDS)}}
+        )
+
+async def run_course_job(job: Dict[str, Any]):
+    """Generate the course for one claimed job and record the outcome"""
+    lease_task = asyncio.create_task(renew_course_job_lease(job['id']))
+    try:
+        course = await create_course(CourseRequest(**job['request']), course_id=job['course_id'])
+        update = {"status": "done", "course_id": course.id, "error": None}
+    except asyncio.CancelledError:
+        # Shutting down; the lease expires and another worker resumes the job
+        raise
+    except Exception as e:
+        logging.error(f"Course job {job['id']} failed (attempt {job['attempts']}): {str(e)}")
+        error = e.detail if isinstance(e, HTTPException) else str(e)
+        update = {"status": "failed", "error": error}
+        if job['attempts'] < COURSE_JOB_MAX_ATTEMPTS:
+            # Back off so a failing provider isn't hammered; idle workers pick it up once it's due
+            retry_at = datetime.now(timezone.utc) + timedelta(seconds=course_job_backoff(job['attempts']))
+            update.update(status="queued", not_before=retry_at)
+    finally:
+        lease_task.cancel()
+    
+    update["updated_at"] = datetime.now(timezone.utc)
+    await db.course_jobs.update_one({"id": job['id']}, {"$set": update})
+
+async def course_job_worker(worker_index: int):
+    """Process course generation jobs until the app shuts down"""
+    while True:
+        try:
+            course_job_wakeup.clear()
+            job = await claim_course_job()
+            if job is None:
+                await fail_abandoned_course_jobs()
+                # Woken early by a local submit; the timeout picks up jobs from other nodes
+                try:
+                    await asyncio.wait_for(course_job_wakeup.wait(), COURSE_JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await run_course_job(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Course job worker {worker_index} error: {str(e)}")
+            await asyncio.sleep(COURSE_JOB_POLL_SECONDS)
+
+@api_router.post("/course/jobs", response_model=CourseJob, status_code=202)
+async def submit_course_job(request: CourseRequest):
+    """Queue a course for background generation and return its job id immediately"""
+    job = CourseJob(request=request)
+    await db.course_jobs.insert_one(job.model_dump())
+    course_job_wakeup.set()
+    return job
+
+@api_router.get("/course/jobs/{job_id}", response_model=CourseJob)
+async def get_course_job(job_id: str):
+    """Get the status of a course generation job"""
+    job = await db.course_jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return CourseJob(**job)
+
+async def find_cached_quiz(module_id: str, content_hash: Optional[str]) -> Optional[Quiz]:
+    """The stored quiz for a module, if it was generated from the current content (any content for None)"""
+    query = {"module_id": module_id} if content_hash is None else {"module_id": module_id, "content_hash": content_hash}
+    cached_quiz = await db.quizzes.find_one(
+        query,
+        {"_id": 0, "questions": 1}
+    )
+    return Quiz(module_id=module_id, questions=cached_quiz['questions']) if cached_quiz else None
+
+async def get_or_create_quiz(course_id: str, module: Dict[str, Any], call_site: str = "quiz_gen") -> Quiz:
+    """Serve the stored quiz while the module content is unchanged, generating it otherwise"""
+    module_id = module['id']
+    content_hash = module_content_hash(module)
+    cached_quiz = await find_cached_quiz(module_id, content_hash)
+    if cached_quiz:
+        return cached_quiz
+    
+    system_message, prompt = QUIZ_PROMPT.render(title=module['title'], content=module['content'])
+    
+    try:
+        response = await ask_llm(system_message, f"quiz_gen_{module_id}", prompt, call_site)
+    except LLMUnavailableError:
+        # A quiz on the module's previous content beats no quiz; its answer key is what submit grades against
+        stale_quiz = await find_cached_quiz(module_id, None)
+        if stale_quiz is None:
+            raise
+        llm_resilience.record_fallback(call_site)
+        return stale_quiz
+    
+    questions = parse_llm_model(response, GeneratedQuiz).questions
+    
+    # Keep one quiz per module; a new content hash replaces the old answer key
+    await db.quizzes.update_one(
+        {"module_id": module_id},
+        {"$set": {
+            "course_id": course_id,
+            "content_hash": content_hash,
+            "questions": [q.model_dump() for q in questions],
+            "created_at": datetime.now(timezone.utc)
+        }},
+        upsert=True
+    )
+    
+    return Quiz(module_id=module_id, questions=questions)
+
+async def prewarm_quiz(course_id: str, module_id: str):
+    """Generate a module's quiz ahead of the learner reaching it"""
+    course = await find_course_module(course_id, module_id)
+    if not course or not course.get('modules'):
+        return
+    module = course['modules'][0]
+    if await find_cached_quiz(module_id, module_content_hash(module)):
+        prewarmer.stats["cache_hits"] += 1
+        return
+    if prewarmer.try_spend():
+        await get_or_create_quiz(course_id, module, "quiz_prewarm")
+
+def schedule_quiz_prewarm(course_id: str, module_ids: List[str]):
+    for module_id in module_ids:
+        prewarmer.schedule(f"quiz:{module_id}", lambda module_id=module_id: prewarm_quiz(course_id, module_id))
+
+@api_router.post("/quiz/generate", response_model=PublicQuiz)
+async def generate_quiz(course_id: str, module_id: str):
+    """Generate quiz questions for a module"""
+    
+    module = await get_module_or_404(course_id, module_id)
+    
+    try:
+        return PublicQuiz.from_quiz(await get_or_create_quiz(course_id, module))
+        
+    except HTTPException:
+        raise
+        
+    except Exception as e:
+        logging.error(f"Quiz generation error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to generate quiz: {str(e)}")
+
+@api_router.post("/quiz/submit", response_model=QuizResult)
+async def submit_quiz(submission: QuizSubmission):
+    """Evaluate quiz submission"""
+    
+    # Score against the answer key stored when the quiz was generated
+    stored_quiz = await db.quizzes.find_one(
+        {"module_id": submission.module_id},
+        {"_id": 0, "course_id": 1, "questions.correct_answer": 1}
+    )
+    if not stored_quiz or stored_quiz.get('course_id') != submission.course_id:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+    
+    result = grade_quiz(
+        submission.username,
+        submission.answers,
+        [q['correct_answer'] for q in stored_quiz['questions']]
+    )
+    passed = result.passed
+    
+    # Upsert progress on the unique (username, module_id) key; the row as it
+    # was before says whether this is the module's first attempt or pass
+    now = datetime.now(timezone.utc)
+    previous = await upsert_progress(
+        {"username": submission.username, "module_id": submission.module_id},
+        quiz_progress_update(submission.course_id, result.score, result.total, passed, now)
+    ) or {}
+    await record_learning_events(submission.username, [learning_event(
+        now, submission.time_spent_seconds, result,
+        first_attempt=not previous.get('quiz_total'),
+        first_pass=passed and not previous.get('passed_at')
+    )])
+    if not passed:
+        # A failed learner is sent back to a simpler version of this module
+        prewarmer.schedule(
+            f"simplify:{submission.module_id}",
+            lambda: prewarm_simplified(submission.course_id, submission.module_id, submission.username)
+        )
+    
+    return result
+
+# ===== OFFLINE SYNC =====
+
+async def read_sync_body(request: Request) -> bytes:
+    """The request body, refused with a 413 as soon as it's known to pass SYNC_MAX_BODY_BYTES"""
+    too_large = HTTPException(status_code=413, detail=f"Sync batches are limited to {SYNC_MAX_BODY_BYTES} bytes")
+    declared = request.headers.get('content-length', '')
+    if declared.isdigit() and int(declared) > SYNC_MAX_BODY_BYTES:
+        raise too_large
+    # Counted as it arrives too, for chunked uploads and understated lengths
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > SYNC_MAX_BODY_BYTES:
+            raise too_large
+    return bytes(body)
+
+def parse_sync_body(body: bytes, content_type: str) -> List[Tuple[Any, Optional[str]]]:
+    """Split an NDJSON or JSON array body into (raw item, parse error) pairs"""
+    if 'ndjson' in content_type or 'jsonlines' in content_type:
+        items = []
+        for line in body.decode('utf-8', errors='replace').splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append((json.loads(line), None))
+            except ValueError as e:
+                items.append((None, f"Invalid JSON: {str(e)}"))
+        return items
+    try:
+        items = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+    return [(item, None) for item in items]
+
+def sync_timestamp(submitted_at: Optional[datetime], now: datetime) -> datetime:
+    """Normalise a client-reported time to UTC, never later than now"""
+    if submitted_at is None:
+        return now
+    if submitted_at.tzinfo is None:
+        submitted_at = submitted_at.replace(tzinfo=timezone.utc)
+    return min(submitted_at.astimezone(timezone.utc), now)
+
+async def apply_sync_quiz_writes(writes: List[Tuple[int, Dict[str, str], Dict[str, Any]]],
+                                 semaphore: asyncio.Semaphore) -> Dict[int, Any]:
+    """Apply one learner/module row's quiz results in order
+
+    Returns each index's pre-image (as from upsert_progress), or the error
+    that stopped it and every later result for the row.
+    """
+    outcomes: Dict[int, Any] = {}
+    async with semaphore:
+        for position, (index, key, update) in enumerate(writes):
+            try:
+                outcomes[index] = await upsert_progress(key, update) or {}
+            except PyMongoError as e:
+                for later_index, _, _ in writes[position:]:
+                    outcomes[later_index] = e
+                break
+    return outcomes
+
+async def bulk_write_progress(ops: List[UpdateOne]) -> Tuple[int, Optional[str]]:
+    """Apply ordered progress upserts; returns how many ops landed and the error that stopped the rest
+
+    Used for the sync endpoint's teaching explanations, which don't need each row's prior state.
+    """
+    applied = 0
+    retried = False
+    while applied < len(ops):
+        try:
+            await db.progress.bulk_write(ops[applied:], ordered=True)
+            return len(ops), None
+        except BulkWriteError as e:
+            error = e.details['writeErrors'][0]
+            applied += error['index']
+            # 11000 means a concurrent upsert won the insert; retrying matches its row instead
+            if error.get('code') != 11000 or retried:
+                return applied, error.get('errmsg', "Write failed")
+            retried = True
+    return applied, None
+
+@api_router.post("/sync", response_model=SyncResult)
+async def sync_results(request: Request):
+    """Apply a batch of offline quiz and teaching results sent as NDJSON or a JSON array"""
+    raw_items = parse_sync_body(await read_sync_body(request), request.headers.get('content-type', ''))
+    if len(raw_items) > SYNC_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {SYNC_MAX_ITEMS} items per batch")
+    
+    # Validate every item up front; bad items are reported, not fatal
+    results: List[SyncItemResult] = []
+    items: Dict[int, Union[QuizSyncItem, TeachingSyncItem]] = {}
+    for index, (raw, error) in enumerate(raw_items):
+        result = SyncItemResult(index=index, status="invalid", error=error)
+        if isinstance(raw, dict) and isinstance(raw.get('client_id'), str):
+            result.client_id = raw['client_id']
+        if error is None:
+            try:
+                items[index] = sync_item_adapter.validate_python(raw)
+            except ValidationError as e:
+                result.error = "; ".join(
+                    f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in e.errors()
+                )
+        results.append(result)
+    
+    # One lookup per collection for the answer keys and modules the batch refers to
+    quiz_module_ids = list({item.module_id for item in items.values() if item.type == "quiz"})
+    teaching_course_ids = list({item.course_id for item in items.values() if item.type == "teaching"})
+    quiz_docs, course_docs = await asyncio.gather(
+        db.quizzes.find(
+            {"module_id": {"$in": quiz_module_ids}},
+            {"_id": 0, "module_id": 1, "course_id": 1, "questions.correct_answer": 1}
+        ).to_list(None),
+        db.courses.find(
+            {"id": {"$in": teaching_course_ids}},
+            {"_id": 0, "id": 1, "modules.id": 1}
+        ).to_list(None)
+    )
+    quizzes = {quiz['module_id']: quiz for quiz in quiz_docs}
+    known_modules = {(course['id'], module['id']) for course in course_docs for module in course.get('modules', [])}
+    
+    # Build the progress upserts in submission order so re-attempts apply in sequence. Teaching
+    # explanations go in one ordered bulk write; quiz results are applied one by one per
+    # learner/module row, so each sees the row as it was (like submit_quiz) to tell first
+    # attempts and passes apart even with live submissions racing the sync
+    now = datetime.now(timezone.utc)
+    ops: List[UpdateOne] = []
+    op_items: List[int] = []
+    quiz_writes: Dict[Tuple[str, str], List[Tuple[int, Dict[str, str], Dict[str, Any]]]] = {}
+    events: Dict[int, Dict[str, Any]] = {}
+    for index, item in items.items():
+        key = {"username": item.username, "module_id": item.module_id}
+        timestamp = sync_timestamp(item.submitted_at, now)
+        if item.type == "quiz":
+            quiz = quizzes.get(item.module_id)
+            if not quiz or quiz.get('course_id') != item.course_id:
+                results[index].status, results[index].error = "not_found", "Quiz not found"
+                continue
+            grade = grade_quiz(item.username, item.answers, [q['correct_answer'] for q in quiz['questions']])
+            results[index].quiz_result = grade
+            quiz_writes.setdefault((item.username, item.module_id), []).append((
+                index, key, quiz_progress_update(item.course_id, grade.score, grade.total, grade.passed, timestamp)
+            ))
+        else:
+            if (item.course_id, item.module_id) not in known_modules:
+                results[index].status, results[index].error = "not_found", "Module not found"
+                continue
+            ops.append(UpdateOne(key, teaching_progress_update(item.course_id, item.explanation, timestamp), upsert=True))
+            events[index] = learning_event(timestamp, item.time_spent_seconds)
+            op_items.append(index)
+        results[index].status, results[index].error = "applied", None
+    
+    semaphore = asyncio.Semaphore(SYNC_QUIZ_WRITE_CONCURRENCY)
+    (applied, write_error), *quiz_outcomes = await asyncio.gather(
+        bulk_write_progress(ops),
+        *(apply_sync_quiz_writes(writes, semaphore) for writes in quiz_writes.values())
+    )
+    for index in op_items[applied:]:
+        results[index].status, results[index].error = "failed", write_error
+    for outcomes in quiz_outcomes:
+        for index, outcome in outcomes.items():
+            if isinstance(outcome, Exception):
+                results[index].status, results[index].error, results[index].quiz_result = "failed", str(outcome), None
+                continue
+            item, grade = items[index], results[index].quiz_result
+            events[index] = learning_event(
+                sync_timestamp(item.submitted_at, now), item.time_spent_seconds, grade,
+                first_attempt=not outcome.get('quiz_total'),
+                first_pass=grade.passed and not outcome.get('passed_at')
+            )
+    
+    # Only items whose progress row was written count towards rollups and user stats
+    events_by_user: Dict[str, List[Dict[str, Any]]] = {}
+    for index in sorted(events):
+        if results[index].status == "applied":
+            events_by_user.setdefault(items[index].username, []).append(events[index])
+    await asyncio.gather(*(
+        record_learning_events(username, user_events) for username, user_events in events_by_user.items()
+    ))
+    
+    applied_count = sum(1 for result in results if result.status == "applied")
+    return SyncResult(applied=applied_count, rejected=len(results) - applied_count, results=results)
+
+# ===== TUTOR RETRIEVAL =====
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by can could do does for from how i if in into is it its me my no not of on or "
+    "so than that the their then there these they this to was we were what when where which who why will with "
+    "would you your".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens without stopwords, for lexical retrieval"""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        # Fold plain plurals so "loop" matches "loops"
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+def chunk_text(text: str, max_chars: int) -> List[str]:
+    """Split text on paragraphs, then sentences, into chunks of roughly max_chars"""
+    chunks = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        current = ""
+        for sentence in re.split(r"(?<=[.!?])\s+", paragraph.strip()):
+            if current and len(current) + len(sentence) + 1 > max_chars:
+                chunks.append(current)
+                current = sentence
+            else:
+                current = f"{current} {sentence}".strip()
+        if current:
+            chunks.append(current)
+    return chunks
+
+def module_passages(module: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """(kind, text) passages for one module: content chunks, each example and the key points"""
+    passages = [("content", chunk) for chunk in chunk_text(module.get('content', ''), TUTOR_CHUNK_CHARS)]
+    passages += [("example", example) for example in module.get('examples', []) if example.strip()]
+    if module.get('key_points'):
+        passages.append(("key_points", "Key points: " + "; ".join(module['key_points'])))
+    return passages
+
+def build_course_index(course_id: str, modules: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """BM25 term statistics over every passage of a course"""
+    passages = []
+    doc_freq: Counter = Counter()
+    for module in modules:
+        for kind, text in module_passages(module):
+            # The module title is indexed with each passage so "what is <title>" finds it
+            terms = Counter(tokenize(f"{module['title']} {text}"))
+            doc_freq.update(terms.keys())
+            passages.append({
+                "module_id": module['id'],
+                "module_title": module['title'],
+                "kind": kind,
+                "text": text,
+                "terms": dict(terms),
+                "length": sum(terms.values())
+            })
+    return {
+        "course_id": course_id,
+        "passages": passages,
+        "doc_freq": dict(doc_freq),
+        "avg_length": sum(p['length'] for p in passages) / len(passages) if passages else 0.0,
+        "built_at": datetime.now(timezone.utc)
+    }
+
+async def save_course_index(course_id: str, modules: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Build and store a course's passage index"""
+    index = build_course_index(course_id, modules)
+    await db.course_indexes.replace_one({"course_id": course_id}, index, upsert=True)
+    course_index_cache.invalidate(course_id)
+    return index
+
+async def rebuild_course_index(course_id: str) -> Optional[Dict[str, Any]]:
+    """Re-index a course from its stored modules, e.g. after one was rewritten"""
+    course = await db.courses.find_one({"id": course_id}, {"_id": 0, "modules": 1})
+    if not course:
+        return None
+    return await save_course_index(course_id, await with_module_bodies(course.get('modules', [])))
+
+async def load_course_index(course_id: str) -> Optional[Dict[str, Any]]:
+    """Cached passage index for a course, built on first use for courses that predate it"""
+    index = course_index_cache.get(course_id)
+    if index is None:
+        token = course_index_cache.token()
+        index = await db.course_indexes.find_one({"course_id": course_id}, {"_id": 0})
+        if index is None:
+            index = await rebuild_course_index(course_id)
+            if index is None:
+                return None
+            token = course_index_cache.token()
+        course_index_cache.set(course_id, index, token)
+    return index
+
+def rank_passages(index: Dict[str, Any], query: str, boost_module_id: Optional[str] = None,
+                  k1: float = 1.2, b: float = 0.75) -> List[Tuple[float, Dict[str, Any]]]:
+    """BM25-score every passage against the query, best first; passages with no overlap are dropped"""
+    passages = index['passages']
+    avg_length = index['avg_length'] or 1.0
+    idf = {}
+    for term in set(tokenize(query)):
+        df = index['doc_freq'].get(term)
+        if df:
+            idf[term] = math.log(1 + (len(passages) - df + 0.5) / (df + 0.5))
+    
+    ranked = []
+    for passage in passages:
+        norm = k1 * (1 - b + b * passage['length'] / avg_length)
+        score = 0.0
+        for term, weight in idf.items():
+            tf = passage['terms'].get(term, 0)
+            if tf:
+                score += weight * tf * (k1 + 1) / (tf + norm)
+        if score > 0:
+            # Learners mostly ask about the module in front of them
+            if passage['module_id'] == boost_module_id:
+                score *= 1.25
+            ranked.append((score, passage))
+    ranked.sort(key=lambda item: item[0], reverse=True)
+    return ranked
+
+def select_passages(candidates: List[Dict[str, Any]], max_passages: int, budget_tokens: int) -> List[Dict[str, Any]]:
+    """Take candidates in order while they fit the token budget, trimming the first if it alone is too long"""
+    selected = []
+    used = 0
+    for passage in candidates:
+        if len(selected) >= max_passages:
+            break
+        text = passage['text']
+        tokens = token_counter.count(text)
+        if used + tokens > budget_tokens:
+            if selected:
+                continue
+            text = token_counter.fit(text, budget_tokens)
+            tokens = token_counter.count(text)
+        selected.append({"module_id": passage['module_id'], "module_title": passage['module_title'], "text": text})
+        used += tokens
+    return selected
+
+async def retrieve_tutor_context(course_id: str, question: str, module_id: Optional[str]) -> List[Dict[str, Any]]:
+    """The course passages most relevant to a tutor question, within the context budget"""
+    index = await load_course_index(course_id)
+    if not index:
+        return []
+    candidates = [passage for _, passage in rank_passages(index, question, module_id)]
+    if not candidates and module_id:
+        # Nothing matched lexically; fall back to the opening of the current module
+        candidates = [passage for passage in index['passages'] if passage['module_id'] == module_id]
+    return select_passages(candidates, TUTOR_CONTEXT_PASSAGES, TUTOR_CONTEXT_TOKENS)
+
+async def load_tutor_session(username: str, course_id: str) -> Dict[str, Any]:
+    """Recent tutor messages and the summary of older ones for a (user, course)"""
+    session = await db.tutor_sessions.find_one(
+        {"username": username, "course_id": course_id},
+        {"_id": 0, "messages": 1, "summary": 1, "version": 1}
+    )
+    return session or {"messages": [], "summary": ""}
+
+def render_tutor_history(session: Dict[str, Any]) -> str:
+    """History block for the tutor prompt: the rolling summary, then the recent messages"""
+    lines = []
+    if session.get('summary'):
+        lines += ["Earlier in this conversation the learner asked about:", session['summary']]
+    if session.get('messages'):
+        lines.append("Recent messages:")
+        lines += [
+            f"{'Learner' if turn['role'] == 'learner' else 'Tutor'}: {turn['text']}"
+            for turn in session['messages']
+        ]
+    return "\n".join(lines) + "\n" if lines else ""
+
+def fold_tutor_summary(summary: str, evicted: List[Dict[str, Any]]) -> str:
+    """Add the questions from evicted messages to the summary, dropping its oldest lines past the budget"""
+    lines = summary.splitlines() if summary else []
+    lines += [f"- {token_counter.fit(turn['text'], 30)}" for turn in evicted if turn['role'] == 'learner']
+    while len(lines) > 1 and token_counter.count("\n".join(lines)) > TUTOR_SUMMARY_TOKENS:
+        lines.pop(0)
+    return "\n".join(lines)
+
+async def record_tutor_exchange(username: str, course_id: str, session: Dict[str, Any], question: str, reply: str,
+                                attempts: int = 3):
+    """Append a question and reply to the capped message window, folding what falls out into the summary
+
+    The write only applies to the session version it was computed from. If
+    another exchange on the same session got in first (e.g. while the LLM was
+    answering), it's recomputed from a fresh copy so no message is folded twice.
+    """
+    now = datetime.now(timezone.utc)
+    new_messages = [
+        {"role": "learner", "text": question, "at": now},
+        {"role": "tutor", "text": token_counter.fit(reply, TUTOR_PROMPT.max_output_tokens), "at": now}
+    ]
+    window = TUTOR_HISTORY_TURNS * 2
+    key = {"username": username, "course_id": course_id}
+    for _ in range(attempts):
+        overflow = len(session['messages']) + len(new_messages) - window
+        update: Dict[str, Any] = {
+            # $slice keeps the array capped in the same write that appends to it
+            "$push": {"messages": {"$each": new_messages, "$slice": -window}},
+            "$set": {"updated_at": now},
+            "$inc": {"version": 1}
+        }
+        if overflow > 0:
+            update["$set"]["summary"] = fold_tutor_summary(session.get('summary', ''), session['messages'][:overflow])
+        version = session.get('version')
+        guard = {"version": version} if version is not None else {"version": {"$exists": False}}
+        try:
+            # A stale guard misses the existing session, and the upsert then hits the unique (username, course_id) index
+            await db.tutor_sessions.update_one({**key, **guard}, update, upsert=True)
+            return
+        except DuplicateKeyError:
+            session = await load_tutor_session(username, course_id)
+    logging.warning(f"Tutor session {username}/{course_id} kept changing; dropped an exchange from its history")
+
+async def build_tutor_prompt(message: TutorMessage) -> Tuple[str, str, Dict[str, Any]]:
+    """Tutor system message and question, with relevant course passages and the conversation so far
+
+    Also returns the loaded session, which record_tutor_exchange needs once the reply is in.
+    """
+    passages, session = await asyncio.gather(
+        retrieve_tutor_context(message.course_id, message.message, message.module_id),
+        load_tutor_session(message.username, message.course_id)
+    )
+    context_info = ""
+    if passages:
+        context_info = "\nRelevant course material:\n" + "\n".join(
+            f"[{passage['module_title']}] {passage['text']}" for passage in passages
+        )
+    
+    system_message, prompt = TUTOR_PROMPT.render(
+        username=message.username,
+        context=message.context or 'general learning',
+        context_info=context_info,
+        history=render_tutor_history(session),
+        message=message.message
+    )
+    return system_message, prompt, session
+
+async def tutor_fallback_reply(message: TutorMessage) -> Optional[str]:
+    """An answer made of the relevant course passages, for when the LLM is unavailable"""
+    passages = await retrieve_tutor_context(message.course_id, message.message, message.module_id)
+    if not passages:
+        return None
+    quoted = "\n\n".join(f"From \"{passage['module_title']}\": {passage['text']}" for passage in passages)
+    return (
+        f"I can't reach my AI helper right now, {message.username}, so here's what your course says "
+        f"that might help:\n\n{quoted}\n\nAsk me again in a minute for a fuller answer!"
+    )
+
+def tutor_encouragement(username: str) -> str:
+    """Pick an encouragement line to show under a tutor reply"""
+    encouragements = [
+        f"You're doing great, {username}! Keep asking questions! 🌟",
+        f"Great question, {username}! Curiosity leads to learning! 🚀",
+        f"I'm here to help, {username}! You're making progress! 💪",
+        f"Excellent thinking, {username}! Keep it up! ✨"
+    ]
+    return random.choice(encouragements)
+
+@api_router.post("/tutor/ask", response_model=TutorResponse)
+async def ask_tutor(message: TutorMessage):
+    """Get help from AI tutor"""
+    
+    system_message, prompt, session = await build_tutor_prompt(message)
+    
+    try:
+        response = await ask_llm(system_message, f"tutor_{message.username}_{message.course_id}", prompt, "tutor")
+        await record_tutor_exchange(message.username, message.course_id, session, prompt, response)
+        
+        return TutorResponse(response=response, encouragement=tutor_encouragement(message.username))
+        
+    except LLMUnavailableError:
+        fallback = await tutor_fallback_reply(message)
+        if fallback is None:
+            raise
+        llm_resilience.record_fallback("tutor")
+        return TutorResponse(response=fallback, encouragement=tutor_encouragement(message.username))
+        
+    except HTTPException:
+        raise
+        
+    except Exception as e:
+        logging.error(f"Tutor error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to get tutor response")
+
+async def stream_tutor_events(message: TutorMessage) -> AsyncIterator[str]:
+    """Forward the tutor reply as `token` frames, then the encouragement and `done`"""
+    reply: List[str] = []
+    try:
+        system_message, prompt, session = await build_tutor_prompt(message)
+        session_id = f"tutor_{message.username}_{message.course_id}"
+        
+        # When the client disconnects the response task is cancelled here, which
+        # closes the upstream stream and frees its scheduler slot
+        async for delta in stream_llm(system_message, session_id, prompt, "tutor"):
+            reply.append(delta)
+            yield sse_event("token", {"text": delta})
+        
+        await record_tutor_exchange(message.username, message.course_id, session, prompt, "".join(reply))
+        yield sse_event("encouragement", {"text": tutor_encouragement(message.username)})
+        yield sse_event("done", {})
+        
+    except LLMUnavailableError as e:
+        # Once part of the reply is out, appending the fallback would garble it
+        fallback = None if reply else await tutor_fallback_reply(message)
+        if fallback is None:
+            yield sse_event("error", {"detail": e.detail, "status": e.status_code, "headers": e.headers})
+            return
+        llm_resilience.record_fallback("tutor")
+        yield sse_event("token", {"text": fallback})
+        yield sse_event("encouragement", {"text": tutor_encouragement(message.username)})
+        yield sse_event("done", {})
+        
+    except HTTPException as e:
+        yield sse_event("error", {"detail": e.detail, "status": e.status_code, "headers": e.headers})
+        
+    except Exception as e:
+        logging.error(f"Tutor stream error: {str(e)}")
+        yield sse_event("error", {"detail": "Failed to get tutor response"})
+
+@api_router.post("/tutor/stream")
+async def stream_tutor(message: TutorMessage):
+    """Get help from AI tutor, streamed as Server-Sent Events"""
+    return StreamingResponse(
+        stream_tutor_events(message),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def find_cached_simplified(module_id: str, content_hash: Optional[str]) -> Optional[Module]:
+    """A stored simplified variant generated from the module's current content (any content for None)"""
+    query = {"module_id": module_id} if content_hash is None else {"module_id": module_id, "content_hash": content_hash}
+    cached = await db.simplified_modules.find_one(
+        query,
+        {"_id": 0, "module": 1}
+    )
+    return Module(**cached['module']) if cached else None
+
+async def get_or_create_simplified(course_id: str, module: Dict[str, Any], username: str,
+                                   call_site: str = "simplify") -> Module:
+    """Simplified rewrite of a module, from the variant cache when the content is unchanged"""
+    module_id = module['id']
+    content_hash = module_content_hash(module)
+    cached = await find_cached_simplified(module_id, content_hash)
+    if cached:
+        return cached
+    
+    system_message, prompt = SIMPLIFY_PROMPT.render(username=username, title=module['title'], content=module['content'])
+    
+    try:
+        response = await ask_llm(system_message, f"simplify_{module_id}", prompt, call_site)
+    except LLMUnavailableError:
+        stale = await find_cached_simplified(module_id, None)
+        if stale is None:
+            raise
+        llm_resilience.record_fallback(call_site)
+        return stale
+    
+    simplified_module = parse_llm_model(response, Module)
+    simplified_module.id = module_id
+    
+    await db.simplified_modules.update_one(
+        {"module_id": module_id},
+        {"$set": {
+            "course_id": course_id,
+            "content_hash": content_hash,
+            "module": simplified_module.model_dump(),
+            "created_at": datetime.now(timezone.utc)
+        }},
+        upsert=True
+    )
+    
+    return simplified_module
+
+async def prewarm_simplified(course_id: str, module_id: str, username: str, below_percent: Optional[float] = None):
+    """Generate a simplified variant ahead of time, optionally only if the learner is struggling"""
+    if below_percent is not None:
+        scores = await db.progress.aggregate([
+            {"$match": {"username": username, "course_id": course_id, "quiz_total": {"$gt": 0}}},
+            {"$group": {"_id": None, "average": {"$avg": {"$divide": ["$quiz_score", "$quiz_total"]}}}}
+        ]).to_list(1)
+        if not scores or scores[0]['average'] * 100 >= below_percent:
+            return
+    course = await find_course_module(course_id, module_id)
+    if not course or not course.get('modules'):
+        return
+    module = course['modules'][0]
+    if await find_cached_simplified(module_id, module_content_hash(module)):
+        prewarmer.stats["cache_hits"] += 1
+        return
+    if prewarmer.try_spend():
+        await get_or_create_simplified(course_id, module, username, "simplify_prewarm")
+
+@api_router.post("/module/simplify", response_model=Module)
+async def simplify_module(request: SimplifyRequest):
+    """Regenerate module with simpler explanations"""
+    
+    module = await get_module_or_404(request.course_id, request.module_id)
+    
+    try:
+        simplified_module = await get_or_create_simplified(request.course_id, module, request.username)
+        
+        # Replace the body, then the stub; the course document itself stays small
+        await save_module_bodies(request.course_id, [simplified_module.model_dump()])
+        await db.courses.update_one(
+            {"id": request.course_id, "modules.id": request.module_id},
+            {
+                "$set": {"modules.$": module_stub(simplified_module.model_dump())},
+                "$inc": {"version": 1}
+            }
+        )
+        course_cache.invalidate(request.course_id)
+        await rebuild_course_index(request.course_id)
+        
+        return simplified_module
+        
+    except HTTPException:
+        raise
+        
+    except Exception as e:
+        logging.error(f"Simplify error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to simplify module")
+
+teaching_evaluations: Counter = Counter()
+
+def word_shingles(words: List[str], size: int) -> set:
+    return {tuple(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+def terms_covered(text: str, terms: set) -> bool:
+    """Whether enough of a key point's (or example's) terms appear among the explanation's terms"""
+    wanted = set(tokenize(text))
+    return bool(wanted) and len(wanted & terms) / len(wanted) >= TEACHING_KEY_POINT_OVERLAP
+
+def teaching_signals(module: Dict[str, Any], explanation: str) -> Dict[str, Any]:
+    """Cheap lexical measurements of an explanation against its module"""
+    words = TOKEN_PATTERN.findall(explanation.lower())
+    terms = set(tokenize(explanation))
+    key_points = module.get('key_points') or []
+    examples = module.get('examples') or []
+    
+    copied = 0.0
+    if len(words) >= TEACHING_SHINGLE_SIZE:
+        shingles = word_shingles(words, TEACHING_SHINGLE_SIZE)
+        content_shingles = word_shingles(TOKEN_PATTERN.findall(module['content'].lower()), TEACHING_SHINGLE_SIZE)
+        copied = len(shingles & content_shingles) / len(shingles)
+    
+    module_terms = set(tokenize(" ".join([module['title'], module['content'], *key_points, *examples])))
+    missed = [point for point in key_points if not terms_covered(point, terms)]
+    return {
+        "words": len(words),
+        "copied": copied,
+        "relevance": len(terms & module_terms) / len(terms) if terms else 0.0,
+        "coverage": (len(key_points) - len(missed)) / len(key_points) if key_points else 0.0,
+        "missed": missed,
+        "example_used": any(terms_covered(example, terms) for example in examples)
+    }
+
+def teaching_verdict(signals: Dict[str, Any]) -> str:
+    """Classify an explanation as too_short, copied, off_topic or covered, or ambiguous if it isn't clear-cut"""
+    if signals['words'] < TEACHING_MIN_WORDS:
+        return "too_short"
+    if signals['copied'] >= TEACHING_COPY_THRESHOLD:
+        return "copied"
+    if signals['relevance'] < TEACHING_MIN_RELEVANCE:
+        return "off_topic"
+    if (signals['coverage'] >= TEACHING_PASS_COVERAGE and signals['words'] >= TEACHING_PASS_MIN_WORDS
+            and signals['copied'] < TEACHING_COPY_THRESHOLD / 2):
+        return "covered"
+    return "ambiguous"
+
+def local_teaching_feedback(username: str, module: Dict[str, Any], signals: Dict[str, Any], verdict: str) -> TeachingFeedback:
+    """TeachingFeedback for a verdict reached without the LLM ("ambiguous" only when the LLM is unavailable)"""
+    suggestions = [f"Explain this key point in your own words: {point}" for point in signals['missed'][:2]]
+    if not signals['example_used']:
+        suggestions.append("Add an example, ideally one of your own, to show the idea in action")
+    suggestions.append("Try explaining it as if to a friend who has never heard of it")
+    
+    if verdict == "too_short":
+        feedback = (f"Thanks for starting, {username}! Your explanation is a bit short for us to see what you've "
+                    "understood. Try a few sentences in your own words.")
+        score, can_proceed = 2, False
+    elif verdict == "copied":
+        feedback = (f"It looks like much of this comes straight from the lesson, {username}. Putting it in your own "
+                    "words is what makes it stick, so give it another go!")
+        score, can_proceed = 3, False
+    elif verdict == "off_topic":
+        feedback = (f"Good effort, {username}, but this doesn't seem to be about {module['title']} yet. "
+                    "Have another look at the lesson and explain its main idea.")
+        score, can_proceed = 2, False
+    elif verdict == "covered":
+        feedback = (f"Great explanation, {username}! You covered the key ideas of {module['title']} clearly and in "
+                    "your own words.")
+        score, can_proceed = min(9, 6 + round(3 * signals['coverage'])), True
+    else:
+        can_proceed = signals['coverage'] >= 0.5
+        feedback = (f"Thanks, {username}! Our AI reviewer is unavailable right now, so this is a quick automatic "
+                    f"check: you covered {signals['coverage']:.0%} of the key points.")
+        score = max(3, min(7, 3 + round(5 * signals['coverage'])))
+    
+    return TeachingFeedback(feedback=feedback, quality_score=score, suggestions=suggestions[:3], can_proceed=can_proceed)
+
+def record_teaching_evaluation(path: str, verdict: str):
+    teaching_evaluations[path] += 1
+    teaching_evaluations[f"{path}:{verdict}"] += 1
+    metrics.inc("teaching_evaluations_total", {"path": path, "verdict": verdict})
+
+def teaching_evaluation_snapshot() -> Dict[str, Any]:
+    """How many explanations were settled locally vs by the LLM, and the verdicts behind them"""
+    local, llm, fallback = (teaching_evaluations[path] for path in ("local", "llm", "fallback"))
+    total = local + llm + fallback
+    return {
+        "local": local,
+        "llm": llm,
+        "fallback": fallback,
+        "local_share": round(local / total, 3) if total else 0.0,
+        "verdicts": {key: count for key, count in teaching_evaluations.items() if ":" in key}
+    }
+
+async def evaluate_teaching(submission: TeachingSubmission, module: Dict[str, Any]) -> TeachingFeedback:
+    """Score an explanation
+
+    Clear-cut explanations (too short, copied, off topic, or covering the
+    key points) are scored locally; the rest go to the LLM.
+    """
+    signals = teaching_signals(module, submission.explanation)
+    verdict = teaching_verdict(signals) if TEACHING_PRESCORE_ENABLED else "ambiguous"
+    if verdict != "ambiguous":
+        record_teaching_evaluation("local", verdict)
+        return local_teaching_feedback(submission.username, module, signals, verdict)
+    
+    system_message, prompt = TEACHING_PROMPT.render(
+        username=submission.username,
+        title=module['title'],
+        content=module['content'],
+        explanation=submission.explanation
+    )
     
     try:
-        chat = get_llm_chat(system_message, f"teaching_{submission.module_id}")
-        response = await chat.send_message(UserMessage(text="Evaluate this explanation. Return only valid JSON."))
+        response = await ask_llm(system_message, f"teaching_{submission.module_id}", prompt, "teaching")
+        
+        feedback = parse_llm_model(response, TeachingFeedback)
+        record_teaching_evaluation("llm", verdict)
+        return feedback
         
-        import json
-        response_text = response.strip()
-        if "```json" in response_text:
-            response_text = response_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in response_text:
-            response_text = response_text.split("```")[1].split("```")[0].strip()
+    except LLMUnavailableError:
+        llm_resilience.record_fallback("teaching")
+        record_teaching_evaluation("fallback", verdict)
+        return local_teaching_feedback(submission.username, module, signals, verdict)
         
-        feedback_data = json.loads(response_text)
-        return TeachingFeedback(**feedback_data)
+    except HTTPException:
+        raise
         
     except Exception as e:
         logging.error(f"Teaching evaluation error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to evaluate explanation")
 
-@api_router.get("/progress/{username}")
+@api_router.post("/teaching/submit", response_model=TeachingFeedback)
+async def submit_teaching(submission: TeachingSubmission):
+    """Evaluate learner's explanation (teaching phase)"""
+    
+    module = await get_module_or_404(submission.course_id, submission.module_id)
+    feedback = await evaluate_teaching(submission, module)
+    await record_learning_events(
+        submission.username,
+        [learning_event(datetime.now(timezone.utc), submission.time_spent_seconds)]
+    )
+    return feedback
+
+@api_router.get("/progress/{username}", response_class=FastJSONResponse)
 async def get_user_progress(username: str):
     """Get user's learning progress and stats for graphs"""
     
@@ -548,78 +3588,212 @@ async def get_user_progress(username: str):
         {"_id": 0}
     ).sort("timestamp", 1).to_list(1000)
     
-    # Convert timestamps
-    for record in progress_records:
-        if isinstance(record.get('timestamp'), str):
-            record['timestamp'] = datetime.fromisoformat(record['timestamp'])
-    
     # Get user stats
     user = await db.users.find_one({"username": username}, {"_id": 0})
+    if user:
+        user['current_streak'] = effective_streak(user.get('current_streak', 0), user.get('last_active_day'))
     
     # Get all courses
     courses = await db.courses.find({"username": username}, {"_id": 0}).to_list(1000)
     
-    return {
+    return FastJSONResponse({
         "user": user,
         "progress": progress_records,
         "courses": courses
-    }
+    })
 
-@api_router.get("/course/{course_id}")
-async def get_course(course_id: str):
-    """Get course by ID"""
-    course = await db.courses.find_one({"id": course_id}, {"_id": 0})
-    if not course:
-        raise HTTPException(status_code=404, detail="Course not found")
+def encode_page_cursor(course: Dict[str, Any]) -> str:
+    """Opaque cursor pointing just past the given course in created_at/id order"""
+    raw = json.dumps([course['created_at'].isoformat(), course['id']])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_page_cursor(cursor: str) -> Dict[str, Any]:
+    """Turn a page cursor back into a courses filter"""
+    try:
+        created_at, course_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        created_at = datetime.fromisoformat(created_at)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "id": {"$lt": course_id}}
+    ]}
+
+@api_router.get("/progress/{username}/dashboard", response_class=FastJSONResponse)
+async def get_progress_dashboard(username: str, limit: int = 20, cursor: Optional[str] = None):
+    """Aggregated dashboard stats plus one page of course metadata (no module bodies)"""
+    limit = max(1, min(limit, 100))
     
-    if isinstance(course.get('created_at'), str):
-        course['created_at'] = datetime.fromisoformat(course['created_at'])
+    # Summary and score series come from the counters and rollups kept up to date on
+    # every quiz and teaching write, so this doesn't grow with the learner's history
+    user, rollups = await asyncio.gather(
+        db.users.find_one({"username": username}, {"_id": 0}),
+        db.daily_rollups.find({"username": username}, {"_id": 0, "username": 0})
+            .sort("day", -1).limit(ROLLUP_DASHBOARD_DAYS).to_list(ROLLUP_DASHBOARD_DAYS)
+    )
+    if user:
+        user['current_streak'] = effective_streak(user.get('current_streak', 0), user.get('last_active_day'))
+    summary = learner_summary(user or {})
+    daily_scores = [daily_score(rollup) for rollup in reversed(rollups)]
     
-    return course
+    # One page of course metadata, newest first
+    match: Dict[str, Any] = {"username": username}
+    if cursor:
+        match.update(decode_page_cursor(cursor))
+    courses = await db.courses.aggregate([
+        {"$match": match},
+        {"$sort": {"created_at": -1, "id": -1}},
+        {"$limit": limit + 1},
+        {"$project": {
+            "_id": 0,
+            "id": 1,
+            "topic": 1,
+            "skill_level": 1,
+            "learning_goal": 1,
+            "created_at": 1,
+            "current_module_index": 1,
+            "completed": 1,
+            "module_count": {"$size": {"$ifNull": ["$modules", []]}}
+        }}
+    ]).to_list(limit + 1)
+    
+    next_cursor = None
+    if len(courses) > limit:
+        courses = courses[:limit]
+        next_cursor = encode_page_cursor(courses[-1])
+    
+    # passed_at, not completed: a fail after a pass clears completed but the module stays passed,
+    # as in summary.modules_passed (scripts/rebuild_user_stats.py backfills passed_at on older rows)
+    completed_counts = await db.progress.aggregate([
+        {"$match": {
+            "username": username,
+            "course_id": {"$in": [c['id'] for c in courses]},
+            "passed_at": {"$exists": True}
+        }},
+        {"$group": {"_id": "$course_id", "modules_completed": {"$sum": 1}}}
+    ]).to_list(limit)
+    completed_by_course = {c['_id']: c['modules_completed'] for c in completed_counts}
+    
+    for course in courses:
+        course['modules_completed'] = completed_by_course.get(course['id'], 0)
+        course['completion_ratio'] = (
+            round(course['modules_completed'] / course['module_count'], 3)
+            if course['module_count'] else 0
+        )
+    
+    return FastJSONResponse({
+        "user": user,
+        "summary": summary,
+        "daily_scores": daily_scores,
+        "courses": courses,
+        "next_cursor": next_cursor
+    })
+
+@api_router.get("/course/{course_id}", response_class=FastJSONResponse)
+async def get_course(course_id: str, request: Request):
+    """Get course by ID"""
+    course = course_cache.get(course_id)
+    if course is None:
+        token = course_cache.token()
+        course = await db.courses.find_one({"id": course_id}, {"_id": 0})
+        if not course:
+            raise HTTPException(status_code=404, detail="Course not found")
+        
+        course.setdefault('version', 0)
+        course['modules'] = await with_module_bodies(course.get('modules', []))
+        course_cache.set(course_id, course, token)
+    
+    etag = document_etag("course", course_id, course['version'])
+    # no-cache lets browsers keep the body but revalidate it with If-None-Match every time
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return FastJSONResponse(course, headers=headers)
+
+@api_router.get("/course/{course_id}/modules/{module_id}", response_model=Module)
+async def get_course_module(course_id: str, module_id: str):
+    """Get one module with its body, without loading the rest of the course"""
+    return await get_module_or_404(course_id, module_id)
 
 @api_router.put("/course/{course_id}/module")
 async def update_current_module(course_id: str, module_index: int):
     """Update current module index"""
-    result = await db.courses.update_one(
+    course = await db.courses.find_one_and_update(
         {"id": course_id},
-        {"$set": {"current_module_index": module_index}}
+        {"$set": {"current_module_index": module_index}, "$inc": {"version": 1}},
+        projection={"_id": 0, "username": 1, "modules.id": 1}
     )
+    course_cache.invalidate(course_id)
     
-    if result.modified_count == 0:
+    if course is None:
         raise HTTPException(status_code=404, detail="Course not found")
     
+    # While the learner reads this module, get its quiz and the next one ready,
+    # plus a simpler rewrite if their scores so far suggest they may struggle
+    module_ids = [module['id'] for module in course.get('modules', [])[module_index:module_index + 2]]
+    schedule_quiz_prewarm(course_id, module_ids)
+    if module_ids:
+        prewarmer.schedule(
+            f"simplify:{module_ids[0]}",
+            lambda: prewarm_simplified(course_id, module_ids[0], course['username'], PREWARM_SIMPLIFY_BELOW_PERCENT)
+        )
+    
     return {"message": "Module updated", "current_index": module_index}
 
 @api_router.put("/course/{course_id}/complete")
 async def complete_course(course_id: str):
     """Mark course as completed"""
-    result = await db.courses.update_one(
+    course = await db.courses.find_one_and_update(
         {"id": course_id},
-        {"$set": {"completed": True}}
+        {"$set": {"completed": True}, "$inc": {"version": 1}},
+        projection={"_id": 0, "username": 1, "topic": 1}
     )
+    course_cache.invalidate(course_id)
     
-    if result.modified_count == 0:
+    if not course:
         raise HTTPException(status_code=404, detail="Course not found")
     
     # Award badge
-    course = await db.courses.find_one({"id": course_id}, {"_id": 0})
-    if course:
-        await db.users.update_one(
-            {"username": course['username']},
-            {"$addToSet": {"badges": f"Completed {course['topic']}"}}
-        )
+    await db.users.update_one(
+        {"username": course['username']},
+        {"$addToSet": {"badges": f"Completed {course['topic']}"}, "$inc": {"version": 1}}
+    )
+    user_cache.invalidate(course['username'])
     
     return {"message": "Course completed! 🎉"}
 
+@api_router.get("/llm/stats")
+async def get_llm_stats():
+    """LLM request coalescing counters, scheduler queue stats, resilience state, teaching local/LLM split, rate limiting and pre-generation counters"""
+    return {
+        "single_flight": llm_single_flight.snapshot(),
+        "scheduler": llm_scheduler.snapshot(),
+        "resilience": llm_resilience.snapshot(),
+        "teaching": teaching_evaluation_snapshot(),
+        "rate_limit": rate_limiter.snapshot(),
+        "prewarm": prewarmer.snapshot()
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # Include the router in the main app
 app.include_router(api_router)
 
+# Innermost first: rate-limited requests still get metrics and CORS headers
+app.add_middleware(RateLimitMiddleware)
+
+app.add_middleware(MetricsMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["RateLimit-Limit", "RateLimit-Remaining", "RateLimit-Reset", "RateLimit-Policy", "Retry-After"],
 )
 
 # Configure logging
@@ -629,6 +3803,36 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_db_indexes():
+    await ensure_indexes()
+
+@app.on_event("startup")
+async def warn_missing_optional_packages():
+    if MODULE_BODY_COMPRESSION == "zstd" and zstandard is None:
+        logger.warning("MODULE_BODY_COMPRESSION is zstd but the zstandard package is not installed; "
+                       "module bodies are stored with zlib")
+
+@app.on_event("startup")
+async def load_token_encoding():
+    # Off the event loop and bounded, so a slow or unreachable download can't stall startup or requests;
+    # counts are estimated until it finishes
+    try:
+        await asyncio.wait_for(asyncio.to_thread(token_counter.load), TOKEN_ENCODING_LOAD_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        logger.warning(f"tiktoken encoding {TOKEN_ENCODING} still loading after "
+                       f"{TOKEN_ENCODING_LOAD_TIMEOUT_SECONDS:g}s; estimating tokens until it's ready")
+
+@app.on_event("startup")
+async def start_course_job_workers():
+    # Unfinished jobs from a previous run are picked up again once their lease expires
+    for worker_index in range(COURSE_JOB_WORKERS):
+        course_job_workers.append(asyncio.create_task(course_job_worker(worker_index)))
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task in course_job_workers:
+        task.cancel()
+    await asyncio.gather(*course_job_workers, return_exceptions=True)
+    await prewarmer.close()
     client.close()
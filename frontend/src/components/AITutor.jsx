@@ -3,7 +3,7 @@ import { MessageCircle, X, Send, Sparkles } from 'lucide-react';
 import { Button } from './ui/button';
 import { Input } from './ui/input';
 import { ScrollArea } from './ui/scroll-area';
-import axios from 'axios';
+import { readEventStream } from '../lib/sse';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
@@ -19,6 +19,10 @@ const AITutor = ({ username, course, isOpen, onToggle }) => {
   const [input, setInput] = useState('');
   const [loading, setLoading] = useState(false);
   const scrollRef = useRef(null);
+  const streamRef = useRef(null);
+
+  // Abort an in-flight reply when the widget unmounts so the server stops generating it
+  useEffect(() => () => streamRef.current?.abort(), []);
 
   useEffect(() => {
     if (scrollRef.current) {
@@ -36,23 +40,48 @@ const AITutor = ({ username, course, isOpen, onToggle }) => {
 
     try {
       const currentModule = course.modules[course.current_module_index || 0];
-      const response = await axios.post(`${API}/tutor/ask`, {
-        username,
-        course_id: course.id,
-        module_id: currentModule?.id,
-        message: userMessage,
-        context: 'learning'
+      streamRef.current = new AbortController();
+      const response = await fetch(`${API}/tutor/stream`, {
+        method: 'POST',
+        signal: streamRef.current.signal,
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          username,
+          course_id: course.id,
+          module_id: currentModule?.id,
+          message: userMessage,
+          context: 'learning'
+        })
       });
+      if (!response.ok || !response.body) {
+        throw new Error(`Tutor stream failed with status ${response.status}`);
+      }
 
-      setMessages(prev => [
-        ...prev,
-        {
-          role: 'tutor',
-          content: response.data.response,
-          encouragement: response.data.encouragement
+      // Open the reply bubble on the first token and grow it as more arrive
+      let replyStarted = false;
+      const updateReply = (update) => {
+        setMessages(prev => {
+          const last = prev[prev.length - 1];
+          return [...prev.slice(0, -1), { ...last, ...update(last) }];
+        });
+      };
+
+      await readEventStream(response, (event, data) => {
+        if (event === 'token') {
+          if (!replyStarted) {
+            replyStarted = true;
+            setMessages(prev => [...prev, { role: 'tutor', content: data.text, encouragement: '' }]);
+          } else {
+            updateReply(last => ({ content: last.content + data.text }));
+          }
+        } else if (event === 'encouragement') {
+          updateReply(() => ({ encouragement: data.text }));
+        } else if (event === 'error') {
+          throw new Error(data.detail);
         }
-      ]);
+      });
     } catch (error) {
+      if (error.name === 'AbortError') return;
       console.error('Tutor error:', error);
       setMessages(prev => [
         ...prev,
@@ -131,7 +160,7 @@ const AITutor = ({ username, course, isOpen, onToggle }) => {
                   </div>
                 </div>
               ))}
-              {loading && (
+              {loading && messages[messages.length - 1].role === 'user' && (
                 <div className="flex justify-start">
                   <div className="bg-gray-100 p-3 rounded-2xl rounded-bl-none">
                     <div className="flex gap-1">
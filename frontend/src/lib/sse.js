@@ -0,0 +1,25 @@
+// Read a Server-Sent Events response body, calling onEvent(event, data) per frame
+export async function readEventStream(response, onEvent) {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      const frame = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      const lines = frame.split('\n');
+      const eventLine = lines.find((line) => line.startsWith('event: '));
+      const dataLine = lines.find((line) => line.startsWith('data: '));
+      if (eventLine && dataLine) {
+        onEvent(eventLine.slice(7), JSON.parse(dataLine.slice(6)));
+      }
+      boundary = buffer.indexOf('\n\n');
+    }
+  }
+}
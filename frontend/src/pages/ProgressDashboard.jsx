@@ -17,6 +17,7 @@ const ProgressDashboard = ({ username, onLogout }) => {
   const navigate = useNavigate();
   const [loading, setLoading] = useState(true);
   const [data, setData] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     loadProgress();
@@ -25,7 +26,7 @@ const ProgressDashboard = ({ username, onLogout }) => {
   const loadProgress = async () => {
     setLoading(true);
     try {
-      const response = await axios.get(`${API}/progress/${username}`);
+      const response = await axios.get(`${API}/progress/${username}/dashboard`);
       setData(response.data);
     } catch (error) {
       console.error('Failed to load progress:', error);
@@ -35,6 +36,25 @@ const ProgressDashboard = ({ username, onLogout }) => {
     }
   };
 
+  const loadMoreCourses = async () => {
+    setLoadingMore(true);
+    try {
+      const response = await axios.get(`${API}/progress/${username}/dashboard`, {
+        params: { cursor: data.next_cursor }
+      });
+      setData({
+        ...data,
+        courses: [...data.courses, ...response.data.courses],
+        next_cursor: response.data.next_cursor
+      });
+    } catch (error) {
+      console.error('Failed to load courses:', error);
+      toast.error('Failed to load more courses');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   if (loading) {
     return (
       <div className="min-h-screen flex items-center justify-center">
@@ -47,19 +67,16 @@ const ProgressDashboard = ({ username, onLogout }) => {
   }
 
   // Prepare chart data
-  const learningPathData = data?.courses?.flatMap(course => 
-    course.modules.map((module, idx) => ({
-      name: `${course.topic.substring(0, 10)}... M${idx + 1}`,
-      module: idx + 1,
-      course: course.topic
-    }))
-  ) || [];
+  const learningPathData = data?.courses?.slice().reverse().map(course => ({
+    name: `${course.topic.substring(0, 10)}...`,
+    module: course.modules_completed,
+    course: course.topic
+  })) || [];
 
-  const performanceData = data?.progress?.map((p, idx) => ({
-    attempt: idx + 1,
-    score: p.quiz_score || 0,
-    percentage: p.quiz_total ? Math.round((p.quiz_score / p.quiz_total) * 100) : 0,
-    date: new Date(p.timestamp).toLocaleDateString()
+  // Days with only teaching activity have no quiz average
+  const performanceData = data?.daily_scores?.filter(day => day.average_percentage != null).map(day => ({
+    date: new Date(day.date).toLocaleDateString(),
+    percentage: Math.round(day.average_percentage)
   })) || [];
 
   const user = data?.user || {};
@@ -159,7 +176,7 @@ const ProgressDashboard = ({ username, onLogout }) => {
                     <YAxis />
                     <Tooltip />
                     <Legend />
-                    <Area type="monotone" dataKey="module" stroke="#6366f1" fill="#818cf8" name="Module Progress" />
+                    <Area type="monotone" dataKey="module" stroke="#6366f1" fill="#818cf8" name="Modules Completed" />
                   </AreaChart>
                 </ResponsiveContainer>
               ) : (
@@ -181,11 +198,11 @@ const ProgressDashboard = ({ username, onLogout }) => {
                 <ResponsiveContainer width="100%" height={300}>
                   <LineChart data={performanceData}>
                     <CartesianGrid strokeDasharray="3 3" />
-                    <XAxis dataKey="attempt" label={{ value: 'Quiz Attempts', position: 'insideBottom', offset: -5 }} />
+                    <XAxis dataKey="date" label={{ value: 'Day', position: 'insideBottom', offset: -5 }} />
                     <YAxis label={{ value: 'Score %', angle: -90, position: 'insideLeft' }} />
                     <Tooltip />
                     <Legend />
-                    <Line type="monotone" dataKey="percentage" stroke="#10b981" strokeWidth={3} name="Score %" />
+                    <Line type="monotone" dataKey="percentage" stroke="#10b981" strokeWidth={3} name="Average Score %" />
                   </LineChart>
                 </ResponsiveContainer>
               ) : (
@@ -244,7 +261,9 @@ const ProgressDashboard = ({ username, onLogout }) => {
                       <div className="flex items-start justify-between">
                         <div className="flex-1">
                           <h3 className="text-xl font-semibold text-gray-800">{course.topic}</h3>
-                          <p className="text-gray-600 mt-1">{course.modules.length} modules</p>
+                          <p className="text-gray-600 mt-1">
+                            {course.modules_completed} of {course.module_count} modules completed
+                          </p>
                           <div className="flex gap-2 mt-3">
                             <Badge variant="secondary">{course.skill_level}</Badge>
                             {course.completed && <Badge className="bg-green-500">Completed</Badge>}
@@ -256,6 +275,18 @@ const ProgressDashboard = ({ username, onLogout }) => {
                       </div>
                     </div>
                   ))}
+                  {data.next_cursor && (
+                    <div className="text-center">
+                      <Button
+                        onClick={loadMoreCourses}
+                        variant="outline"
+                        disabled={loadingMore}
+                        data-testid="load-more-courses-button"
+                      >
+                        {loadingMore ? 'Loading...' : 'Load more courses'}
+                      </Button>
+                    </div>
+                  )}
                 </div>
               ) : (
                 <div className="text-center py-12 text-gray-500">
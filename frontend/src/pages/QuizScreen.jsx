@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import EyeLogo from '../components/EyeLogo';
 import { Button } from '../components/ui/button';
@@ -20,6 +20,8 @@ const QuizScreen = ({ username, course, onCourseUpdate }) => {
   const [submitted, setSubmitted] = useState(false);
   const [result, setResult] = useState(null);
   const [submitting, setSubmitting] = useState(false);
+  // When the current quiz was shown, for time-on-task stats
+  const startedAt = useRef(Date.now());
 
   const currentIndex = course.current_module_index || 0;
   const currentModule = course.modules[currentIndex];
@@ -38,6 +40,7 @@ const QuizScreen = ({ username, course, onCourseUpdate }) => {
         }
       });
       setQuiz(response.data);
+      startedAt.current = Date.now();
     } catch (error) {
       console.error('Quiz loading error:', error);
       toast.error('Failed to load quiz. Please try again.');
@@ -59,7 +62,8 @@ const QuizScreen = ({ username, course, onCourseUpdate }) => {
         username,
         course_id: course.id,
         module_id: currentModule.id,
-        answers: answerArray
+        answers: answerArray,
+        time_spent_seconds: (Date.now() - startedAt.current) / 1000
       });
 
       setResult(response.data);
@@ -78,13 +82,26 @@ const QuizScreen = ({ username, course, onCourseUpdate }) => {
     }
   };
 
-  const handleNext = () => {
+  const handleNext = async () => {
     if (result.passed) {
       // Move to teaching phase
       navigate('/teaching');
     } else {
-      // Simplify module and go back to learning
-      toast.loading('Creating a simpler explanation...');
+      // Simplify module and go back to learning (usually pre-generated right after the quiz)
+      const toastId = toast.loading('Creating a simpler explanation...');
+      try {
+        const response = await axios.post(`${API}/module/simplify`, {
+          username,
+          course_id: course.id,
+          module_id: currentModule.id
+        });
+        const modules = course.modules.map(module => module.id === currentModule.id ? response.data : module);
+        onCourseUpdate({ ...course, modules });
+        toast.success('Here is a simpler explanation!', { id: toastId });
+      } catch (error) {
+        console.error('Simplify error:', error);
+        toast.error('Failed to simplify module', { id: toastId });
+      }
       navigate('/learn');
     }
   };
@@ -1,4 +1,4 @@
-import React, { useState } from 'react';
+import React, { useState, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { Button } from '../components/ui/button';
 import { Card } from '../components/ui/card';
@@ -15,6 +15,8 @@ const TeachingScreen = ({ username, course, onCourseUpdate }) => {
   const [explanation, setExplanation] = useState('');
   const [submitting, setSubmitting] = useState(false);
   const [feedback, setFeedback] = useState(null);
+  // When the learner started on this explanation, for time-on-task stats
+  const startedAt = useRef(Date.now());
 
   const currentIndex = course.current_module_index || 0;
   const currentModule = course.modules[currentIndex];
@@ -31,10 +33,12 @@ const TeachingScreen = ({ username, course, onCourseUpdate }) => {
         username,
         course_id: course.id,
         module_id: currentModule.id,
-        explanation: explanation.trim()
+        explanation: explanation.trim(),
+        time_spent_seconds: (Date.now() - startedAt.current) / 1000
       });
 
       setFeedback(response.data);
+      startedAt.current = Date.now();
       toast.success('Great explanation! Here\'s your feedback.');
     } catch (error) {
       console.error('Teaching submission error:', error);
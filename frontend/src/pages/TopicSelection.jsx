@@ -7,8 +7,8 @@ import { Card } from '../components/ui/card';
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '../components/ui/select';
 import { Textarea } from '../components/ui/textarea';
 import { Sparkles, BookOpen, LogOut, BarChart3 } from 'lucide-react';
-import axios from 'axios';
 import { toast } from 'sonner';
+import { readEventStream } from '../lib/sse';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
@@ -29,20 +29,49 @@ const TopicSelection = ({ username, onCourseCreated, onLogout }) => {
     setGenerating(true);
     toast.loading(`Creating your personalized ${topic} course...`, { id: 'course-gen' });
 
+    // Start learning as soon as module 1 arrives
+    let started = false;
+
     try {
-      const response = await axios.post(`${API}/course/generate`, {
-        username,
-        topic: topic.trim(),
-        skill_level: skillLevel,
-        learning_goal: learningGoal.trim() || null
+      const response = await fetch(`${API}/course/generate/stream`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          username,
+          topic: topic.trim(),
+          skill_level: skillLevel,
+          learning_goal: learningGoal.trim() || null
+        })
       });
+      if (!response.ok || !response.body) {
+        throw new Error(`Course stream failed with status ${response.status}`);
+      }
+
+      let course = null;
 
-      onCourseCreated(response.data);
-      toast.success(`Course created successfully! Let's start learning! 🎉`, { id: 'course-gen' });
-      navigate('/learn');
+      await readEventStream(response, (event, data) => {
+        if (event === 'course') {
+          course = { ...data, modules: [] };
+        } else if (event === 'module') {
+          course = { ...course, modules: [...course.modules, data.module] };
+          onCourseCreated(course);
+          if (!started) {
+            started = true;
+            toast.success(`Your first module is ready! Let's start learning! 🎉`, { id: 'course-gen' });
+            navigate('/learn');
+          }
+        } else if (event === 'error') {
+          throw new Error(data.detail);
+        }
+      });
     } catch (error) {
       console.error('Course generation error:', error);
-      toast.error('Failed to generate course. Please try again.', { id: 'course-gen' });
+      if (started) {
+        // The server keeps the modules already sent, so the course the learner is on stays valid
+        toast.warning("Some modules couldn't be generated. Your course has the ones that are ready.", { id: 'course-gen' });
+      } else {
+        toast.error('Failed to generate course. Please try again.', { id: 'course-gen' });
+      }
     } finally {
       setGenerating(false);
     }